@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the error propagation backends
+
+Usage:
+    python benchmarks/bench_propagation.py [rows]
+"""
+
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from pylab.calculation import propagate_errors
+
+FORMULA = "(omega_0**2)/sqrt((omega_0**2-omega**2)**2+4*delta**2*omega**2)"
+VARIABLES = "omega omega_0 delta"
+
+
+def resonance(omega, omega_0, delta):
+    return omega_0**2 / np.sqrt((omega_0**2 - omega**2)**2 + 4 * delta**2 * omega**2)
+
+
+def main():
+    """Time the sympy-compiled and the autodiff path on the same data."""
+    num_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    rng = np.random.default_rng(0)
+    measurements = np.column_stack([
+        rng.uniform(3000, 16000, num_rows),
+        np.full(num_rows, 9000.0),
+        np.full(num_rows, 500.0),
+    ])
+    errors = [13.0, 50.0, 10.0]
+
+    cases = {
+        "sympy (compiled)": lambda: propagate_errors(FORMULA, VARIABLES, measurements, errors),
+        "autodiff (string)": lambda: propagate_errors(FORMULA, VARIABLES, measurements, errors, backend="autodiff"),
+        "autodiff (function)": lambda: propagate_errors(resonance, VARIABLES, measurements, errors),
+    }
+
+    print(f"Error propagation of {num_rows} rows")
+    for name, case in cases.items():
+        case()  # warm up the formula cache
+        best = min(timeit.repeat(case, number=5, repeat=3)) / 5
+        print(f"{name:<22} {best * 1e3:10.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -55,7 +55,7 @@ PLOT_Y_MAX = None  # Maximum value for y-axis (None for auto)
 FIT_ENABLED = True  # Enable/disable fitting
 FIT_TYPE = "polynomial"  # "polynomial" or "custom"
 FIT_DEGREE = 1  # Degree of polynomial fit (if FIT_TYPE is "polynomial")
-FIT_FUNCTION = lambda x, a, b: a * x + b  # Custom fit function (if FIT_TYPE is "custom")
-FIT_INITIAL_GUESS = [1, 0]  # Initial guess for parameters (if FIT_TYPE is "custom")
+FIT_FUNCTION = lambda x, a, b: a * x + b  # Custom fit function or model name, e.g. "lorentzian" (if FIT_TYPE is "custom")
+FIT_INITIAL_GUESS = [1, 0]  # Initial guess for parameters (if FIT_TYPE is "custom", None for model names)
 FIT_STYLE = "b-"  # Plot style for fit line
 FIT_LABEL = "Fit Curve"  # Label for fit line
@@ -37,6 +37,24 @@ def gauss_error_propagation(f_derivatives, variables, errors):
     return np.sqrt(np.sum((f_derivatives * errors)**2))
 
 
+def gauss_error_propagation_covariance(jacobian, covariance):
+    """
+    Berechnet die Fehlerfortpflanzung mit korrelierten Eingangsgrößen (J·Σ·Jᵀ).
+    
+    Parameter:
+    - jacobian: Jacobi-Matrix der Ausgaben nach den Variablen, Form (m, n)
+      oder für viele Messungen (N, m, n).
+    - covariance: Kovarianzmatrix der Variablen, Form (n, n) für alle Messungen
+      gemeinsam oder (N, n, n) pro Messung.
+    
+    Rückgabe:
+    - Kovarianzmatrix der Ausgaben, Form (m, m) bzw. (N, m, m).
+    """
+    jacobian = np.asarray(jacobian, dtype=float)
+    covariance = np.asarray(covariance, dtype=float)
+    return jacobian @ covariance @ np.swapaxes(jacobian, -1, -2)
+
+
 def pythagorean_addition(*errors):
     """
     Führt die pythagoreische Addition mehrerer Fehler durch.
@@ -204,8 +204,9 @@ def main():
         # Add fit if enabled
         if config.FIT_ENABLED:
             if config.FIT_TYPE == "custom":
+                # FIT_FUNCTION may also name a model of pylab.models, e.g. "lorentzian"
                 fit_func = config.FIT_FUNCTION
-                initial_guess = config.FIT_INITIAL_GUESS
+                initial_guess = getattr(config, "FIT_INITIAL_GUESS", None)
                 coeffs, coeff_errors, r_squared = generate_fit_data(
                     plot_x_data, plot_y_data,
                     fit_type="custom",
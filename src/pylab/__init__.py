@@ -7,10 +7,18 @@ including data processing, error propagation, plotting, and curve fitting.
 
 # Import submodules to make them available when importing the package
 from . import utils
+from . import formula
+from . import uarray
+from . import autodiff
+from . import instruments
 from . import calculation
+from . import statistics
+from . import fitting
+from . import regression
+from . import models
 from . import output
 from . import plotting
 
 
 # Define what gets imported with 'from pylab_def import *'
-__all__ = ["utils", "calculation", "output", "plotting" ]
+__all__ = ["utils", "formula", "uarray", "autodiff", "instruments", "calculation", "statistics", "fitting", "regression", "models", "output", "plotting" ]
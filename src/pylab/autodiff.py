@@ -0,0 +1,120 @@
+import numpy as np
+
+from .uarray import _BINARY_DERIVATIVES, _UNARY_DERIVATIVES
+
+
+class Dual:
+    """
+    Vectorized forward-mode dual number carrying the derivatives with respect
+    to several inputs at once.
+
+    Any function built from arithmetic operators and NumPy ufuncs (np.sin,
+    np.exp, np.sqrt, ...) can be evaluated on Dual inputs to obtain its value
+    and gradient for all rows in one pass.
+
+    Attributes:
+        value (np.ndarray): Values with shape (rows,)
+        tangent (np.ndarray): Derivatives with shape (inputs, rows)
+    """
+
+    def __init__(self, value, tangent):
+        self.value = np.asarray(value, dtype=float)
+        self.tangent = np.asarray(tangent, dtype=float)
+
+    def __repr__(self):
+        return f"Dual(value={self.value!r}, tangent={self.tangent!r})"
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        if method != '__call__' or kwargs.get('out') is not None:
+            return NotImplemented
+        values = [x.value if isinstance(x, Dual) else np.asarray(x, dtype=float) for x in inputs]
+
+        if len(inputs) == 1 and ufunc.__name__ in _UNARY_DERIVATIVES:
+            out = ufunc(values[0], **kwargs)
+            partials = [_UNARY_DERIVATIVES[ufunc.__name__](values[0], out)]
+        elif len(inputs) == 2 and ufunc.__name__ in _BINARY_DERIVATIVES:
+            out = ufunc(values[0], values[1], **kwargs)
+            partials = [
+                d(values[0], values[1], out) if isinstance(x, Dual) else None
+                for d, x in zip(_BINARY_DERIVATIVES[ufunc.__name__], inputs)
+            ]
+        else:
+            return NotImplemented
+
+        tangent = 0.0
+        for x, partial in zip(inputs, partials):
+            if isinstance(x, Dual):
+                tangent = tangent + partial * x.tangent
+        return Dual(out, np.broadcast_to(tangent, (self.tangent.shape[0],) + np.shape(out)))
+
+    def __add__(self, other):
+        return np.add(self, other)
+
+    def __radd__(self, other):
+        return np.add(other, self)
+
+    def __sub__(self, other):
+        return np.subtract(self, other)
+
+    def __rsub__(self, other):
+        return np.subtract(other, self)
+
+    def __mul__(self, other):
+        return np.multiply(self, other)
+
+    def __rmul__(self, other):
+        return np.multiply(other, self)
+
+    def __truediv__(self, other):
+        return np.true_divide(self, other)
+
+    def __rtruediv__(self, other):
+        return np.true_divide(other, self)
+
+    def __pow__(self, other):
+        return np.power(self, other)
+
+    def __rpow__(self, other):
+        return np.power(other, self)
+
+    def __neg__(self):
+        return np.negative(self)
+
+    def __pos__(self):
+        return self
+
+    def __abs__(self):
+        return np.absolute(self)
+
+
+def value_and_gradient(func, measurements):
+    """
+    Evaluate a function and its gradient with forward-mode automatic differentiation.
+
+    Args:
+        func (function): Function taking one argument per variable, e.g.
+            lambda x, a, b: a * np.exp(-b * x)
+        measurements (array-like): Values with shape (rows, variables)
+
+    Returns:
+        tuple: Values with shape (rows,) and gradient with shape (rows, variables)
+    """
+    measurements = np.atleast_2d(np.asarray(measurements, dtype=float))
+    num_rows, num_variables = measurements.shape
+
+    # Seed every variable with a unit tangent in its own direction
+    seeds = np.eye(num_variables)[:, :, None]
+    arguments = [
+        Dual(measurements[:, i], np.broadcast_to(seeds[i], (num_variables, num_rows)))
+        for i in range(num_variables)
+    ]
+    result = func(*arguments)
+
+    if isinstance(result, Dual):
+        values = np.broadcast_to(result.value, (num_rows,))
+        gradient = np.broadcast_to(result.tangent, (num_variables, num_rows)).T
+    else:
+        # Result does not depend on any input
+        values = np.broadcast_to(np.asarray(result, dtype=float), (num_rows,))
+        gradient = np.zeros((num_rows, num_variables))
+    return np.array(values), np.array(gradient)
@@ -2,52 +2,378 @@ import numpy as np
 import sympy as sp
 from scipy.optimize import curve_fit
 
-def error_propagation(formula_str, variables_str, measurements, errors):
+from . import autodiff
+from .formula import compile_formula, compile_formulas, _parse_variables
+from .uarray import UArray
+
+def _value_and_gradient(formula_str, variables_str, measurements, backend='sympy'):
     """
-    Calculate error propagation using the Gaussian method with absolute errors.
+    Evaluate a formula and its gradient with the selected backend.
+    
+    Args:
+        formula_str (str or function): Formula string, or a Python function
+            taking one argument per variable (requires the autodiff backend)
+        variables_str (str): Variables in the formula as space-separated string
+        measurements (array-like): Measurement values with shape (rows, variables)
+        backend (str): 'sympy' for compiled symbolic derivatives or 'autodiff'
+            for forward-mode automatic differentiation
+        
+    Returns:
+        tuple: Variable names, values (rows,) and gradient (rows, variables)
+    """
+    if callable(formula_str) and backend == 'sympy':
+        backend = 'autodiff'
+    
+    if backend == 'sympy':
+        compiled = compile_formula(formula_str, variables_str)
+        values, gradient = compiled.value_and_gradient(measurements)
+        return compiled.variables, values, gradient
+    if backend == 'autodiff':
+        if callable(formula_str):
+            func = formula_str
+        else:
+            func = compile_formula(formula_str, variables_str).value_function
+        values, gradient = autodiff.value_and_gradient(func, measurements)
+        if variables_str is None:
+            variables = tuple(f'x{i}' for i in range(gradient.shape[1]))
+        else:
+            variables = _parse_variables(variables_str)
+        return variables, values, gradient
+    raise ValueError(f"Unknown differentiation backend: {backend}")
+
+def _variance_contributions(formula_str, variables_str, measurements, errors, backend='sympy'):
+    """
+    Evaluate a formula and the variance contribution of every variable.
+    
+    Returns:
+        tuple: Variable names, values (rows,) and contributions (rows, variables)
+    """
+    variables, values, gradient = _value_and_gradient(formula_str, variables_str, measurements, backend)
+    errors = np.broadcast_to(np.asarray(errors, dtype=float), gradient.shape)
+    
+    return variables, values, (gradient * errors)**2
+
+def propagate_errors(formula_str, variables_str, measurements, errors, backend='sympy'):
+    """
+    Calculate Gaussian error propagation for many measurements at once.
+
+    The formula is parsed, differentiated and compiled a single time and all
+    rows are evaluated in one vectorized call.
+
+    Args:
+        formula_str (str or function): Mathematical formula as string, or a
+            NumPy-expressible Python function taking one argument per variable
+        variables_str (str): Variables in the formula as space-separated string
+        measurements (array-like): Measurement values with shape (rows, variables)
+        errors (array-like): Absolute errors with shape (rows, variables) or (variables,)
+        backend (str): 'sympy' (default for strings) or 'autodiff' (used for functions)
+
+    Returns:
+        tuple: Arrays of calculated values and total errors
+    """
+    _, values, contributions = _variance_contributions(
+        formula_str, variables_str, measurements, errors, backend
+    )
+    total_errors = np.sqrt(np.sum(contributions, axis=1))
+
+    return values, total_errors
+
+def error_budget(formula_str, variables_str, measurements, errors, backend='sympy'):
+    """
+    Calculate error propagation together with the error budget of every row.
+    
+    The budget comes from the same vectorized pass as propagate_errors: the
+    contribution of each variable is its term (df/dx · Δx)² of the total variance.
     
     Args:
         formula_str (str): Mathematical formula as string
         variables_str (str): Variables in the formula as space-separated string
-        measurements (list): List of measurement values for variables
-        errors (list): List of absolute errors for variables
+        measurements (array-like): Measurement values with shape (rows, variables)
+        errors (array-like): Absolute errors with shape (rows, variables) or (variables,)
+        backend (str): 'sympy' or 'autodiff', see propagate_errors
         
     Returns:
-        tuple: Calculated value and total error
+        dict: 'value' and 'error' (rows,), 'contributions' and 'shares'
+            (rows, variables), 'variables' (names) and 'summary', a dict per
+            variable with its mean, median and maximum share, the number of
+            rows it dominates and its share of the summed variance
+    """
+    variables, values, contributions = _variance_contributions(
+        formula_str, variables_str, measurements, errors, backend
+    )
+    variance = np.sum(contributions, axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        shares = np.where(variance[:, None] > 0, contributions / variance[:, None], 0.0)
+    
+    dominant = np.argmax(contributions, axis=1)
+    total_variance = np.sum(variance)
+    summary = {}
+    for i, name in enumerate(variables):
+        summary[name] = {
+            'mean_share': float(np.mean(shares[:, i])),
+            'median_share': float(np.median(shares[:, i])),
+            'max_share': float(np.max(shares[:, i])),
+            'dominant_rows': int(np.sum((dominant == i) & (variance > 0))),
+            'variance_share': float(np.sum(contributions[:, i]) / total_variance) if total_variance > 0 else 0.0,
+        }
+    
+    return {
+        'value': values,
+        'error': np.sqrt(variance),
+        'variables': variables,
+        'contributions': contributions,
+        'shares': shares,
+        'summary': summary,
+    }
+
+def covariance_from_errors(errors, correlation=None):
+    """
+    Build covariance matrices from absolute errors and a correlation matrix.
+    
+    Args:
+        errors (array-like): Absolute errors with shape (rows, variables) or (variables,)
+        correlation (array-like, optional): Correlation matrix with shape
+            (variables, variables) or (rows, variables, variables); identity if None
+        
+    Returns:
+        np.ndarray: Covariance matrices with shape (rows, variables, variables)
+            or (variables, variables) for one-dimensional errors
+    """
+    errors = np.asarray(errors, dtype=float)
+    if correlation is None:
+        correlation = np.eye(errors.shape[-1])
+    correlation = np.asarray(correlation, dtype=float)
+    
+    return errors[..., :, None] * correlation * errors[..., None, :]
+
+def propagate_covariance(formulas, variables_str, measurements, covariance):
+    """
+    Propagate a full input covariance through one or more formulas.
+    
+    The output covariance of every row is J·Σ·Jᵀ, where J is the Jacobian of all
+    formulas with respect to the variables. All rows are evaluated at once.
+    
+    Args:
+        formulas (str, list or dict): Formula, list of formulas or dict of named
+            formulas over the same variables (see formula.compile_formulas)
+        variables_str (str): Variables in the formulas as space-separated string
+        measurements (array-like): Measurement values with shape (rows, variables)
+        covariance (array-like): Input covariance, either shared with shape
+            (variables, variables) or per row with shape (rows, variables, variables)
+        
+    Returns:
+        tuple: Values with shape (rows, outputs) and output covariance with
+            shape (rows, outputs, outputs)
+    """
+    if isinstance(formulas, (str, sp.Basic)):
+        formulas = [formulas]
+    
+    values, jacobian = compile_formulas(formulas, variables_str).value_and_jacobian(measurements)
+    
+    covariance = np.asarray(covariance, dtype=float)
+    num_variables = jacobian.shape[2]
+    if covariance.shape[-2:] != (num_variables, num_variables):
+        raise ValueError(
+            f"Covariance must have shape ({num_variables}, {num_variables}) "
+            f"or (rows, {num_variables}, {num_variables}), got {covariance.shape}"
+        )
+    
+    output_covariance = jacobian @ covariance @ np.swapaxes(jacobian, 1, 2)
+    
+    return values, output_covariance
+
+def propagate_formulas(formulas, variables_str, measurements, errors, correlation=None):
+    """
+    Evaluate several named formulas over one dataset in a single compiled pass.
+    
+    Formulas may reference each other by name, e.g. a fill factor computed
+    from 'P_max'. Errors and the cross-covariances between all outputs are
+    propagated from the inputs.
+    
+    Args:
+        formulas (dict): Mapping of output name to formula string
+        variables_str (str): Variables in the formulas as space-separated string
+        measurements (array-like): Measurement values with shape (rows, variables)
+        errors (array-like): Absolute errors with shape (rows, variables) or (variables,)
+        correlation (array-like, optional): Correlation matrix of the variables
+        
+    Returns:
+        dict: 'names', 'values' and 'errors' with shape (rows, outputs),
+            'covariance' with shape (rows, outputs, outputs) and 'results',
+            a dict of (values, errors) per output name
+    """
+    compiled = compile_formulas(formulas, variables_str)
+    values, jacobian = compiled.value_and_jacobian(measurements)
+    errors = np.broadcast_to(np.asarray(errors, dtype=float), (values.shape[0], jacobian.shape[2]))
+    covariance = covariance_from_errors(errors, correlation)
+    
+    output_covariance = jacobian @ covariance @ np.swapaxes(jacobian, 1, 2)
+    output_errors = np.sqrt(np.diagonal(output_covariance, axis1=1, axis2=2))
+    
+    return {
+        'names': compiled.names,
+        'values': values,
+        'errors': output_errors,
+        'covariance': output_covariance,
+        'results': {
+            name: (values[:, i], output_errors[:, i]) for i, name in enumerate(compiled.names)
+        },
+    }
+
+def monte_carlo_propagation(formula_str, variables_str, measurements, errors, num_samples=100000,
+                            percentiles=(2.5, 50, 97.5), correlation=None, seed=None,
+                            max_chunk_size=2**22):
+    """
+    Propagate errors by Monte Carlo sampling of normally distributed inputs.
+    
+    Samples for all rows are drawn as one array and evaluated with the compiled
+    formula. The work is split into chunks of at most max_chunk_size evaluations,
+    so memory stays bounded for any number of samples and rows. Mean and standard
+    deviation are merged exactly across chunks; if the samples of a single row
+    need several chunks, the percentiles are the sample-weighted average of the
+    per-chunk percentiles.
+    
+    Args:
+        formula_str (str): Mathematical formula as string
+        variables_str (str): Variables in the formula as space-separated string
+        measurements (array-like): Measurement values with shape (rows, variables)
+        errors (array-like): Absolute errors with shape (rows, variables) or (variables,)
+        num_samples (int): Number of samples per row
+        percentiles (tuple): Percentiles to report, in percent
+        correlation (array-like, optional): Correlation matrix of the variables
+        seed (int, optional): Seed for the random number generator
+        max_chunk_size (int): Maximum number of formula evaluations per chunk
+        
+    Returns:
+        dict: Arrays 'value' (formula at the measured values), 'mean', 'std'
+            with shape (rows,) and 'percentiles' with shape (rows, len(percentiles))
+    """
+    compiled = compile_formula(formula_str, variables_str)
+    measurements = np.atleast_2d(np.asarray(measurements, dtype=float))
+    num_rows, num_variables = measurements.shape
+    errors = np.broadcast_to(np.asarray(errors, dtype=float), measurements.shape)
+    rng = np.random.default_rng(seed)
+    cholesky = np.linalg.cholesky(np.asarray(correlation, dtype=float)) if correlation is not None else None
+    
+    mean = np.empty(num_rows)
+    std = np.empty(num_rows)
+    result_percentiles = np.empty((num_rows, len(percentiles)))
+    
+    sample_chunk = max(1, min(num_samples, max_chunk_size))
+    row_chunk = max(1, max_chunk_size // sample_chunk)
+    
+    with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+        for start in range(0, num_rows, row_chunk):
+            rows = slice(start, start + row_chunk)
+            center = measurements[rows]
+            sigma = errors[rows]
+            
+            count = 0
+            chunk_mean = np.zeros(center.shape[0])
+            chunk_m2 = np.zeros(center.shape[0])
+            percentile_sum = np.zeros((len(percentiles), center.shape[0]))
+            for sample_start in range(0, num_samples, sample_chunk):
+                n = min(sample_chunk, num_samples - sample_start)
+                noise = rng.standard_normal((n,) + center.shape)
+                if cholesky is not None:
+                    noise = noise @ cholesky.T
+                values = compiled.evaluate(center + noise * sigma)
+                
+                # Merge running moments (Chan et al.)
+                batch_mean = values.mean(axis=0)
+                batch_m2 = ((values - batch_mean)**2).sum(axis=0)
+                delta = batch_mean - chunk_mean
+                total = count + n
+                chunk_mean = chunk_mean + delta * n / total
+                chunk_m2 = chunk_m2 + batch_m2 + delta**2 * count * n / total
+                count = total
+                
+                percentile_sum += n * np.percentile(values, percentiles, axis=0)
+            
+            mean[rows] = chunk_mean
+            std[rows] = np.sqrt(chunk_m2 / max(count - 1, 1))
+            result_percentiles[rows] = (percentile_sum / count).T
+    
+    return {
+        'value': compiled.evaluate(measurements),
+        'mean': mean,
+        'std': std,
+        'percentiles': result_percentiles,
+    }
+
+def second_order_propagation(formula_str, variables_str, measurements, errors, correlation=None):
     """
-    # Create symbols
-    variables = sp.symbols(variables_str)
-    formula = sp.sympify(formula_str)
+    Propagate errors with a second-order Taylor expansion of the formula.
     
-    # Calculate partial derivatives
-    derivatives = [formula.diff(var) for var in variables]
+    The compiled Hessian H adds the bias ½·tr(HΣ) to the expected value and
+    the variance ½·tr(HΣHΣ) to the first-order variance gΣgᵀ. Both terms are
+    reported separately to show where first-order propagation is inadequate.
     
-    # Substitute values
-    values_dict = dict(zip(variables, measurements))
-    formula_value = float(formula.evalf(subs=values_dict))
+    Args:
+        formula_str (str): Mathematical formula as string
+        variables_str (str): Variables in the formula as space-separated string
+        measurements (array-like): Measurement values with shape (rows, variables)
+        errors (array-like): Absolute errors with shape (rows, variables) or (variables,)
+        correlation (array-like, optional): Correlation matrix of the variables
+        
+    Returns:
+        dict: Arrays with shape (rows,): 'value', 'bias', 'mean' (value + bias),
+            'first_order_error', 'second_order_variance' and 'error' (total)
+    """
+    compiled = compile_formula(formula_str, variables_str, hessian=True)
+    values, gradient, hessian = compiled.value_gradient_hessian(measurements)
+    errors = np.broadcast_to(np.asarray(errors, dtype=float), gradient.shape)
+    covariance = covariance_from_errors(errors, correlation)
     
-    # Calculate error propagation
-    squared_error = 0
-    for dfdx, delta in zip(derivatives, errors):
-        dfdx_value = float(dfdx.evalf(subs=values_dict))
-        squared_error += (dfdx_value * delta)**2
+    first_order_variance = np.einsum('ri,rij,rj->r', gradient, covariance, gradient)
+    weighted_hessian = hessian @ covariance
+    bias = 0.5 * np.trace(weighted_hessian, axis1=1, axis2=2)
+    second_order_variance = 0.5 * np.einsum('rij,rji->r', weighted_hessian, weighted_hessian)
     
-    total_error = np.sqrt(squared_error)
+    return {
+        'value': values,
+        'bias': bias,
+        'mean': values + bias,
+        'first_order_error': np.sqrt(first_order_variance),
+        'second_order_variance': second_order_variance,
+        'error': np.sqrt(first_order_variance + second_order_variance),
+    }
+
+def error_propagation(formula_str, variables_str, measurements, errors, backend='sympy'):
+    """
+    Calculate error propagation using the Gaussian method with absolute errors.
+    
+    Args:
+        formula_str (str): Mathematical formula as string
+        variables_str (str): Variables in the formula as space-separated string
+        measurements (list): List of measurement values for variables
+        errors (list): List of absolute errors for variables
+        backend (str): 'sympy' or 'autodiff', see propagate_errors
+        
+    Returns:
+        tuple: Calculated value and total error
+    """
+    values, total_errors = propagate_errors(formula_str, variables_str, [measurements], [errors], backend)
     
-    return formula_value, total_error
+    return float(values[0]), float(total_errors[0])
 
-def calculate_weighted_mean(values, errors):
+def calculate_weighted_mean(values, errors=None):
     """
     Calculate weighted mean and its error based on individual measurement errors.
     
     Args:
-        values (list or np.ndarray): List of values
-        errors (list or np.ndarray): List of errors
+        values (list, np.ndarray or UArray): List of values
+        errors (list or np.ndarray, optional): List of errors, taken from
+            values.sigma if values is a UArray
         
     Returns:
         tuple: Weighted mean and its error
     """
-    weights = 1 / np.array(errors)**2
+    if isinstance(values, UArray):
+        if errors is None:
+            errors = values.sigma
+        values = values.value
+    weights = 1 / np.asarray(errors, dtype=float)**2
     weighted_sum = np.sum(weights * values)
     sum_of_weights = np.sum(weights)
     weighted_mean = weighted_sum / sum_of_weights
@@ -55,7 +381,8 @@ def calculate_weighted_mean(values, errors):
     
     return weighted_mean, weighted_mean_error
 
-def calculate_results_with_errors(num_measurements, scaling_factor, formula, variables, measurements, errors):
+def calculate_results_with_errors(num_measurements, scaling_factor, formula, variables, measurements, errors,
+                                  method='gauss', **options):
     """
     Calculate results and errors for multiple measurements.
     
@@ -66,25 +393,27 @@ def calculate_results_with_errors(num_measurements, scaling_factor, formula, var
         variables (str): Variables as space-separated string
         measurements (list): List of measurements
         errors (list): List of errors
+        method (str): 'gauss' for linear error propagation, 'second_order' for
+            the bias-corrected second-order result or 'monte_carlo' for the
+            sample mean and standard deviation
+        **options: Additional arguments for the selected method
         
     Returns:
-        tuple: Lists of calculated results and errors
+        tuple: Arrays of calculated results and errors
     """
-    results = []
-    calc_errors = []
+    measurements = measurements[:num_measurements]
+    errors = errors[:num_measurements]
     
-    for i in range(num_measurements):
-        # Calculate result and error
-        result, error = error_propagation(formula, variables, measurements[i], errors[i])
-        
-        # Scale result
-        scaled_result = result * scaling_factor
-        scaled_error = error * scaling_factor
-        
-        # Add to lists
-        results.append(scaled_result)
-        calc_errors.append(scaled_error)
-        
-    return results, calc_errors
-
-
+    if method == 'gauss':
+        results, calc_errors = propagate_errors(formula, variables, measurements, errors, **options)
+    elif method == 'second_order':
+        summary = second_order_propagation(formula, variables, measurements, errors, **options)
+        results, calc_errors = summary['mean'], summary['error']
+    elif method == 'monte_carlo':
+        summary = monte_carlo_propagation(formula, variables, measurements, errors, **options)
+        results, calc_errors = summary['mean'], summary['std']
+    else:
+        raise ValueError(f"Unknown error propagation method: {method}")
+    
+    # Scale results
+    return results * scaling_factor, calc_errors * scaling_factor
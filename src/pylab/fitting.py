@@ -0,0 +1,1257 @@
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import re
+import threading
+import types
+import warnings
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from math import comb
+
+import numpy as np
+import sympy as sp
+from scipy.optimize import OptimizeWarning, curve_fit, least_squares
+from scipy.sparse import csr_matrix
+from scipy.special import erfinv
+from scipy.stats import qmc
+
+from .formula import _parse_variables, compile_formula
+
+_FIT_CACHE_VERSION = 2
+_fit_cache_lock = threading.RLock()
+_fit_memory_cache = OrderedDict()
+_fit_cache_settings = {'maxsize': 128, 'directory': None, 'max_files': 1000}
+_fit_implementation_digest = None
+_fit_cache_stats = {'hits': 0, 'disk_hits': 0, 'misses': 0}
+
+# NumPy and math names of lambda strings whose SymPy name differs
+_NUMPY_FUNCTIONS = {
+    'arcsin': sp.asin, 'arccos': sp.acos, 'arctan': sp.atan, 'arctan2': sp.atan2,
+    'arcsinh': sp.asinh, 'arccosh': sp.acosh, 'arctanh': sp.atanh,
+    'abs': sp.Abs, 'absolute': sp.Abs, 'fabs': sp.Abs,
+    'log10': lambda value: sp.log(value, 10), 'log2': lambda value: sp.log(value, 2),
+    'log1p': lambda value: sp.log(1 + value), 'expm1': lambda value: sp.exp(value) - 1,
+    'square': lambda value: value**2, 'power': sp.Pow, 'e': sp.E,
+}
+
+
+class FitModel:
+    """
+    Fit model declared as a formula string, compiled once into vectorized
+    value and analytic Jacobian kernels.
+
+    Instances are callable like the usual curve_fit models, f(x, *params),
+    and provide the Jacobian with respect to the parameters for the jac
+    argument of curve_fit.
+
+    Attributes:
+        model_str (str): The model as given
+        variable (str): Name of the independent variable
+        parameters (tuple): Parameter names in argument order
+        compiled (CompiledFormula): Compiled value and gradient kernels
+    """
+
+    def __init__(self, model_str, variables_str=None):
+        """
+        Args:
+            model_str (str): Either a lambda string such as
+                "lambda x, a, b: a * x + b" or a plain expression
+            variables_str (str or list, optional): Independent variable followed
+                by the parameters, required for plain expressions
+        """
+        self.model_str = str(model_str)
+        expression = self.model_str.strip()
+        if expression.startswith('lambda'):
+            arguments, _, expression = expression[len('lambda'):].partition(':')
+            if variables_str is None:
+                variables_str = arguments.replace(',', ' ')
+        if variables_str is None:
+            raise ValueError("Plain model expressions need the variables, e.g. 'x a b'")
+        variables = _parse_variables(variables_str)
+        if len(variables) < 2:
+            raise ValueError("A fit model needs an independent variable and at least one parameter")
+
+        self.variable = variables[0]
+        self.parameters = variables[1:]
+        # Lambda strings written for eval use np.exp, math.sqrt, ...
+        expression = re.sub(r'\b(?:np|numpy|math)\.', '', expression).strip()
+        local_names = dict(_NUMPY_FUNCTIONS)
+        local_names.update({name: sp.Symbol(name, real=True) for name in variables})
+        try:
+            expression = sp.sympify(expression, locals=local_names)
+        except (sp.SympifyError, SyntaxError, TypeError) as e:
+            raise ValueError(f"Cannot parse model '{self.model_str}': {e}") from e
+        unknown = {str(symbol) for symbol in expression.free_symbols} - set(variables)
+        if unknown:
+            raise ValueError(
+                f"Model '{self.model_str}' uses undeclared symbols: {', '.join(sorted(unknown))}"
+            )
+        functions = {type(function).__name__ for function in expression.atoms(sp.core.function.AppliedUndef)}
+        if functions:
+            raise ValueError(
+                f"Model '{self.model_str}' uses unknown functions: {', '.join(sorted(functions))}"
+            )
+        self.compiled = compile_formula(expression, variables, real=True)
+
+    def __repr__(self):
+        return f"FitModel({self.model_str!r})"
+
+    def __reduce__(self):
+        # Kernels are generated code; worker processes recompile from the string
+        return (FitModel, (self.model_str, (self.variable,) + self.parameters))
+
+    def _outputs(self, x_data, params):
+        if len(params) != len(self.parameters):
+            raise ValueError(f"Expected {len(self.parameters)} parameters ({' '.join(self.parameters)}), "
+                             f"got {len(params)}")
+        x_data = np.asarray(x_data, dtype=float)
+        outputs = self.compiled.value_and_gradient_function(x_data, *params)
+        # Constant entries come back as scalars and must be broadcast
+        return [np.broadcast_to(np.asarray(out, dtype=float), x_data.shape) for out in outputs]
+
+    def __call__(self, x_data, *params):
+        return np.array(self._outputs(x_data, params)[0])
+
+    def jacobian(self, x_data, *params):
+        """
+        Partial derivatives with respect to the parameters.
+
+        Returns:
+            np.ndarray: Jacobian with shape (len(x_data), parameters)
+        """
+        return np.stack(self._outputs(x_data, params)[2:], axis=-1)
+
+    def derivative(self, x_data, *params):
+        """
+        Derivative with respect to the independent variable.
+
+        Returns:
+            np.ndarray: Slope of the model at x_data
+        """
+        return np.array(self._outputs(x_data, params)[1])
+
+
+def compile_model(model, variables_str=None):
+    """
+    Compile a fit model string, passing existing models and callables through.
+
+    A bare name such as 'lorentzian' refers to a model of the pylab.models
+    registry.
+
+    Args:
+        model (str, FitModel or function): Model to compile
+        variables_str (str or list, optional): Independent variable followed by
+            the parameters, for plain expressions
+
+    Returns:
+        FitModel, Model or function: Model usable with curve_fit
+    """
+    if isinstance(model, str) and variables_str is None and model.strip().isidentifier():
+        # The model library builds on this module, so import it on demand
+        from .models import get_model
+        return get_model(model.strip())
+    if isinstance(model, str):
+        return FitModel(model, variables_str)
+    return model
+
+def _curve_fit(func, x_data, y_data, p0=None, sigma=None, absolute_sigma=False):
+    """curve_fit with the analytic Jacobian and the parameter bounds of compiled and library models."""
+    if hasattr(func, 'jacobian'):
+        if p0 is None:
+            if hasattr(func, 'initial_guess'):
+                p0 = func.initial_guess(x_data, y_data)
+            else:
+                p0 = np.ones(len(func.parameters))
+        options = {'jac': func.jacobian}
+        bounds = np.array(getattr(func, 'bounds', [(-np.inf, np.inf)]), dtype=float)
+        if np.any(np.isfinite(bounds)):
+            # Physical limits, e.g. a damping that only enters squared must stay positive
+            options['bounds'] = (bounds[:, 0], bounds[:, 1])
+            p0 = np.clip(np.asarray(p0, dtype=float), bounds[:, 0], bounds[:, 1])
+        return curve_fit(func, x_data, y_data, p0=p0, sigma=sigma,
+                         absolute_sigma=absolute_sigma, **options)
+    return curve_fit(func, x_data, y_data, p0=p0, sigma=sigma, absolute_sigma=absolute_sigma)
+
+
+def _r_squared(y_data, residuals):
+    """
+    Calculate the coefficient of determination.
+
+    Args:
+        y_data (np.ndarray): Fitted data
+        residuals (np.ndarray): Residuals of the fit
+
+    Returns:
+        float: R²
+    """
+    ss_res = np.sum(residuals**2)
+    ss_tot = np.sum((y_data - np.mean(y_data))**2)
+    return 1 - (ss_res / ss_tot)
+
+def _weighted_polyfit(x_data, y_data, degree, sigma, absolute_sigma):
+    """
+    Weighted polynomial least squares, coefficients in np.polyfit order.
+
+    Returns:
+        tuple: Coefficients and covariance matrix
+    """
+    vandermonde = np.vander(x_data, degree + 1)
+    weights = 1 / sigma
+    coefficients, _, _, _ = np.linalg.lstsq(vandermonde * weights[:, None], y_data * weights, rcond=None)
+    cov_matrix = np.linalg.inv((vandermonde * weights[:, None]**2).T @ vandermonde)
+    if not absolute_sigma:
+        dof = max(len(x_data) - degree - 1, 1)
+        chi_squared = np.sum(((y_data - vandermonde @ coefficients) * weights)**2)
+        cov_matrix = cov_matrix * chi_squared / dof
+    return coefficients, cov_matrix
+
+def _model_slope(func, x_data, coefficients, x_errors):
+    """Derivative of a custom model with respect to x, by central differences for callables."""
+    if hasattr(func, 'derivative'):
+        return func.derivative(x_data, *coefficients)
+    step = np.sqrt(np.finfo(float).eps) * np.maximum(np.abs(x_data), np.maximum(x_errors, 1e-12))
+    return (func(x_data + step, *coefficients) - func(x_data - step, *coefficients)) / (2 * step)
+
+def fit_with_x_errors(x_data, y_data, x_errors, y_errors=None, fit_type='polynomial', degree=1,
+                      custom_fit_func=None, initial_guess=None, max_iterations=20, tolerance=1e-10,
+                      absolute_sigma=True):
+    """
+    Errors-in-variables fit using the effective variance method.
+
+    The x errors are projected onto the y axis with the local slope of the
+    model, σ_eff² = σ_y² + (f'(x) · σ_x)², and the weighted fit is repeated
+    with the effective errors until the coefficients converge. The result is
+    a good approximation of orthogonal distance regression for errors that
+    are small compared to the curvature of the model.
+
+    Args:
+        x_data (np.ndarray): X-axis data
+        y_data (np.ndarray): Y-axis data
+        x_errors (np.ndarray): X-axis errors
+        y_errors (np.ndarray, optional): Y-axis errors
+        fit_type (str): 'linear', 'polynomial', or 'custom'
+        degree (int): Degree of polynomial fit
+        custom_fit_func (function or str, optional): Custom fit function f(x, *params)
+            or a model string for compile_model
+        initial_guess (list, optional): Initial guess for the custom fit
+        max_iterations (int): Maximum number of effective variance iterations
+        tolerance (float): Convergence tolerance relative to the coefficient errors
+        absolute_sigma (bool): Use the errors as absolute uncertainties for the
+            covariance; otherwise it is scaled with the reduced χ²
+
+    Returns:
+        dict: 'coefficients', 'cov_matrix', 'coeff_errors', 'r_squared',
+            'chi_squared', 'reduced_chi_squared', 'effective_errors' and 'iterations'
+    """
+    x_data = np.asarray(x_data, dtype=float)
+    y_data = np.asarray(y_data, dtype=float)
+    x_errors = np.broadcast_to(np.asarray(x_errors, dtype=float), x_data.shape)
+    y_errors = np.zeros_like(y_data) if y_errors is None else \
+        np.broadcast_to(np.asarray(y_errors, dtype=float), y_data.shape)
+    custom = fit_type == 'custom' and custom_fit_func is not None
+    if custom:
+        custom_fit_func = compile_model(custom_fit_func)
+
+    # Start with the y errors only (or the x errors alone if there are none)
+    sigma = np.where(y_errors > 0, y_errors, np.max(x_errors) if np.any(y_errors > 0) else 1.0)
+    coefficients = None
+    for iteration in range(1, max_iterations + 1):
+        if custom:
+            new_coefficients, cov_matrix = _curve_fit(
+                custom_fit_func, x_data, y_data, p0=initial_guess if coefficients is None else coefficients,
+                sigma=sigma, absolute_sigma=absolute_sigma
+            )
+            slope = _model_slope(custom_fit_func, x_data, new_coefficients, x_errors)
+        else:
+            new_coefficients, cov_matrix = _weighted_polyfit(x_data, y_data, degree, sigma, absolute_sigma)
+            slope = np.polyval(np.polyder(new_coefficients), x_data)
+
+        sigma = np.sqrt(y_errors**2 + (slope * x_errors)**2)
+        if np.any(sigma <= 0):
+            raise ValueError("Effective errors must be positive; provide non-zero x or y errors")
+
+        converged = coefficients is not None and np.all(
+            np.abs(new_coefficients - coefficients) <= tolerance * np.sqrt(np.diag(cov_matrix)) + 1e-300
+        )
+        coefficients = new_coefficients
+        if converged:
+            break
+
+    # Final fit with the converged effective errors
+    if custom:
+        coefficients, cov_matrix = _curve_fit(
+            custom_fit_func, x_data, y_data, p0=coefficients, sigma=sigma, absolute_sigma=absolute_sigma
+        )
+        residuals = y_data - custom_fit_func(x_data, *coefficients)
+    else:
+        coefficients, cov_matrix = _weighted_polyfit(x_data, y_data, degree, sigma, absolute_sigma)
+        residuals = y_data - np.polyval(coefficients, x_data)
+
+    chi_squared = np.sum((residuals / sigma)**2)
+    dof = max(len(x_data) - len(coefficients), 1)
+    return {
+        'coefficients': coefficients,
+        'cov_matrix': cov_matrix,
+        'coeff_errors': np.sqrt(np.diag(cov_matrix)),
+        'r_squared': _r_squared(y_data, residuals),
+        'chi_squared': chi_squared,
+        'reduced_chi_squared': chi_squared / dof,
+        'effective_errors': sigma,
+        'iterations': iteration,
+    }
+
+def _batch_segments(x_data, y_data, y_errors, ranges):
+    """Split the input of fit_batch into a list of (x, y, errors) segments."""
+    if ranges is not None:
+        x_data = np.asarray(x_data, dtype=float)
+        y_data = np.asarray(y_data, dtype=float)
+        if y_errors is not None:
+            y_errors = np.broadcast_to(np.asarray(y_errors, dtype=float), y_data.shape)
+        return [
+            (x_data[start:end], y_data[start:end], None if y_errors is None else y_errors[start:end])
+            for start, end in ranges
+        ]
+    if np.ndim(x_data[0]) == 0:
+        x_data, y_data, y_errors = [x_data], [y_data], None if y_errors is None else [y_errors]
+    if y_errors is None:
+        y_errors = [None] * len(x_data)
+    return [
+        (np.asarray(x, dtype=float), np.asarray(y, dtype=float),
+         None if e is None else np.broadcast_to(np.asarray(e, dtype=float), np.shape(y)))
+        for x, y, e in zip(x_data, y_data, y_errors)
+    ]
+
+def _unstandardise(coefficients_t, cov_t, center, scale):
+    """
+    Convert polynomial fits in t = (x - center) / scale to np.polyfit coefficients in x.
+
+    Args:
+        coefficients_t (np.ndarray): Ascending coefficients in t with shape (K, params)
+        cov_t (np.ndarray): Their covariance with shape (K, params, params)
+        center, scale (np.ndarray): Standardisation of every fit, scalars or shape (K,)
+
+    Returns:
+        tuple: Coefficients (highest power first) and covariance
+    """
+    num_fits, num_params = coefficients_t.shape
+    center = np.broadcast_to(center, (num_fits,))
+    scale = np.broadcast_to(scale, (num_fits,))
+    # c_k = Σ_j q_j · C(j, k) · (-center)^(j-k) / scale^j, ascending powers
+    transform = np.zeros((num_fits, num_params, num_params))
+    for j in range(num_params):
+        for k in range(j + 1):
+            transform[:, k, j] = comb(j, k) * (-center)**(j - k) / scale**j
+    # np.polyfit order: highest power first
+    transform = transform[:, ::-1, :]
+    coefficients = np.einsum('skj,sj->sk', transform, coefficients_t)
+    cov_matrix = transform @ cov_t @ transform.transpose(0, 2, 1)
+    return coefficients, cov_matrix
+
+def _batch_polyfit(segments, degree, absolute_sigma):
+    """
+    Fit a polynomial to every segment by solving all normal equations at once.
+
+    The moments Σw t^k and Σw y t^k of every segment are reduced with
+    np.bincount on the concatenated data, where t = (x - mean) / scale is the
+    standardised x of the segment. The (K, d+1, d+1) systems are solved in one
+    call and the coefficients transformed back to powers of x.
+    """
+    num_segments = len(segments)
+    num_params = degree + 1
+    lengths = np.array([len(x) for x, _, _ in segments])
+    index = np.repeat(np.arange(num_segments), lengths)
+    x_all = np.concatenate([x for x, _, _ in segments])
+    y_all = np.concatenate([y for _, y, _ in segments])
+    w_all = np.concatenate([
+        np.ones(len(y)) if e is None else 1 / e**2 for _, y, e in segments
+    ])
+
+    # Standardise x per segment to keep the normal equations well conditioned
+    center = np.bincount(index, x_all, num_segments) / lengths
+    scale = np.sqrt(np.bincount(index, (x_all - center[index])**2, num_segments) / lengths)
+    scale = np.where(scale > 0, scale, 1.0)
+    t_all = (x_all - center[index]) / scale[index]
+
+    powers = t_all[:, None] ** np.arange(2 * degree + 1)
+    moments = np.stack([np.bincount(index, w_all * p, num_segments) for p in powers.T], axis=1)
+    rhs = np.stack([np.bincount(index, w_all * y_all * p, num_segments) for p in powers[:, :num_params].T],
+                   axis=1)
+    exponents = np.add.outer(np.arange(num_params), np.arange(num_params))
+    normal = moments[:, exponents]
+    coefficients_t = np.linalg.solve(normal, rhs[:, :, None])[:, :, 0]
+    cov_t = np.linalg.inv(normal)
+
+    fitted = np.sum(powers[:, :num_params] * coefficients_t[index], axis=1)
+    residuals = y_all - fitted
+    chi_squared = np.bincount(index, w_all * residuals**2, num_segments)
+    ss_res = np.bincount(index, residuals**2, num_segments)
+    mean_y = np.bincount(index, y_all, num_segments) / lengths
+    ss_tot = np.bincount(index, (y_all - mean_y[index])**2, num_segments)
+    dof = np.maximum(lengths - num_params, 1)
+    if not absolute_sigma:
+        cov_t = cov_t * (chi_squared / dof)[:, None, None]
+
+    coefficients, cov_matrix = _unstandardise(coefficients_t, cov_t, center, scale)
+
+    return {
+        'coefficients': coefficients,
+        'cov_matrix': cov_matrix,
+        'coeff_errors': np.sqrt(np.diagonal(cov_matrix, axis1=1, axis2=2)),
+        'r_squared': 1 - ss_res / ss_tot,
+        'chi_squared': chi_squared,
+        'reduced_chi_squared': chi_squared / dof,
+        'count': lengths,
+        'success': np.ones(num_segments, dtype=bool),
+    }
+
+def _fit_segment(arguments):
+    """Fit one segment with curve_fit; module level so it can run in a worker process."""
+    func, x_data, y_data, y_errors, initial_guess, absolute_sigma = arguments
+    try:
+        coefficients, cov_matrix = _curve_fit(func, x_data, y_data, p0=initial_guess,
+                                              sigma=y_errors, absolute_sigma=absolute_sigma)
+    except (RuntimeError, ValueError):
+        return None
+    residuals = y_data - func(x_data, *coefficients)
+    weights = 1 if y_errors is None else 1 / y_errors**2
+    return coefficients, cov_matrix, _r_squared(y_data, residuals), np.sum(weights * residuals**2)
+
+def _picklable(func):
+    """Whether a model can be sent to worker processes (lambdas and local functions cannot)."""
+    try:
+        pickle.dumps(func)
+    except (pickle.PicklingError, AttributeError, TypeError):
+        return False
+    return True
+
+def _run_fits(worker, tasks, func, processes):
+    """Run fit tasks in a process pool if requested and the model can be sent to workers, else here."""
+    if processes is not None and processes > 1 and len(tasks) > 1 and _picklable(func):
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            # Several fits per task keep the inter-process overhead small
+            chunksize = max(1, len(tasks) // (4 * processes))
+            return list(executor.map(worker, tasks, chunksize=chunksize))
+    return [worker(task) for task in tasks]
+
+def _batch_curve_fit(segments, func, initial_guess, absolute_sigma, processes):
+    """Fit a nonlinear model to every segment, in a process pool if possible."""
+    tasks = [(func, x, y, e, initial_guess, absolute_sigma) for x, y, e in segments]
+    results = _run_fits(_fit_segment, tasks, func, processes)
+
+    num_params = next((len(result[0]) for result in results if result is not None), None)
+    if num_params is None:
+        raise RuntimeError("The fit failed for all datasets")
+    num_segments = len(segments)
+    coefficients = np.full((num_segments, num_params), np.nan)
+    cov_matrix = np.full((num_segments, num_params, num_params), np.nan)
+    r_squared = np.full(num_segments, np.nan)
+    chi_squared = np.full(num_segments, np.nan)
+    for i, result in enumerate(results):
+        if result is not None:
+            coefficients[i], cov_matrix[i], r_squared[i], chi_squared[i] = result
+
+    lengths = np.array([len(x) for x, _, _ in segments])
+    return {
+        'coefficients': coefficients,
+        'cov_matrix': cov_matrix,
+        'coeff_errors': np.sqrt(np.diagonal(cov_matrix, axis1=1, axis2=2)),
+        'r_squared': r_squared,
+        'chi_squared': chi_squared,
+        'reduced_chi_squared': chi_squared / np.maximum(lengths - num_params, 1),
+        'count': lengths,
+        'success': np.array([result is not None for result in results]),
+    }
+
+def fit_batch(x_data, y_data, y_errors=None, ranges=None, fit_type='linear', degree=1,
+              custom_fit_func=None, initial_guess=None, absolute_sigma=False, processes=None):
+    """
+    Fit the same model to many datasets or index ranges in one call.
+
+    Polynomial (including linear) fits of all datasets are solved together
+    with stacked normal equations. Custom models are fitted with curve_fit,
+    optionally distributed over a process pool; models that cannot be sent to
+    worker processes (lambdas, local functions) are fitted in this process.
+    Model strings (see compile_model) work with the pool.
+
+    Args:
+        x_data (array-like or list): X data of one dataset, or a list of K arrays
+        y_data (array-like or list): Y data matching x_data
+        y_errors (array-like or list, optional): Y errors matching y_data
+        ranges (list, optional): (start_idx, end_idx) tuples; if given, x_data
+            and y_data are one dataset and every range is fitted
+        fit_type (str): 'linear', 'polynomial', or 'custom'
+        degree (int): Degree of polynomial fit
+        custom_fit_func (function or str, optional): Custom fit function or model string
+        initial_guess (list, optional): Initial guess used for every dataset
+        absolute_sigma (bool): Use the errors as absolute uncertainties; otherwise
+            the covariance is scaled with the reduced χ² like np.polyfit
+        processes (int, optional): Number of worker processes for custom models,
+            e.g. os.cpu_count(); by default all fits run in this process. Pools
+            only pay off for many or slow fits, and scripts using them need an
+            if __name__ == '__main__' guard on systems that spawn workers
+            (Windows, macOS)
+
+    Returns:
+        dict: Arrays with one entry per dataset: 'coefficients' (K, params),
+            'cov_matrix' (K, params, params), 'coeff_errors', 'r_squared',
+            'chi_squared', 'reduced_chi_squared', 'count' and 'success'
+    """
+    segments = _batch_segments(x_data, y_data, y_errors, ranges)
+    if fit_type == 'custom' and custom_fit_func is not None:
+        return _batch_curve_fit(segments, compile_model(custom_fit_func), initial_guess,
+                                absolute_sigma, processes)
+    return _batch_polyfit(segments, degree, absolute_sigma)
+
+def _parameter_names(func):
+    """Parameter names of a model, all arguments after the independent variable."""
+    if hasattr(func, 'parameters'):
+        return func.parameters
+    return tuple(inspect.signature(func).parameters)[1:]
+
+def _model_jacobian(func, x_data, params):
+    """Jacobian of a model with respect to its parameters, by forward differences for callables."""
+    if hasattr(func, 'jacobian'):
+        return func.jacobian(x_data, *params)
+    params = np.asarray(params, dtype=float)
+    value = func(x_data, *params)
+    columns = []
+    for i in range(len(params)):
+        step = np.sqrt(np.finfo(float).eps) * max(abs(params[i]), 1.0)
+        shifted = params.copy()
+        shifted[i] += step
+        columns.append((func(x_data, *shifted) - value) / step)
+    return np.stack(columns, axis=-1)
+
+def fit_global(x_data, y_data, model, y_errors=None, shared=(), initial_guess=None,
+               absolute_sigma=False, **options):
+    """
+    Fit one model to several datasets with shared and per-dataset parameters.
+
+    Shared parameters take the same value in all datasets, the others are
+    fitted separately for every dataset, all in one least-squares problem.
+    Every dataset only depends on the shared parameters and its own block,
+    so the Jacobian is passed to the solver as a sparse matrix and the fit
+    scales to many datasets.
+
+    Args:
+        x_data (list): X data, one array per dataset
+        y_data (list): Y data, one array per dataset
+        model (function, FitModel or str): Model f(x, *params) or model string
+        y_errors (list, optional): Y errors, one array per dataset
+        shared (list): Names of the parameters shared by all datasets
+        initial_guess (list, optional): Start value per parameter, a scalar or
+            one value per dataset for local parameters; defaults to the guesses
+            of library models and to ones otherwise
+        absolute_sigma (bool): Use the errors as absolute uncertainties; otherwise
+            the covariance is scaled with the reduced χ²
+        **options: Additional arguments for scipy.optimize.least_squares
+
+    Returns:
+        dict: 'names' and 'parameters' of the joint parameter vector (shared
+            first, then e.g. 'f0[2]' for dataset 2), 'cov_matrix', 'errors',
+            'shared' and 'local' mapping names to (value, error) with arrays per
+            dataset for local parameters, 'chi_squared', 'reduced_chi_squared',
+            'r_squared' per dataset and 'success'
+    """
+    model = compile_model(model)
+    names = _parameter_names(model)
+    unknown = set(shared) - set(names)
+    if unknown:
+        raise ValueError(f"Unknown shared parameters: {', '.join(sorted(unknown))}")
+    x_data = [np.asarray(x, dtype=float) for x in x_data]
+    y_data = [np.asarray(y, dtype=float) for y in y_data]
+    if y_errors is None:
+        y_errors = [np.ones(len(y)) for y in y_data]
+    y_errors = [np.broadcast_to(np.asarray(e, dtype=float), y.shape) for e, y in zip(y_errors, y_data)]
+
+    num_datasets = len(x_data)
+    shared_index = [names.index(name) for name in names if name in shared]
+    local_index = [i for i in range(len(names)) if names[i] not in shared]
+    num_shared, num_local = len(shared_index), len(local_index)
+    num_params = num_shared + num_datasets * num_local
+
+    # Position of every model parameter of dataset k in the joint vector
+    positions = np.empty((num_datasets, len(names)), dtype=int)
+    positions[:, shared_index] = np.arange(num_shared)
+    positions[:, local_index] = num_shared + np.arange(num_datasets)[:, None] * num_local + np.arange(num_local)
+
+    if initial_guess is None and hasattr(model, 'initial_guess'):
+        # Library models: per-dataset guesses, averaged for shared parameters
+        guesses = np.array([model.initial_guess(x, y) for x, y in zip(x_data, y_data)])
+        initial_guess = [guesses[:, i].mean() if names[i] in shared else guesses[:, i] for i in range(len(names))]
+    elif initial_guess is None:
+        initial_guess = np.ones(len(names))
+    start = np.empty(num_params)
+    for i, guess in enumerate(initial_guess):
+        start[positions[:, i]] = guess
+
+    lengths = np.array([len(y) for y in y_data])
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    # Sparsity pattern: the rows of dataset k depend on its own columns only
+    rows = np.concatenate([np.repeat(np.arange(offsets[k], offsets[k + 1]), len(names))
+                           for k in range(num_datasets)])
+    columns = np.concatenate([np.tile(positions[k], lengths[k]) for k in range(num_datasets)])
+    shape = (offsets[-1], num_params)
+
+    def residuals(params):
+        return np.concatenate([
+            (y_data[k] - model(x_data[k], *params[positions[k]])) / y_errors[k] for k in range(num_datasets)
+        ])
+
+    def jacobian(params):
+        blocks = [
+            -_model_jacobian(model, x_data[k], params[positions[k]]) / y_errors[k][:, None]
+            for k in range(num_datasets)
+        ]
+        return csr_matrix((np.concatenate([block.ravel() for block in blocks]), (rows, columns)), shape=shape)
+
+    # Scaling by the Jacobian columns copes with parameters of very different size
+    options.setdefault('x_scale', 'jac')
+    result = least_squares(residuals, start, jac=jacobian, **options)
+
+    jac = result.jac
+    information = (jac.T @ jac).toarray() if hasattr(jac, 'toarray') else jac.T @ jac
+    cov_matrix = np.linalg.pinv(information)
+    chi_squared = np.sum(result.fun**2)
+    dof = max(offsets[-1] - num_params, 1)
+    if not absolute_sigma:
+        cov_matrix = cov_matrix * chi_squared / dof
+    errors = np.sqrt(np.diag(cov_matrix))
+
+    parameter_names = [names[i] for i in shared_index] + [
+        f'{names[i]}[{k}]' for k in range(num_datasets) for i in local_index
+    ]
+    r_squared = np.array([
+        _r_squared(y_data[k], y_data[k] - model(x_data[k], *result.x[positions[k]]))
+        for k in range(num_datasets)
+    ])
+    return {
+        'names': parameter_names,
+        'parameters': result.x,
+        'cov_matrix': cov_matrix,
+        'errors': errors,
+        'shared': {names[i]: (result.x[positions[0, i]], errors[positions[0, i]]) for i in shared_index},
+        'local': {names[i]: (result.x[positions[:, i]], errors[positions[:, i]]) for i in local_index},
+        'chi_squared': chi_squared,
+        'reduced_chi_squared': chi_squared / dof,
+        'r_squared': r_squared,
+        'success': result.success,
+    }
+
+def _resampled_polyfits(x_data, y_data, y_errors, degree, counts):
+    """
+    Weighted polynomial fits for many resamples given as counts per point.
+
+    Every resample (bootstrap draw or jackknife subset) only changes how often
+    each point enters the sums, so the moments of all resamples are one matrix
+    product counts @ (w t^k) and the normal equations are solved together.
+
+    Returns:
+        np.ndarray: Coefficients with shape (resamples, degree + 1), NaN for
+            resamples with too few distinct points
+    """
+    num_params = degree + 1
+    weights = np.ones_like(y_data) if y_errors is None else 1 / y_errors**2
+    center = np.mean(x_data)
+    scale = np.std(x_data) or 1.0
+    t = (x_data - center) / scale
+    powers = t[:, None] ** np.arange(2 * degree + 1)
+    moments = counts @ (weights[:, None] * powers)
+    rhs = counts @ ((weights * y_data)[:, None] * powers[:, :num_params])
+
+    valid = np.count_nonzero(counts, axis=1) > degree
+    normal = moments[:, np.add.outer(np.arange(num_params), np.arange(num_params))]
+    normal[~valid] = np.eye(num_params)
+    coefficients_t = np.linalg.solve(normal, rhs[:, :, None])[:, :, 0]
+    coefficients, _ = _unstandardise(coefficients_t, np.zeros(normal.shape), center, scale)
+    coefficients[~valid] = np.nan
+    return coefficients
+
+def resample_fit(x_data, y_data, y_errors=None, fit_type='linear', degree=1, custom_fit_func=None,
+                 initial_guess=None, method='bootstrap', num_resamples=1000, confidence=0.6827,
+                 seed=None, processes=None):
+    """
+    Estimate fit parameter uncertainties by refitting resampled data.
+
+    For small or non-Gaussian datasets the covariance of a single fit can be
+    misleading. Bootstrap draws points with replacement, jackknife leaves one
+    point out at a time. Polynomial (including linear) refits of all resamples
+    are solved together; custom models are refitted with curve_fit, started
+    from the best fit and distributed over a process pool like fit_batch.
+
+    Args:
+        x_data (np.ndarray): X-axis data
+        y_data (np.ndarray): Y-axis data
+        y_errors (np.ndarray, optional): Y-axis errors used as weights
+        fit_type (str): 'linear', 'polynomial', or 'custom'
+        degree (int): Degree of polynomial fit
+        custom_fit_func (function or str, optional): Custom fit function or model string
+        initial_guess (list, optional): Initial guess for the best fit
+        method (str): 'bootstrap' or 'jackknife'
+        num_resamples (int): Number of bootstrap resamples
+        confidence (float): Coverage of the intervals, default 1 σ
+        seed (int, optional): Random seed for the bootstrap
+        processes (int, optional): Worker processes for custom models, see fit_batch
+
+    Returns:
+        dict: 'coefficients' (best fit), 'errors', 'cov_matrix' and
+            'correlation' from the resamples, 'intervals' with shape
+            (params, 2) (bootstrap percentiles, jackknife normal intervals),
+            'bias', 'samples' (refitted coefficients) and 'num_failed'
+    """
+    x_data = np.asarray(x_data, dtype=float)
+    y_data = np.asarray(y_data, dtype=float)
+    if y_errors is not None:
+        y_errors = np.broadcast_to(np.asarray(y_errors, dtype=float), y_data.shape)
+    num_values = len(x_data)
+    custom = fit_type == 'custom' and custom_fit_func is not None
+
+    if method == 'bootstrap':
+        rng = np.random.default_rng(seed)
+        indices = rng.integers(0, num_values, size=(num_resamples, num_values))
+    elif method == 'jackknife':
+        indices = np.array([np.delete(np.arange(num_values), i) for i in range(num_values)])
+    else:
+        raise ValueError(f"Unknown method '{method}', use 'bootstrap' or 'jackknife'")
+
+    if custom:
+        func = compile_model(custom_fit_func)
+        coefficients, _ = _curve_fit(func, x_data, y_data, p0=initial_guess, sigma=y_errors)
+        segments = [
+            (x_data[index], y_data[index], None if y_errors is None else y_errors[index]) for index in indices
+        ]
+        samples = _batch_curve_fit(segments, func, coefficients, False, processes)['coefficients']
+    else:
+        counts = np.zeros((len(indices), num_values))
+        np.add.at(counts, (np.arange(len(indices))[:, None], indices), 1)
+        coefficients = _resampled_polyfits(x_data, y_data, y_errors, degree, np.ones((1, num_values)))[0]
+        samples = _resampled_polyfits(x_data, y_data, y_errors, degree, counts)
+
+    failed = np.any(np.isnan(samples), axis=1)
+    good = samples[~failed]
+    mean = np.mean(good, axis=0)
+    if method == 'bootstrap':
+        cov_matrix = np.cov(good, rowvar=False, ddof=1).reshape(len(mean), len(mean))
+        bias = mean - coefficients
+        tail = 50 * (1 - confidence)
+        intervals = np.percentile(good, [tail, 100 - tail], axis=0).T
+    else:
+        deviations = good - mean
+        cov_matrix = (len(good) - 1) / len(good) * deviations.T @ deviations
+        bias = (len(good) - 1) * (mean - coefficients)
+        z = np.sqrt(2) * erfinv(confidence)
+        half_width = z * np.sqrt(np.diag(cov_matrix))
+        intervals = np.stack([coefficients - half_width, coefficients + half_width], axis=1)
+
+    errors = np.sqrt(np.diag(cov_matrix))
+    return {
+        'coefficients': coefficients,
+        'errors': errors,
+        'cov_matrix': cov_matrix,
+        'correlation': cov_matrix / np.outer(errors, errors),
+        'intervals': intervals,
+        'bias': bias,
+        'samples': samples,
+        'num_failed': int(np.sum(failed)),
+    }
+
+def estimate_peak(x_data, y_data, edge_fraction=0.1):
+    """
+    Data-driven starting values for peak models (resonance, Lorentzian, Gaussian).
+
+    The baseline is the median of the outer points, the peak is the largest
+    deviation from it (maxima and minima), and the width is taken where the
+    curve crosses half of the peak height, interpolated between points.
+
+    Args:
+        x_data (array-like): X-axis data
+        y_data (array-like): Y-axis data
+        edge_fraction (float): Fraction of points at each end used for the baseline
+
+    Returns:
+        dict: 'position', 'amplitude' (height above the baseline, negative for
+            dips), 'fwhm' and 'baseline'
+    """
+    order = np.argsort(x_data)
+    x_data = np.asarray(x_data, dtype=float)[order]
+    y_data = np.asarray(y_data, dtype=float)[order]
+    num_edge = max(1, int(len(x_data) * edge_fraction))
+    baseline = np.median(np.concatenate([y_data[:num_edge], y_data[-num_edge:]]))
+
+    deviation = y_data - baseline
+    peak = np.argmax(np.abs(deviation))
+    amplitude = deviation[peak]
+    # Positive above half maximum, in both directions from the peak
+    above = deviation * np.sign(amplitude) - np.abs(amplitude) / 2
+
+    def crossing(indices):
+        for i, j in zip(indices[:-1], indices[1:]):
+            if above[j] < 0:
+                return x_data[i] + (x_data[j] - x_data[i]) * above[i] / (above[i] - above[j])
+        return x_data[indices[-1]]
+
+    left = crossing(np.arange(peak, -1, -1)) if peak > 0 else x_data[0]
+    right = crossing(np.arange(peak, len(x_data))) if peak < len(x_data) - 1 else x_data[-1]
+    return {
+        'position': x_data[peak],
+        'amplitude': amplitude,
+        'fwhm': right - left,
+        'baseline': baseline,
+    }
+
+# Parameter names that estimate_peak provides a value for (lower case, without underscores)
+_PEAK_PARAMETER_NAMES = {
+    'position': {'x0', 'w0', 'f0', 'omega0', 'mu', 'center', 'centre', 'position', 'peak'},
+    'fwhm': {'g', 'gamma', 'sigma', 'fwhm', 'width', 'delta', 'd'},
+    'amplitude': {'a', 'amp', 'amplitude', 'h', 'height'},
+    'baseline': {'c', 'offset', 'baseline', 'y0', 'bg', 'background'},
+}
+
+def heuristic_start(x_data, y_data, custom_fit_func, bounds=None):
+    """
+    Data-driven start value for a nonlinear fit.
+
+    Library models (see pylab.models) provide their own initial_guess. For
+    other models, parameters named like a peak position, width, height or
+    baseline (e.g. x0, gamma, A, c) are taken from estimate_peak; the
+    remaining ones start at the centre of their bounds, or at 1.
+
+    Args:
+        x_data (array-like): X-axis data
+        y_data (array-like): Y-axis data
+        custom_fit_func (function or str): Custom fit function or model string
+        bounds (list, optional): (low, high) per parameter, values are clipped to them
+
+    Returns:
+        np.ndarray or None: Start value, None if no parameter could be estimated
+    """
+    func = compile_model(custom_fit_func)
+    if hasattr(func, 'initial_guess'):
+        start = np.asarray(func.initial_guess(x_data, y_data), dtype=float)
+    else:
+        peak = estimate_peak(x_data, y_data)
+        names = [name.lower().replace('_', '') for name in _parameter_names(func)]
+        start = np.ones(len(names))
+        if bounds is not None:
+            low, high = np.asarray(bounds, dtype=float).T
+            geometric = (low > 0) & (high / np.where(low > 0, low, 1) > 100)
+            start = np.where(geometric, np.sqrt(np.abs(low * high)), (low + high) / 2)
+        known = False
+        for i, name in enumerate(names):
+            for quantity, aliases in _PEAK_PARAMETER_NAMES.items():
+                if name in aliases:
+                    start[i] = peak[quantity]
+                    known = True
+        if not known:
+            return None
+    if bounds is not None:
+        low, high = np.asarray(bounds, dtype=float).T
+        start = np.clip(start, low, high)
+    return start
+
+def _fit_start(arguments):
+    """Fit from one start value; bad starts may overflow or fail silently."""
+    with warnings.catch_warnings(), np.errstate(all='ignore'):
+        warnings.simplefilter('ignore', OptimizeWarning)
+        return _fit_segment(arguments)
+
+def latin_hypercube_starts(bounds, num_starts, seed=None):
+    """
+    Spread start values over a box with Latin hypercube sampling.
+
+    Ranges of positive bounds spanning more than two decades are sampled
+    uniformly in the logarithm.
+
+    Args:
+        bounds (list): (low, high) per parameter
+        num_starts (int): Number of start values
+        seed (int, optional): Random seed
+
+    Returns:
+        np.ndarray: Start values with shape (num_starts, parameters)
+    """
+    bounds = np.asarray(bounds, dtype=float)
+    low, high = bounds[:, 0], bounds[:, 1]
+    logarithmic = (low > 0) & (high / np.where(low > 0, low, 1) > 100)
+    low = np.where(logarithmic, np.log(np.where(logarithmic, low, 1)), low)
+    high = np.where(logarithmic, np.log(np.where(logarithmic, high, 1)), high)
+    samples = qmc.LatinHypercube(len(bounds), rng=np.random.default_rng(seed)).random(num_starts)
+    starts = low + samples * (high - low)
+    starts[:, logarithmic] = np.exp(starts[:, logarithmic])
+    return starts
+
+def multi_start_fit(x_data, y_data, custom_fit_func, bounds, y_errors=None, initial_guess=None,
+                    num_starts=32, seed=None, absolute_sigma=False, processes=None):
+    """
+    Fit a nonlinear model from many start values and keep the best χ².
+
+    The starts are initial_guess (if given), the data-driven heuristic_start
+    and values spread over the bounds with latin_hypercube_starts. They are
+    fitted here, or in a process pool like fit_batch if processes is given.
+    The bounds only define where to start; the fits themselves are not
+    constrained.
+
+    Args:
+        x_data (np.ndarray): X-axis data
+        y_data (np.ndarray): Y-axis data
+        custom_fit_func (function or str): Custom fit function or model string
+        bounds (list): (low, high) per parameter for the start values
+        y_errors (np.ndarray, optional): Y-axis errors
+        initial_guess (list, optional): Additional start value
+        num_starts (int): Number of Latin hypercube start values
+        seed (int, optional): Random seed
+        absolute_sigma (bool): Use the errors as absolute uncertainties
+        processes (int, optional): Worker processes, see fit_batch
+
+    Returns:
+        dict: Best fit 'coefficients', 'cov_matrix', 'coeff_errors',
+            'r_squared' and 'chi_squared', the 'starts' and the χ² reached from
+            each of them ('start_chi_squared', NaN for failed fits)
+    """
+    func = compile_model(custom_fit_func)
+    x_data = np.asarray(x_data, dtype=float)
+    y_data = np.asarray(y_data, dtype=float)
+    if y_errors is not None:
+        y_errors = np.broadcast_to(np.asarray(y_errors, dtype=float), y_data.shape)
+
+    starts = [latin_hypercube_starts(bounds, num_starts, seed)]
+    heuristic = heuristic_start(x_data, y_data, func, bounds)
+    if heuristic is not None:
+        starts.insert(0, heuristic[None, :])
+    if initial_guess is not None:
+        starts.insert(0, np.asarray(initial_guess, dtype=float)[None, :])
+    starts = np.vstack(starts)
+    tasks = [(func, x_data, y_data, y_errors, start, absolute_sigma) for start in starts]
+    results = _run_fits(_fit_start, tasks, func, processes)
+
+    start_chi_squared = np.array([np.nan if result is None else result[3] for result in results])
+    if np.all(np.isnan(start_chi_squared)):
+        raise RuntimeError("The fit failed from all start values")
+    coefficients, cov_matrix, r_squared, chi_squared = results[np.nanargmin(start_chi_squared)]
+    return {
+        'coefficients': coefficients,
+        'cov_matrix': cov_matrix,
+        'coeff_errors': np.sqrt(np.diag(cov_matrix)),
+        'r_squared': r_squared,
+        'chi_squared': chi_squared,
+        'starts': starts,
+        'start_chi_squared': start_chi_squared,
+    }
+
+
+def _hash_content(value, digest, seen=()):
+    """
+    Feed a value into a hash by its full content.
+
+    Numbers, strings, bytes, NumPy arrays, containers of these, code objects
+    and plain functions (byte code, defaults, closure values and the values
+    of the globals they read) are supported. Modules, classes, builtins and
+    functions of other modules (e.g. numpy) count by name. Anything else
+    raises TypeError, because its repr does not reliably reflect its content.
+    """
+    if value is None or isinstance(value, (bool, int, float, complex, str)):
+        digest.update(f"{type(value).__name__}:{value!r};".encode('utf-8'))
+    elif isinstance(value, bytes):
+        digest.update(f"bytes:{len(value)};".encode('utf-8'))
+        digest.update(value)
+    elif isinstance(value, (np.ndarray, np.generic)):
+        array = np.ascontiguousarray(value)
+        if array.dtype.hasobject:
+            raise TypeError("Object arrays cannot be hashed by content")
+        digest.update(f"array:{array.dtype.str}:{array.shape};".encode('utf-8'))
+        digest.update(array.tobytes())
+    elif isinstance(value, (tuple, list, set, frozenset)):
+        items = value
+        if isinstance(value, (set, frozenset)):
+            items = sorted(value, key=repr)
+        digest.update(f"{type(value).__name__}:{len(value)};".encode('utf-8'))
+        for item in items:
+            _hash_content(item, digest, seen)
+    elif isinstance(value, dict):
+        digest.update(f"dict:{len(value)};".encode('utf-8'))
+        for name in sorted(value, key=repr):
+            _hash_content(name, digest, seen)
+            _hash_content(value[name], digest, seen)
+    elif isinstance(value, types.CodeType):
+        digest.update(b'code;')
+        digest.update(value.co_code)
+        _hash_content(value.co_consts, digest, seen)
+        _hash_content(value.co_names, digest, seen)
+    elif isinstance(value, (types.ModuleType, type, types.BuiltinFunctionType, np.ufunc)):
+        name = getattr(value, '__qualname__', value.__name__)
+        digest.update(f"{type(value).__name__}:{getattr(value, '__module__', '')}.{name};".encode('utf-8'))
+    elif isinstance(value, types.FunctionType):
+        digest.update(f"function:{value.__module__}.{value.__qualname__};".encode('utf-8'))
+        # seen holds the module of the fit model followed by the functions being hashed
+        if seen and (value.__module__ != seen[0] or id(value) in seen[1:]):
+            return
+        seen = (seen or (value.__module__,)) + (id(value),)
+        _hash_content(value.__code__, digest, seen)
+        _hash_content(value.__defaults__, digest, seen)
+        _hash_content(value.__kwdefaults__, digest, seen)
+        try:
+            closure = [cell.cell_contents for cell in value.__closure__ or ()]
+        except ValueError:
+            raise TypeError("Functions with empty closure cells cannot be hashed by content")
+        _hash_content(closure, digest, seen)
+        # Values of the module-level names the code reads, also from nested code objects
+        code_objects = [value.__code__]
+        for code in code_objects:
+            code_objects.extend(c for c in code.co_consts if isinstance(c, types.CodeType))
+        names = sorted({name for code in code_objects for name in code.co_names})
+        for name in names:
+            if name in value.__globals__:
+                _hash_content(name, digest, seen)
+                _hash_content(value.__globals__[name], digest, seen)
+    else:
+        raise TypeError(f"{type(value).__name__} objects cannot be hashed by content")
+
+def _model_identity(func):
+    """
+    Describe a fit model by what it computes, for the fit cache.
+
+    Model strings are identified by their definition, library models by their
+    name and a content hash of their functions and bounds, plain functions by
+    a content hash of their code, defaults, closure values
+    and the globals they read (see _hash_content). Attributes looked up on
+    modules are not part of the identity; clear the cache after changing them.
+
+    Raises:
+        TypeError: If the model cannot be identified reliably
+    """
+    if func is None:
+        return None
+    if hasattr(func, 'model_str'):
+        return ('string', func.model_str, func.variable, func.parameters)
+    digest = hashlib.sha256()
+    if hasattr(func, 'initial_guess') and hasattr(func, 'name'):
+        _hash_content([func._function, func._jacobian, func._guess, func.bounds], digest)
+        return ('library', func.name, func.parameters, digest.hexdigest())
+    if not isinstance(func, types.FunctionType):
+        raise TypeError(f"Cannot identify the fit model {func!r}")
+    _hash_content(func, digest)
+    return ('function', digest.hexdigest())
+
+def default_fit_cache_directory():
+    """
+    Return the suggested directory of the on-disk fit cache.
+
+    Returns:
+        str: pylab/fits in the user cache directory ($XDG_CACHE_HOME or ~/.cache)
+    """
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'pylab', 'fits')
+
+def _implementation_digest():
+    """Hash of the pylab sources, so results stored by other versions of the fitting code are not reused."""
+    global _fit_implementation_digest
+    if _fit_implementation_digest is None:
+        digest = hashlib.sha256()
+        package_dir = os.path.dirname(os.path.abspath(__file__))
+        for file_name in sorted(os.listdir(package_dir)):
+            if file_name.endswith('.py'):
+                digest.update(file_name.encode('utf-8'))
+                with open(os.path.join(package_dir, file_name), 'rb') as f:
+                    digest.update(f.read())
+        _fit_implementation_digest = digest.hexdigest()
+    return _fit_implementation_digest
+
+def fit_cache_key(arrays, model=None, **options):
+    """
+    Hash fit inputs into a key for the fit cache.
+
+    Args:
+        arrays (list): Data arrays of the fit (x, y, errors), None entries allowed
+        model (function or str, optional): Fit model, see _model_identity
+        **options: Further settings the result depends on (fit type, degree, range, ...)
+
+    Returns:
+        str: Hexadecimal SHA-256 digest, or None if the model cannot be
+            identified reliably and the fit must not be cached
+    """
+    try:
+        model_identity = _model_identity(model)
+    except TypeError:
+        return None
+    digest = hashlib.sha256(repr((_FIT_CACHE_VERSION, _implementation_digest())).encode('utf-8'))
+    for array in arrays:
+        if array is None:
+            digest.update(b'None;')
+            continue
+        array = np.ascontiguousarray(array, dtype=float)
+        digest.update(repr(array.shape).encode('utf-8'))
+        digest.update(array.tobytes())
+    options = {
+        name: np.asarray(value, dtype=float).tolist() if isinstance(value, np.ndarray) else value
+        for name, value in options.items()
+    }
+    digest.update(repr((model_identity, sorted(options.items()))).encode('utf-8'))
+    return digest.hexdigest()
+
+def _fit_cache_path(directory, key):
+    """Path of the on-disk cache file for a key."""
+    return os.path.join(directory, f"fit_{key[:32]}.json")
+
+def _load_fit_from_disk(directory, key):
+    """Load a fit result from the on-disk cache, or None if absent."""
+    path = _fit_cache_path(directory, key)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            entry = json.load(f)
+        # Mark as recently used for the eviction of old files
+        os.utime(path)
+    except (OSError, ValueError):
+        return None
+    if entry.get('version') != _FIT_CACHE_VERSION or entry.get('key') != key:
+        return None
+    result = {name: np.array(entry[name], dtype=float) for name in ('coefficients', 'cov_matrix', 'coeff_errors')}
+    result['r_squared'] = float(entry['r_squared'])
+    return result
+
+def _store_fit_on_disk(directory, key, result, max_files):
+    """Write a fit result to the on-disk cache and evict the least recently used files."""
+    path = _fit_cache_path(directory, key)
+    entry = {'version': _FIT_CACHE_VERSION, 'key': key, 'r_squared': float(result['r_squared'])}
+    for name in ('coefficients', 'cov_matrix', 'coeff_errors'):
+        entry[name] = np.asarray(result[name], dtype=float).tolist()
+    try:
+        os.makedirs(directory, exist_ok=True)
+        # Write to a temporary file first so concurrent runs never read partial files
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f)
+        os.replace(temp_path, path)
+
+        files = [
+            os.path.join(directory, file_name) for file_name in os.listdir(directory)
+            if file_name.startswith('fit_') and file_name.endswith('.json')
+        ]
+        if len(files) > max_files:
+            files.sort(key=os.path.getmtime)
+            for old_path in files[:len(files) - max_files]:
+                os.remove(old_path)
+    except OSError as e:
+        print(f"Could not write fit cache: {e}")
+
+def set_fit_cache(maxsize=None, directory=None, max_files=None):
+    """
+    Configure the process-wide cache of fit results used by generate_fit_data.
+    
+    Args:
+        maxsize (int, optional): Number of fit results kept in memory, 0 disables
+            the memory cache
+        directory (str, optional): Directory for the on-disk cache that persists
+            results across runs, e.g. default_fit_cache_directory(); '' to disable
+            it again. The disk cache is off by default
+        max_files (int, optional): Number of results kept on disk
+    """
+    with _fit_cache_lock:
+        if maxsize is not None:
+            _fit_cache_settings['maxsize'] = max(int(maxsize), 0)
+            while len(_fit_memory_cache) > _fit_cache_settings['maxsize']:
+                _fit_memory_cache.popitem(last=False)
+        if directory is not None:
+            _fit_cache_settings['directory'] = directory or None
+        if max_files is not None:
+            _fit_cache_settings['max_files'] = max(int(max_files), 1)
+
+def clear_fit_cache(disk=False):
+    """
+    Remove all fit results from the cache.
+    
+    Args:
+        disk (bool): Also delete the files of the on-disk cache
+    """
+    with _fit_cache_lock:
+        _fit_memory_cache.clear()
+        for name in _fit_cache_stats:
+            _fit_cache_stats[name] = 0
+        directory = _fit_cache_settings['directory']
+        if disk and directory and os.path.isdir(directory):
+            for file_name in os.listdir(directory):
+                if file_name.startswith('fit_') and file_name.endswith('.json'):
+                    os.remove(os.path.join(directory, file_name))
+
+def invalidate_fit_cache(key):
+    """
+    Remove a single fit result from the memory and disk caches.
+    
+    Args:
+        key (str): Key from fit_cache_key
+    """
+    with _fit_cache_lock:
+        _fit_memory_cache.pop(key, None)
+        directory = _fit_cache_settings['directory']
+        if directory:
+            try:
+                os.remove(_fit_cache_path(directory, key))
+            except FileNotFoundError:
+                pass
+
+def fit_cache_info():
+    """
+    Return statistics about the fit cache.
+    
+    Returns:
+        dict: Hits, disk hits, misses, current size and settings
+    """
+    with _fit_cache_lock:
+        info = dict(_fit_cache_stats)
+        info['size'] = len(_fit_memory_cache)
+        info.update(_fit_cache_settings)
+        return info
+
+def _copy_fit_result(result):
+    """Copy the arrays of a cached fit result so callers cannot modify the cache."""
+    return {name: value.copy() if isinstance(value, np.ndarray) else value for name, value in result.items()}
+
+def cached_fit(key, fit):
+    """
+    Look up a fit result in the memory and disk caches or compute it.
+
+    Args:
+        key (str): Key from fit_cache_key, None to bypass the cache
+        fit (function): Computes the result dict on a cache miss, with
+            'coefficients', 'cov_matrix', 'coeff_errors' and 'r_squared'
+
+    Returns:
+        dict: The fit result; cached results are copies, so callers may modify them
+    """
+    if key is None:
+        return fit()
+    with _fit_cache_lock:
+        result = _fit_memory_cache.get(key)
+        if result is not None:
+            _fit_memory_cache.move_to_end(key)
+            _fit_cache_stats['hits'] += 1
+            return _copy_fit_result(result)
+        directory = _fit_cache_settings['directory']
+        max_files = _fit_cache_settings['max_files']
+        if _fit_cache_settings['maxsize'] == 0 and not directory:
+            return fit()
+
+    result = _load_fit_from_disk(directory, key) if directory else None
+    if result is not None:
+        stat = 'disk_hits'
+    else:
+        stat = 'misses'
+        result = fit()
+        result = {
+            'coefficients': np.asarray(result['coefficients'], dtype=float),
+            'cov_matrix': np.asarray(result['cov_matrix'], dtype=float),
+            'coeff_errors': np.asarray(result['coeff_errors'], dtype=float),
+            'r_squared': float(result['r_squared']),
+        }
+        if directory:
+            _store_fit_on_disk(directory, key, result, max_files)
+
+    with _fit_cache_lock:
+        _fit_cache_stats[stat] += 1
+        if _fit_cache_settings['maxsize'] > 0:
+            _fit_memory_cache[key] = result
+            while len(_fit_memory_cache) > _fit_cache_settings['maxsize']:
+                _fit_memory_cache.popitem(last=False)
+    return _copy_fit_result(result)
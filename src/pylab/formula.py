@@ -0,0 +1,681 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import sympy as sp
+from mpmath.libmp import repr_dps, to_str
+from sympy.printing.numpy import NumPyPrinter
+
+# Bump whenever the cache entry layout changes
+_CACHE_VERSION = 1
+
+_cache_lock = threading.RLock()
+_memory_cache = OrderedDict()
+_cache_settings = {'maxsize': 128, 'directory': None}
+_cache_stats = {'hits': 0, 'disk_hits': 0, 'misses': 0}
+
+
+def _parse_variables(variables_str):
+    """
+    Split a variable specification into a tuple of names.
+
+    Args:
+        variables_str (str or list): Space/comma separated names or a list of names
+
+    Returns:
+        tuple: Variable names in the given order
+    """
+    if isinstance(variables_str, str):
+        return tuple(variables_str.replace(',', ' ').split())
+    return tuple(str(name) for name in variables_str)
+
+def _build_kernel_source(expressions, symbols, name='kernel', cse=True):
+    """
+    Generate the Python source of a NumPy kernel evaluating several expressions.
+
+    With cse=True, common subexpressions of all expressions (typically a formula
+    and its derivatives) are computed once into temporaries and shared.
+
+    Args:
+        expressions (list): SymPy expressions to evaluate
+        symbols (tuple): SymPy symbols in argument order
+        name (str): Name of the generated function
+        cse (bool): Eliminate common subexpressions
+
+    Returns:
+        str: Source code of a function returning a tuple of arrays
+    """
+    # Use neutral argument names so variable names never clash with numpy
+    arguments = [sp.Symbol(f'_a{i}') for i in range(len(symbols))]
+    replacements = dict(zip(symbols, arguments))
+    expressions = [sp.sympify(expr).xreplace(replacements) for expr in expressions]
+    printer = NumPyPrinter()
+
+    if cse:
+        temporaries, expressions = sp.cse(expressions, symbols=sp.numbered_symbols('_c'))
+    else:
+        temporaries = []
+
+    lines = [f"def {name}({', '.join(str(arg) for arg in arguments)}):"]
+    for temporary, expr in temporaries:
+        lines.append(f"    {temporary} = {printer.doprint(expr)}")
+    outputs = [printer.doprint(expr) for expr in expressions]
+    lines.append(f"    return ({', '.join(outputs)},)")
+    return "\n".join(lines) + "\n"
+
+# Constants stored by name in cached expression trees
+_TREE_CONSTANTS = ('Pi', 'Exp1', 'ImaginaryUnit', 'Infinity', 'NegativeInfinity', 'ComplexInfinity',
+                   'NaN', 'EulerGamma', 'GoldenRatio', 'Catalan')
+
+def _tree_class(name):
+    """SymPy class for an operation node of a cached expression, None if not allowed."""
+    cls = getattr(sp, name, None)
+    if isinstance(cls, type) and (cls in (sp.Add, sp.Mul, sp.Pow) or issubclass(cls, sp.Function)):
+        return cls
+    return None
+
+def _expression_to_tree(expr):
+    """
+    Convert a SymPy expression into nested lists for the on-disk cache.
+
+    Raises:
+        TypeError: If the expression contains nodes other than symbols,
+            numbers, constants, Add, Mul, Pow and SymPy functions
+    """
+    if isinstance(expr, sp.Symbol):
+        return ['Symbol', expr.name]
+    if isinstance(expr, sp.Integer):
+        return ['Integer', str(expr.p)]
+    if isinstance(expr, sp.Rational):
+        return ['Rational', str(expr.p), str(expr.q)]
+    if isinstance(expr, sp.Float):
+        # As many digits as needed to restore the exact binary value
+        return ['Float', to_str(expr._mpf_, repr_dps(expr._prec)), expr._prec]
+    name = type(expr).__name__
+    if name in _TREE_CONSTANTS and getattr(sp.S, name) is expr:
+        return ['Constant', name]
+    if expr.args and _tree_class(name) is type(expr):
+        return [name] + [_expression_to_tree(arg) for arg in expr.args]
+    raise TypeError(f"Cannot store {name} in the formula cache")
+
+def _expression_from_tree(tree):
+    """
+    Rebuild a SymPy expression from _expression_to_tree output.
+
+    Only the node types written by _expression_to_tree are accepted, so a
+    tampered cache file cannot run code (unlike sympify of stored text).
+
+    Raises:
+        ValueError: If the tree contains an unknown node
+    """
+    kind, *args = tree
+    if kind == 'Symbol':
+        return sp.Symbol(str(args[0]))
+    if kind == 'Integer':
+        return sp.Integer(int(args[0]))
+    if kind == 'Rational':
+        return sp.Rational(int(args[0]), int(args[1]))
+    if kind == 'Float':
+        return sp.Float(str(args[0]), precision=int(args[1]))
+    if kind == 'Constant' and args[0] in _TREE_CONSTANTS:
+        return getattr(sp.S, args[0])
+    cls = _tree_class(str(kind))
+    if cls is None or not args:
+        raise ValueError(f"Unknown node in cached expression: {kind!r}")
+    return cls(*[_expression_from_tree(arg) for arg in args], evaluate=False)
+
+def _restore_expressions(trees, symbols, count):
+    """
+    Rebuild the expressions of a cache entry and check them before compiling.
+
+    Symbols other than the variables would be printed verbatim into the
+    kernel source, so they are rejected like unknown nodes.
+
+    Raises:
+        ValueError: If the entry does not match the formula
+    """
+    expressions = [_expression_from_tree(tree) for tree in trees]
+    if len(expressions) != count:
+        raise ValueError("Cached formula has the wrong number of expressions")
+    # Stored symbols carry no assumptions, the variables may be real
+    variables = {sp.Symbol(symbol.name): symbol for symbol in symbols}
+    if not set().union(*(expr.free_symbols for expr in expressions)) <= set(variables):
+        raise ValueError("Cached formula uses symbols that are not variables")
+    return [expr.xreplace(variables) for expr in expressions]
+
+def _compile_kernels(source):
+    """
+    Compile kernel source generated by _build_kernel_source.
+
+    Args:
+        source (str): Source code of one or more kernels
+
+    Returns:
+        dict: Compiled kernels by function name
+    """
+    namespace = {'numpy': np}
+    exec(compile(source, '<pylab.formula>', 'exec'), namespace)
+    return {name: func for name, func in namespace.items() if callable(func) and name != 'numpy'}
+
+
+class CompiledFormula:
+    """
+    A formula parsed and differentiated once, with value and gradient compiled
+    to vectorized NumPy kernels.
+
+    Instances are usually obtained through compile_formula, which caches them.
+    The on-disk cache stores the differentiated expressions as JSON trees;
+    when loading them only the (fast) kernel generation is repeated.
+
+    Attributes:
+        formula_str (str): The formula as given
+        variables (tuple): Variable names in argument order
+        symbols (tuple): SymPy symbols in argument order
+        expression (sp.Expr): Parsed formula
+        gradient (list): Partial derivatives in variable order
+        hessian (list): Second derivatives as nested lists, if compiled with hessian=True
+        source (str): Source code of the generated kernel
+    """
+
+    def __init__(self, formula_str, variables_str, hessian=False, cse=True, real=False, _entry=None):
+        self.formula_str = str(formula_str)
+        self.variables = _parse_variables(variables_str)
+        self.symbols = tuple(sp.Symbol(name, real=True) if real else sp.Symbol(name) for name in self.variables)
+        self.has_hessian = hessian
+        # Upper triangle of the symmetric Hessian, row by row
+        self._hessian_index = [
+            (i, j) for i in range(len(self.variables)) for j in range(i, len(self.variables))
+        ] if hessian else []
+
+        num_gradient = len(self.variables)
+        if _entry is not None:
+            self._expressions = _restore_expressions(
+                _entry['expressions'], self.symbols, 1 + num_gradient + len(self._hessian_index)
+            )
+        else:
+            # Variables take precedence over SymPy built-ins such as E, S or beta
+            local_names = dict(zip(self.variables, self.symbols))
+            expression = sp.sympify(formula_str, locals=local_names)
+            unknown = {str(symbol) for symbol in expression.free_symbols} - set(self.variables)
+            if unknown:
+                raise ValueError(
+                    f"Formula '{self.formula_str}' uses undeclared symbols: {', '.join(sorted(unknown))}"
+                )
+            gradient = [expression.diff(symbol) for symbol in self.symbols]
+
+            second = [gradient[i].diff(self.symbols[j]) for i, j in self._hessian_index]
+
+            self._expressions = [expression] + gradient + second
+        self.source = (
+            _build_kernel_source(self._expressions[:1], self.symbols, 'value_kernel', cse)
+            + _build_kernel_source(self._expressions[:1 + num_gradient], self.symbols, 'kernel', cse)
+        )
+        if hessian:
+            self.source += _build_kernel_source(self._expressions, self.symbols, 'hessian_kernel', cse)
+        kernels = _compile_kernels(self.source)
+        self._value_kernel = kernels['value_kernel']
+        self._kernel = kernels['kernel']
+        self._hessian_kernel = kernels.get('hessian_kernel')
+
+    def _symbolic(self):
+        """Return all symbolic expressions."""
+        return self._expressions
+
+    @property
+    def expression(self):
+        return self._symbolic()[0]
+
+    @property
+    def gradient(self):
+        return self._symbolic()[1:1 + len(self.variables)]
+
+    @property
+    def hessian(self):
+        if not self.has_hessian:
+            return None
+        second = self._symbolic()[1 + len(self.variables):]
+        matrix = [[None] * len(self.variables) for _ in self.variables]
+        for (i, j), expr in zip(self._hessian_index, second):
+            matrix[i][j] = matrix[j][i] = expr
+        return matrix
+
+    def _cache_entry(self):
+        """Serialisable representation used by the on-disk cache."""
+        return {
+            'version': _CACHE_VERSION,
+            'key': self.formula_str,
+            'variables': list(self.variables),
+            'expressions': [_expression_to_tree(expr) for expr in self._symbolic()],
+        }
+
+    @classmethod
+    def _from_cache_entry(cls, entry, options):
+        return cls(entry['key'], entry['variables'], _entry=entry, **options)
+
+    def value_function(self, *columns):
+        """
+        Evaluate the formula on one argument per variable.
+
+        Unlike evaluate, the arguments are passed through unchanged, so
+        array-like types with ufunc support (e.g. autodiff.Dual) work as well.
+        """
+        return self._value_kernel(*columns)[0]
+
+    def value_and_gradient_function(self, *columns):
+        """
+        Evaluate the formula and its gradient on one argument per variable.
+
+        The arguments are broadcast against each other, so scalars can be
+        mixed with arrays (e.g. a column of x values and scalar parameters).
+
+        Returns:
+            list: Value followed by the partial derivatives in variable order;
+                constant entries are returned as scalars
+        """
+        return self._kernel(*columns)
+
+    def _columns(self, measurements):
+        """Convert row-major measurements into one array per variable."""
+        measurements = np.atleast_2d(np.asarray(measurements, dtype=float))
+        if measurements.shape[1] != len(self.variables):
+            raise ValueError(
+                f"Expected {len(self.variables)} values per measurement "
+                f"({' '.join(self.variables)}), got {measurements.shape[1]}"
+            )
+        return measurements, measurements.T
+
+    def value_and_gradient(self, measurements):
+        """
+        Evaluate the formula and all partial derivatives for every row.
+
+        Args:
+            measurements (array-like): Values with shape (rows, variables)
+
+        Returns:
+            tuple: Values with shape (rows,) and gradient with shape (rows, variables)
+        """
+        measurements, columns = self._columns(measurements)
+        num_rows = measurements.shape[0]
+
+        outputs = self._kernel(*columns)
+        # Constant expressions come back as scalars and must be broadcast
+        outputs = [np.broadcast_to(np.asarray(out, dtype=float), (num_rows,)) for out in outputs]
+        values = np.array(outputs[0])
+        gradient = np.stack(outputs[1:], axis=1) if len(outputs) > 1 else np.zeros((num_rows, 0))
+        return values, gradient
+
+    def value_gradient_hessian(self, measurements):
+        """
+        Evaluate the formula, its gradient and its Hessian for every row.
+
+        Requires the formula to be compiled with hessian=True.
+
+        Args:
+            measurements (array-like): Values with shape (rows, variables)
+
+        Returns:
+            tuple: Values (rows,), gradient (rows, variables) and
+                Hessian (rows, variables, variables)
+        """
+        if self._hessian_kernel is None:
+            raise ValueError("Formula was compiled without hessian=True")
+        measurements, columns = self._columns(measurements)
+        num_rows = measurements.shape[0]
+        num_variables = len(self.variables)
+
+        outputs = self._hessian_kernel(*columns)
+        outputs = [np.broadcast_to(np.asarray(out, dtype=float), (num_rows,)) for out in outputs]
+        values = np.array(outputs[0])
+        gradient = np.stack(outputs[1:1 + num_variables], axis=1)
+        hessian = np.empty((num_rows, num_variables, num_variables))
+        for (i, j), out in zip(self._hessian_index, outputs[1 + num_variables:]):
+            hessian[:, i, j] = out
+            hessian[:, j, i] = out
+        return values, gradient, hessian
+
+    def evaluate(self, measurements):
+        """
+        Evaluate only the formula, without derivatives.
+
+        Any number of leading dimensions is supported, e.g. (samples, rows, variables).
+
+        Args:
+            measurements (array-like): Values with shape (..., variables)
+
+        Returns:
+            np.ndarray: Values with shape (...)
+        """
+        measurements = np.asarray(measurements, dtype=float)
+        if measurements.ndim == 1:
+            measurements = measurements[None, :]
+        if measurements.shape[-1] != len(self.variables):
+            raise ValueError(
+                f"Expected {len(self.variables)} values per measurement "
+                f"({' '.join(self.variables)}), got {measurements.shape[-1]}"
+            )
+        value = self._value_kernel(*np.moveaxis(measurements, -1, 0))[0]
+        return np.array(np.broadcast_to(np.asarray(value, dtype=float), measurements.shape[:-1]))
+
+
+class CompiledFormulaSet:
+    """
+    Several named formulas over the same variables, compiled into one fused
+    kernel for all values and the full Jacobian.
+
+    Outputs may reference other outputs by name; references are resolved by
+    substitution, so the Jacobian is always taken with respect to the inputs.
+
+    Attributes:
+        names (tuple): Output names in order
+        variables (tuple): Variable names in argument order
+        expressions (list): Resolved expressions of all outputs
+        jacobian (list): Nested list of partial derivatives (outputs x variables)
+        source (str): Source code of the generated kernels
+    """
+
+    def __init__(self, formulas, variables_str, cse=True, _entry=None):
+        formulas = list(formulas.items()) if isinstance(formulas, dict) else [tuple(item) for item in formulas]
+        self.names = tuple(str(name) for name, _ in formulas)
+        self.formulas = tuple(str(formula) for _, formula in formulas)
+        self.variables = _parse_variables(variables_str)
+        self.symbols = tuple(sp.Symbol(name) for name in self.variables)
+
+        if _entry is not None:
+            self._expressions = _restore_expressions(
+                _entry['expressions'], self.symbols, len(self.names) * (1 + len(self.variables))
+            )
+        else:
+            self._expressions = self._resolve(formulas)
+            for expression in list(self._expressions[:len(self.names)]):
+                self._expressions.extend(expression.diff(symbol) for symbol in self.symbols)
+        self.source = (
+            _build_kernel_source(self._expressions[:len(self.names)], self.symbols, 'value_kernel', cse)
+            + _build_kernel_source(self._expressions, self.symbols, 'kernel', cse)
+        )
+        kernels = _compile_kernels(self.source)
+        self._value_kernel = kernels['value_kernel']
+        self._kernel = kernels['kernel']
+
+    def _resolve(self, formulas):
+        """Parse all formulas and substitute references to other outputs."""
+        overlap = set(self.names) & set(self.variables)
+        if overlap:
+            raise ValueError(f"Output names must differ from variable names: {sorted(overlap)}")
+        output_symbols = {name: sp.Symbol(name) for name in self.names}
+        local_names = dict(zip(self.variables, self.symbols))
+        local_names.update(output_symbols)
+        parsed = {name: sp.sympify(formula, locals=local_names) for name, formula in formulas}
+
+        resolved = {}
+        def resolve(name, path):
+            if name in resolved:
+                return resolved[name]
+            if name in path:
+                raise ValueError(f"Circular reference between outputs: {' -> '.join(path + [name])}")
+            expression = parsed[name]
+            references = {
+                output_symbols[other]: resolve(other, path + [name])
+                for other in self.names if output_symbols[other] in expression.free_symbols
+            }
+            resolved[name] = expression.xreplace(references)
+            return resolved[name]
+
+        return [resolve(name, []) for name in self.names]
+
+    def _symbolic(self):
+        return self._expressions
+
+    @property
+    def expressions(self):
+        return self._symbolic()[:len(self.names)]
+
+    @property
+    def jacobian(self):
+        derivatives = self._symbolic()[len(self.names):]
+        num_variables = len(self.variables)
+        return [derivatives[i * num_variables:(i + 1) * num_variables] for i in range(len(self.names))]
+
+    def _cache_entry(self):
+        return {
+            'version': _CACHE_VERSION,
+            'key': repr(tuple(zip(self.names, self.formulas))),
+            'formulas': [list(item) for item in zip(self.names, self.formulas)],
+            'variables': list(self.variables),
+            'expressions': [_expression_to_tree(expr) for expr in self._symbolic()],
+        }
+
+    @classmethod
+    def _from_cache_entry(cls, entry, options):
+        return cls(entry['formulas'], entry['variables'], _entry=entry, **options)
+
+    def value_and_jacobian(self, measurements):
+        """
+        Evaluate all outputs and their Jacobian for every row.
+
+        Args:
+            measurements (array-like): Values with shape (rows, variables)
+
+        Returns:
+            tuple: Values with shape (rows, outputs) and Jacobian with shape
+                (rows, outputs, variables)
+        """
+        measurements = np.atleast_2d(np.asarray(measurements, dtype=float))
+        if measurements.shape[1] != len(self.variables):
+            raise ValueError(
+                f"Expected {len(self.variables)} values per measurement "
+                f"({' '.join(self.variables)}), got {measurements.shape[1]}"
+            )
+        num_rows = measurements.shape[0]
+        num_outputs = len(self.names)
+
+        outputs = self._kernel(*measurements.T)
+        outputs = np.stack([np.broadcast_to(np.asarray(out, dtype=float), (num_rows,)) for out in outputs], axis=1)
+        values = outputs[:, :num_outputs]
+        jacobian = outputs[:, num_outputs:].reshape(num_rows, num_outputs, len(self.variables))
+        return values, jacobian
+
+    def evaluate(self, measurements):
+        """
+        Evaluate all outputs, without derivatives.
+
+        Args:
+            measurements (array-like): Values with shape (..., variables)
+
+        Returns:
+            np.ndarray: Values with shape (..., outputs)
+        """
+        measurements = np.asarray(measurements, dtype=float)
+        if measurements.ndim == 1:
+            measurements = measurements[None, :]
+        shape = measurements.shape[:-1]
+        outputs = self._value_kernel(*np.moveaxis(measurements, -1, 0))
+        return np.stack([np.broadcast_to(np.asarray(out, dtype=float), shape) for out in outputs], axis=-1)
+
+
+_COMPILED_KINDS = {'formula': CompiledFormula, 'formula_set': CompiledFormulaSet}
+
+
+def _cache_key(kind, formula_key, variables, options):
+    """Build the cache key from kind, formula string, variable order and options."""
+    return (kind, formula_key, variables, tuple(sorted(options.items())))
+
+def _disk_cache_path(directory, key):
+    """Path of the on-disk cache file for a key."""
+    digest = hashlib.sha256(repr((_CACHE_VERSION, key)).encode('utf-8')).hexdigest()
+    return os.path.join(directory, f"formula_{digest[:32]}.json")
+
+def _load_from_disk(directory, key):
+    """Load a compiled formula from the on-disk cache, or None if absent."""
+    path = _disk_cache_path(directory, key)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            entry = json.load(f)
+        if (entry.get('version') != _CACHE_VERSION or entry.get('key') != key[1]
+                or tuple(entry.get('variables', ())) != tuple(key[2])):
+            return None
+        return _COMPILED_KINDS[key[0]]._from_cache_entry(entry, dict(key[3]))
+    except (OSError, ValueError, TypeError, KeyError, IndexError):
+        # Unreadable or foreign entries are rebuilt and overwritten
+        return None
+
+def _store_on_disk(directory, key, compiled):
+    """Write a compiled formula to the on-disk cache."""
+    path = _disk_cache_path(directory, key)
+    try:
+        entry = compiled._cache_entry()
+    except TypeError:
+        return  # e.g. Piecewise, kept in memory only
+    try:
+        os.makedirs(directory, exist_ok=True)
+        # Write to a temporary file first so concurrent runs never read partial files
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f)
+        os.replace(temp_path, path)
+    except OSError as e:
+        print(f"Could not write formula cache: {e}")
+
+def set_formula_cache(maxsize=None, directory=None):
+    """
+    Configure the process-wide formula cache.
+    
+    Args:
+        maxsize (int, optional): Number of compiled formulas kept in memory
+        directory (str, optional): Directory for the on-disk cache, '' to disable it
+    """
+    with _cache_lock:
+        if maxsize is not None:
+            _cache_settings['maxsize'] = max(int(maxsize), 0)
+            while len(_memory_cache) > _cache_settings['maxsize']:
+                _memory_cache.popitem(last=False)
+        if directory is not None:
+            _cache_settings['directory'] = directory or None
+
+def clear_formula_cache(disk=False):
+    """
+    Remove all compiled formulas from the cache.
+    
+    Args:
+        disk (bool): Also delete the files of the on-disk cache
+    """
+    with _cache_lock:
+        _memory_cache.clear()
+        for name in _cache_stats:
+            _cache_stats[name] = 0
+        directory = _cache_settings['directory']
+        if disk and directory and os.path.isdir(directory):
+            for file_name in os.listdir(directory):
+                if file_name.startswith('formula_') and file_name.endswith('.json'):
+                    os.remove(os.path.join(directory, file_name))
+
+def formula_cache_info():
+    """
+    Return statistics about the formula cache.
+    
+    Returns:
+        dict: Hits, disk hits, misses, current size and settings
+    """
+    with _cache_lock:
+        info = dict(_cache_stats)
+        info['size'] = len(_memory_cache)
+        info.update(_cache_settings)
+        return info
+
+def _compile_cached(kind, formula_key, variables, options, build):
+    """
+    Look up a compiled object in the memory and disk caches or build it.
+
+    Args:
+        kind (str): Name of the compiled class, see _COMPILED_KINDS
+        formula_key (str): Canonical string of the formula(s)
+        variables (tuple): Variable names
+        options (dict): Compilation options
+        build (function): Creates the compiled object on a cache miss
+
+    Returns:
+        object: The compiled object
+    """
+    key = _cache_key(kind, formula_key, variables, options)
+    with _cache_lock:
+        compiled = _memory_cache.get(key)
+        if compiled is not None:
+            _memory_cache.move_to_end(key)
+            _cache_stats['hits'] += 1
+            return compiled
+        directory = _cache_settings['directory']
+
+    compiled = _load_from_disk(directory, key) if directory else None
+    if compiled is not None:
+        stat = 'disk_hits'
+    else:
+        stat = 'misses'
+        compiled = build()
+        if directory:
+            _store_on_disk(directory, key, compiled)
+
+    with _cache_lock:
+        _cache_stats[stat] += 1
+        if _cache_settings['maxsize'] > 0:
+            _memory_cache[key] = compiled
+            while len(_memory_cache) > _cache_settings['maxsize']:
+                _memory_cache.popitem(last=False)
+    return compiled
+
+def compile_formula(formula_str, variables_str, **options):
+    """
+    Parse, differentiate and compile a formula, using the process-wide cache.
+
+    Compiled formulas are cached in memory (LRU) keyed by the formula string,
+    the variable order and the options. If a cache directory is configured with
+    set_formula_cache, the differentiated expressions are also persisted across
+    runs, as JSON trees of SymPy node types that are checked on loading; the
+    cache files never contain code that is executed.
+
+    Args:
+        formula_str (str or sp.Expr): Mathematical formula
+        variables_str (str or list): Variables in the formula as space-separated string
+        **options: Compilation options, part of the cache key
+
+    Returns:
+        CompiledFormula: The compiled formula
+    """
+    if isinstance(formula_str, CompiledFormula):
+        return formula_str
+
+    variables = _parse_variables(variables_str)
+    return _compile_cached(
+        'formula', str(formula_str), variables, options,
+        lambda: CompiledFormula(formula_str, variables, **options),
+    )
+
+def compile_formulas(formulas, variables_str, **options):
+    """
+    Compile several named formulas over the same variables into one kernel.
+
+    Formulas may reference other outputs by name, e.g.
+    {'P_max': 'U_mp * I_mp', 'FF': 'P_max / (U_oc * I_sc)'}.
+
+    Args:
+        formulas (dict or list): Mapping of output name to formula, or a list of
+            formulas which are named f0, f1, ...
+        variables_str (str or list): Variables as space-separated string
+        **options: Compilation options, part of the cache key
+
+    Returns:
+        CompiledFormulaSet: The compiled formulas
+    """
+    if isinstance(formulas, CompiledFormulaSet):
+        return formulas
+    if isinstance(formulas, dict):
+        items = tuple((str(name), str(formula)) for name, formula in formulas.items())
+    else:
+        items = tuple((f'f{i}', str(formula)) for i, formula in enumerate(formulas))
+
+    variables = _parse_variables(variables_str)
+    return _compile_cached(
+        'formula_set', repr(items), variables, options,
+        lambda: CompiledFormulaSet(items, variables, **options),
+    )
@@ -0,0 +1,192 @@
+import numpy as np
+
+
+class ReadingSpec:
+    """
+    Accuracy specification of the form '± (percent of reading + digits) + offset'.
+
+    Attributes:
+        uncertainty_percent (float): Relative part (e.g., 0.01 for 1%)
+        resolution (float): Value of one digit
+        plus_term (float): Number of digits added (e.g., 3 for '+3 digits')
+        offset (float): Constant absolute part
+    """
+
+    def __init__(self, uncertainty_percent=0.0, resolution=0.0, plus_term=0, offset=0.0):
+        self.uncertainty_percent = uncertainty_percent
+        self.resolution = resolution
+        self.plus_term = plus_term
+        self.offset = offset
+
+    def uncertainty(self, values):
+        """
+        Calculate the uncertainty for all values.
+
+        Args:
+            values (array-like): Measured values
+
+        Returns:
+            np.ndarray: Uncertainties with the shape of values
+        """
+        values = np.asarray(values, dtype=float)
+        return np.abs(values) * self.uncertainty_percent + self.resolution * self.plus_term + self.offset
+
+    __call__ = uncertainty
+
+    def __repr__(self):
+        return (f"{type(self).__name__}(uncertainty_percent={self.uncertainty_percent}, "
+                f"resolution={self.resolution}, plus_term={self.plus_term}, offset={self.offset})")
+
+
+class Multimeter:
+    """
+    Multimeter with range-dependent accuracy specifications.
+
+    The range is selected automatically for every value as the smallest range
+    whose full scale covers it, like an auto-ranging meter. Values above the
+    largest range get NaN (overload).
+
+    Attributes:
+        ranges (list): (full_scale, ReadingSpec) tuples sorted by full scale
+    """
+
+    def __init__(self, ranges):
+        """
+        Args:
+            ranges (list): (full_scale, uncertainty_percent, resolution, plus_term) tuples
+        """
+        self.ranges = sorted(
+            ((full_scale, ReadingSpec(percent, resolution, plus_term))
+             for full_scale, percent, resolution, plus_term in ranges),
+            key=lambda item: item[0],
+        )
+        self._full_scales = np.array([full_scale for full_scale, _ in self.ranges])
+        self._percent = np.array([spec.uncertainty_percent for _, spec in self.ranges] + [np.nan])
+        self._digit = np.array([spec.resolution * spec.plus_term for _, spec in self.ranges] + [np.nan])
+
+    def select_range(self, values):
+        """
+        Select the measurement range for all values.
+
+        Args:
+            values (array-like): Measured values
+
+        Returns:
+            np.ndarray: Range index per value, len(ranges) for overload
+        """
+        return np.searchsorted(self._full_scales, np.abs(np.asarray(values, dtype=float)), side='left')
+
+    def uncertainty(self, values, full_scale=None):
+        """
+        Calculate the uncertainty for all values.
+
+        Args:
+            values (array-like): Measured values
+            full_scale (float, optional): Use this fixed range instead of auto-ranging
+
+        Returns:
+            np.ndarray: Uncertainties with the shape of values
+        """
+        values = np.asarray(values, dtype=float)
+        if full_scale is not None:
+            index = np.searchsorted(self._full_scales, full_scale, side='left')
+            if index == len(self.ranges) or self._full_scales[index] != full_scale:
+                raise ValueError(f"Unknown range {full_scale}, available: {self._full_scales.tolist()}")
+            index = np.where(np.abs(values) <= full_scale, index, len(self.ranges))
+        else:
+            index = self.select_range(values)
+        return np.abs(values) * self._percent[index] + self._digit[index]
+
+    __call__ = uncertainty
+
+    def __repr__(self):
+        return f"Multimeter(ranges={self.ranges!r})"
+
+
+class Caliper(ReadingSpec):
+    """
+    Caliper or micrometer: one division of reading error plus the stated accuracy.
+    """
+
+    def __init__(self, resolution, accuracy=0.0):
+        super().__init__(0.0, resolution, 1, accuracy)
+
+
+class Stopwatch(ReadingSpec):
+    """
+    Hand-operated stopwatch: reaction time, display resolution and clock rate error.
+    """
+
+    def __init__(self, resolution=0.01, reaction_time=0.2, rate_error=0.0):
+        super().__init__(rate_error, resolution, 1, reaction_time)
+
+
+class Thermometer(ReadingSpec):
+    """
+    Digital or logging thermometer with '± (percent of reading + digits)' accuracy.
+    """
+
+    def __init__(self, uncertainty_percent, resolution, plus_term, offset=0.0):
+        super().__init__(uncertainty_percent, resolution, plus_term, offset)
+
+
+INSTRUMENTS = {}
+
+
+def register_instrument(name, model):
+    """
+    Add an instrument model to the registry.
+
+    Args:
+        name (str): Name used to look up the model
+        model (object): Model with an uncertainty(values) method
+    """
+    INSTRUMENTS[name] = model
+
+def get_instrument(name):
+    """
+    Look up a registered instrument model.
+
+    Args:
+        name (str): Name of the instrument
+
+    Returns:
+        object: The instrument model
+    """
+    try:
+        return INSTRUMENTS[name]
+    except KeyError:
+        raise KeyError(f"Unknown instrument '{name}', available: {sorted(INSTRUMENTS)}") from None
+
+def instrument_uncertainty(name, values, **kwargs):
+    """
+    Calculate uncertainties of an array of readings with a registered instrument.
+
+    Args:
+        name (str): Name of the instrument
+        values (array-like): Measured values
+        **kwargs: Additional arguments for the model, e.g. full_scale
+
+    Returns:
+        np.ndarray: Uncertainties ready for error propagation
+    """
+    return get_instrument(name).uncertainty(values, **kwargs)
+
+
+# Typical 4000-count handheld multimeter, DC voltage (1% + 3 digits as in PW8)
+register_instrument('multimeter_dc_voltage', Multimeter([
+    (0.4, 0.01, 0.0001, 3),
+    (4.0, 0.01, 0.001, 3),
+    (40.0, 0.01, 0.01, 3),
+    (400.0, 0.01, 0.1, 3),
+]))
+register_instrument('multimeter_dc_current', Multimeter([
+    (0.004, 0.015, 0.000001, 3),
+    (0.4, 0.015, 0.0001, 3),
+    (10.0, 0.025, 0.01, 5),
+]))
+# Temperature logger of PW10 (1.2% + 3 digits at 0.1 °C)
+register_instrument('logger_thermometer', Thermometer(0.012, 0.1, 3))
+register_instrument('caliper', Caliper(0.05e-3))
+register_instrument('micrometer', Caliper(0.01e-3))
+register_instrument('stopwatch', Stopwatch())
@@ -0,0 +1,273 @@
+import numpy as np
+
+from .fitting import estimate_peak
+from .regression import linear_regression
+
+
+class Model:
+    """
+    Fit model with vectorized value and analytic Jacobian.
+
+    Models are callable like the usual curve_fit models, f(x, *params), and
+    provide the Jacobian for the jac argument of curve_fit, so they can be
+    passed wherever a custom fit function is accepted, or referenced by name
+    (see get_model).
+
+    Attributes:
+        name (str): Name in the registry
+        parameters (tuple): Parameter names in argument order
+        units (tuple): Unit of every parameter in terms of the x and y units
+        bounds (list): Physical (low, high) limits of every parameter, enforced in fits
+        roles (tuple): 'position', 'width' or None per parameter, for search_bounds
+        description (str): Formula of the model
+    """
+
+    def __init__(self, name, function, jacobian, parameters, units, bounds, guess, description='',
+                 roles=None):
+        """
+        Args:
+            name (str): Name in the registry
+            function (function): Value f(x, *params)
+            jacobian (function): Partial derivatives, list of arrays or scalars per parameter
+            parameters (list): Parameter names
+            units (list): Unit of every parameter, e.g. '[y]/[x]'
+            bounds (list): Physical (low, high) limits, ±np.inf if unbounded
+            guess (function): Starting values from the data, guess(x, y)
+            description (str): Formula of the model
+            roles (list, optional): 'position' for peak positions on the x axis,
+                'width' for peak widths, None for other parameters
+        """
+        self.name = name
+        self._function = function
+        self._jacobian = jacobian
+        self.parameters = tuple(parameters)
+        self.units = tuple(units)
+        self.bounds = [tuple(bound) for bound in bounds]
+        self._guess = guess
+        self.description = description
+        self.roles = tuple(roles) if roles is not None else (None,) * len(self.parameters)
+
+    def __repr__(self):
+        return f"Model({self.name!r}, parameters={self.parameters})"
+
+    def __reduce__(self):
+        # Worker processes look the model up in their own registry
+        return (get_model, (self.name,))
+
+    def __call__(self, x_data, *params):
+        return self._function(np.asarray(x_data, dtype=float), *params)
+
+    def jacobian(self, x_data, *params):
+        """
+        Partial derivatives with respect to the parameters.
+
+        Returns:
+            np.ndarray: Jacobian with shape (len(x_data), parameters)
+        """
+        x_data = np.asarray(x_data, dtype=float)
+        columns = self._jacobian(x_data, *params)
+        return np.stack([np.broadcast_to(column, x_data.shape) for column in columns], axis=-1)
+
+    def initial_guess(self, x_data, y_data):
+        """
+        Starting values estimated from the data.
+
+        Returns:
+            np.ndarray: One value per parameter, within the bounds
+        """
+        order = np.argsort(x_data)
+        guess = np.asarray(self._guess(np.asarray(x_data, dtype=float)[order],
+                                       np.asarray(y_data, dtype=float)[order]), dtype=float)
+        low, high = np.array(self.bounds, dtype=float).T
+        return np.clip(guess, low, high)
+
+    def search_bounds(self, x_data, y_data, factor=10.0, width_factor=3.0):
+        """
+        Box around the initial guess for multi-start fits (see fitting.multi_start_fit).
+
+        Peak positions are searched within the x range of the data and peak
+        widths within width_factor of their estimate. Other parameters limited
+        to positive values vary by the given factor in both directions, the
+        rest by factor times their magnitude.
+
+        Returns:
+            list: (low, high) per parameter
+        """
+        guess = self.initial_guess(x_data, y_data)
+        box = []
+        for value, (low, high), role in zip(guess, self.bounds, self.roles):
+            if role == 'position':
+                lower, upper = np.min(x_data), np.max(x_data)
+            elif role == 'width' and value > 0:
+                lower, upper = value / width_factor, value * width_factor
+            elif low >= 0 and value > 0:
+                lower, upper = value / factor, value * factor
+            else:
+                spread = factor * abs(value) or 1.0
+                lower, upper = value - spread, value + spread
+            box.append((max(lower, low), min(upper, high)))
+        return box
+
+
+MODELS = {}
+
+
+def register_model(model):
+    """
+    Add a model to the registry.
+
+    Args:
+        model (Model): Model to register under its name
+    """
+    MODELS[model.name] = model
+
+def get_model(name):
+    """
+    Look up a registered model.
+
+    Args:
+        name (str): Name of the model
+
+    Returns:
+        Model: The model
+    """
+    try:
+        return MODELS[name]
+    except KeyError:
+        raise KeyError(f"Unknown model '{name}', available: {sorted(MODELS)}") from None
+
+
+def _log_linear_guess(x_data, y_data):
+    """Slope and intercept of log|y| against x, for exponential starting values."""
+    mask = y_data != 0
+    line = linear_regression(x_data[mask], np.log(np.abs(y_data[mask])))
+    return line['slope'], line['intercept']
+
+def _exponential_decay_guess(x_data, y_data):
+    num_edge = max(1, len(y_data) // 10)
+    offset = np.median(y_data[-num_edge:])
+    amplitude = np.median(y_data[:num_edge]) - offset
+    # Use the part clearly above the offset for the decay constant
+    mask = np.sign(amplitude) * (y_data - offset) > 0.1 * abs(amplitude)
+    tau = np.ptp(x_data) / 3
+    if np.count_nonzero(mask) > 2:
+        slope, _ = _log_linear_guess(x_data[mask], y_data[mask] - offset)
+        if slope < 0:
+            tau = -1 / slope
+    return [amplitude * np.exp(x_data[0] / tau), tau, offset]
+
+def _exponential_guess(x_data, y_data):
+    rate, intercept = _log_linear_guess(x_data, y_data)
+    return [np.sign(np.median(y_data)) * np.exp(intercept), rate]
+
+def _power_law_guess(x_data, y_data):
+    mask = (x_data > 0) & (y_data != 0)
+    line = linear_regression(np.log(x_data[mask]), np.log(np.abs(y_data[mask])))
+    return [np.sign(np.median(y_data)) * np.exp(line['intercept']), line['slope']]
+
+def _gaussian_guess(x_data, y_data):
+    peak = estimate_peak(x_data, y_data)
+    return [peak['amplitude'], peak['position'], peak['fwhm'] / (2 * np.sqrt(2 * np.log(2))), peak['baseline']]
+
+def _lorentzian_guess(x_data, y_data):
+    peak = estimate_peak(x_data, y_data)
+    return [peak['amplitude'], peak['position'], peak['fwhm'] / 2, peak['baseline']]
+
+def _driven_oscillator_guess(x_data, y_data):
+    # The amplitude ratio peaks near ω0 with height about ω0 / (2δ)
+    peak = estimate_peak(x_data, y_data, edge_fraction=0.05)
+    omega_0 = peak['position']
+    return [omega_0, omega_0 / (2 * np.max(y_data))]
+
+def _driven_oscillator_jacobian(omega, omega_0, delta):
+    root = np.sqrt((omega_0**2 - omega**2)**2 + 4 * delta**2 * omega**2)
+    return [
+        2 * omega_0 / root - 2 * omega_0**3 * (omega_0**2 - omega**2) / root**3,
+        -4 * omega_0**2 * delta * omega**2 / root**3,
+    ]
+
+def _lorentzian_jacobian(x, A, x0, gamma, c):
+    denominator = (x - x0)**2 + gamma**2
+    return [
+        gamma**2 / denominator,
+        2 * A * gamma**2 * (x - x0) / denominator**2,
+        2 * A * gamma * (x - x0)**2 / denominator**2,
+        1.0,
+    ]
+
+def _gaussian_jacobian(x, A, mu, sigma, c):
+    g = np.exp(-(x - mu)**2 / (2 * sigma**2))
+    return [g, A * g * (x - mu) / sigma**2, A * g * (x - mu)**2 / sigma**3, 1.0]
+
+def _exponential_decay_jacobian(x, A, tau, c):
+    e = np.exp(-x / tau)
+    return [e, A * e * x / tau**2, 1.0]
+
+
+_UNBOUNDED = (-np.inf, np.inf)
+_POSITIVE = (0.0, np.inf)
+
+register_model(Model(
+    'linear', lambda x, a, b: a * x + b, lambda x, a, b: [x, 1.0],
+    ['a', 'b'], ['[y]/[x]', '[y]'], [_UNBOUNDED, _UNBOUNDED],
+    lambda x, y: [linear_regression(x, y)[key] for key in ('slope', 'intercept')],
+    'a * x + b',
+))
+register_model(Model(
+    'proportional', lambda x, a: a * x, lambda x, a: [x],
+    ['a'], ['[y]/[x]'], [_UNBOUNDED],
+    lambda x, y: [np.dot(x, y) / np.dot(x, x)],
+    'a * x',
+))
+# Boyle-Mariotte p = A / V
+register_model(Model(
+    'inverse', lambda x, A: A / x, lambda x, A: [1 / x],
+    ['A'], ['[y]*[x]'], [_UNBOUNDED],
+    lambda x, y: [np.sum(y / x) / np.sum(1 / x**2)],
+    'A / x',
+))
+register_model(Model(
+    'exponential', lambda x, A, k: A * np.exp(k * x),
+    lambda x, A, k: [np.exp(k * x), A * x * np.exp(k * x)],
+    ['A', 'k'], ['[y]', '1/[x]'], [_UNBOUNDED, _UNBOUNDED],
+    _exponential_guess,
+    'A * exp(k * x)',
+))
+register_model(Model(
+    'exponential_decay', lambda x, A, tau, c: A * np.exp(-x / tau) + c, _exponential_decay_jacobian,
+    ['A', 'tau', 'c'], ['[y]', '[x]', '[y]'], [_UNBOUNDED, _POSITIVE, _UNBOUNDED],
+    _exponential_decay_guess,
+    'A * exp(-x / tau) + c',
+))
+register_model(Model(
+    'power_law', lambda x, A, n: A * x**n,
+    lambda x, A, n: [x**n, A * x**n * np.log(x)],
+    ['A', 'n'], ['[y]/[x]^n', '1'], [_UNBOUNDED, _UNBOUNDED],
+    _power_law_guess,
+    'A * x**n',
+))
+register_model(Model(
+    'gaussian', lambda x, A, mu, sigma, c: A * np.exp(-(x - mu)**2 / (2 * sigma**2)) + c, _gaussian_jacobian,
+    ['A', 'mu', 'sigma', 'c'], ['[y]', '[x]', '[x]', '[y]'], [_UNBOUNDED, _UNBOUNDED, _POSITIVE, _UNBOUNDED],
+    _gaussian_guess,
+    'A * exp(-(x - mu)**2 / (2 * sigma**2)) + c',
+    roles=[None, 'position', 'width', None],
+))
+# Resonance peak (PW11)
+register_model(Model(
+    'lorentzian', lambda x, A, x0, gamma, c: A * gamma**2 / ((x - x0)**2 + gamma**2) + c, _lorentzian_jacobian,
+    ['A', 'x0', 'gamma', 'c'], ['[y]', '[x]', '[x]', '[y]'], [_UNBOUNDED, _UNBOUNDED, _POSITIVE, _UNBOUNDED],
+    _lorentzian_guess,
+    'A * gamma**2 / ((x - x0)**2 + gamma**2) + c',
+    roles=[None, 'position', 'width', None],
+))
+# Amplitude ratio of the driven damped oscillator (PW8, PW11)
+register_model(Model(
+    'driven_oscillator',
+    lambda omega, omega_0, delta: omega_0**2 / np.sqrt((omega_0**2 - omega**2)**2 + 4 * delta**2 * omega**2),
+    _driven_oscillator_jacobian,
+    ['omega_0', 'delta'], ['[x]', '[x]'], [_POSITIVE, _POSITIVE],
+    _driven_oscillator_guess,
+    'omega_0**2 / sqrt((omega_0**2 - omega**2)**2 + 4 * delta**2 * omega**2)',
+    roles=['position', 'width'],
+))
@@ -1,5 +1,6 @@
 import os
 from .utils import write_to_file, format_scientific_error
+from .uarray import UArray
 
 def save_results(file_path, measurement_nums, results, errors, variables_dict, 
                result_name, result_unit, significant_digits=2):
@@ -9,13 +10,19 @@ def save_results(file_path, measurement_nums, results, errors, variables_dict,
     Args:
         file_path (str): Path to the output file
         measurement_nums (list): List of measurement numbers
-        results (list): List of calculated results
-        errors (list): List of calculated errors
+        results (list or UArray): List of calculated results
+        errors (list): List of calculated errors, taken from results.sigma
+            if results is a UArray and errors is None
         variables_dict (dict): Dictionary of variables and their values
         result_name (str): Name of the result
         result_unit (str): Unit of the result
         significant_digits (int): Number of significant digits
     """
+    if isinstance(results, UArray):
+        if errors is None:
+            errors = results.sigma
+        results = results.value
+    
     with open(file_path, 'a', encoding='utf-8') as f:
         # Write variables and their values
         f.write("Variables and values used:\n")
@@ -62,6 +69,24 @@ def save_results(file_path, measurement_nums, results, errors, variables_dict,
             f.write(f"\t{result_name} &= \\SI{{{results[0]:.{significant_digits}g}({errors[0]:.{significant_digits}g})}}{{\\{result_unit}}}\n")
             f.write("\\end{align*}\n\n")
 
+def save_error_budget(file_path, budget, significant_digits=2):
+    """
+    Save the summary of an error budget to a file.
+    
+    Args:
+        file_path (str): Path to the output file
+        budget (dict): Result of calculation.error_budget
+        significant_digits (int): Number of significant digits
+    """
+    text = "Error Budget:\n\n"
+    text += f"{'Variable':<15}{'Variance share':<20}{'Mean share':<20}{'Max share':<20}{'Dominant rows':<15}\n"
+    for name, entry in budget['summary'].items():
+        text += (f"{name:<15}{entry['variance_share']:<20.{significant_digits}g}"
+                 f"{entry['mean_share']:<20.{significant_digits}g}"
+                 f"{entry['max_share']:<20.{significant_digits}g}{entry['dominant_rows']:<15}\n")
+    
+    write_to_file(file_path, text)
+
 def save_fit_results(file_path, coefficients, coeff_errors, r_squared, 
                    significant_digits=2, result_unit=""):
     """
@@ -1,6 +1,12 @@
 import numpy as np
 import matplotlib.pyplot as plt
-from scipy.optimize import curve_fit
+
+from .fitting import (
+    _curve_fit, cached_fit, compile_model, fit_cache_key, fit_with_x_errors,
+    invalidate_fit_cache, multi_start_fit, resample_fit,
+)
+from .regression import linear_regression
+from .uarray import UArray
 
 def plot_data_with_errors(x_data, y_data, y_errors=None, x_errors=None, 
                          style='bo', label='Measurements', capsize=5):
@@ -8,14 +14,23 @@ def plot_data_with_errors(x_data, y_data, y_errors=None, x_errors=None,
     Plot data points with optional error bars.
     
     Args:
-        x_data (np.ndarray): X-axis data
-        y_data (np.ndarray): Y-axis data
+        x_data (np.ndarray or UArray): X-axis data
+        y_data (np.ndarray or UArray): Y-axis data
         y_errors (np.ndarray, optional): Y-axis errors
         x_errors (np.ndarray, optional): X-axis errors
         style (str): Plot style
         label (str): Label for the legend
         capsize (int): Size of error bar caps
     """
+    if isinstance(x_data, UArray):
+        if x_errors is None:
+            x_errors = x_data.sigma
+        x_data = x_data.value
+    if isinstance(y_data, UArray):
+        if y_errors is None:
+            y_errors = y_data.sigma
+        y_data = y_data.value
+    
     if y_errors is not None or x_errors is not None:
         plt.errorbar(x_data, y_data, yerr=y_errors, xerr=x_errors, 
                     fmt=style, label=label, capsize=capsize)
@@ -25,26 +40,58 @@ def plot_data_with_errors(x_data, y_data, y_errors=None, x_errors=None,
 def generate_fit_data(x_data, y_data, fit_type='linear', degree=1, 
                      start_idx=None, end_idx=None, y_errors=None, 
                      custom_fit_func=None, initial_guess=None, style='r-', 
-                     label=None):
+                     label=None, x_errors=None, error_method='covariance', bounds=None,
+                     seed=None, cache=True):
     """
     Generate fit curve data and compute fit coefficients.
     
     Args:
-        x_data (np.ndarray): X-axis data
-        y_data (np.ndarray): Y-axis data
+        x_data (np.ndarray or UArray): X-axis data, its sigma is used as
+            x_errors if none are given
+        y_data (np.ndarray or UArray): Y-axis data, its sigma is used as
+            y_errors if none are given
         fit_type (str): 'linear', 'polynomial', or 'custom'
         degree (int): Degree of polynomial fit
         start_idx (int, optional): Start index for fit range
         end_idx (int, optional): End index for fit range
         y_errors (np.ndarray, optional): Y-axis errors
-        custom_fit_func (function, optional): Custom fit function
+        custom_fit_func (function or str, optional): Custom fit function, the
+            name of a pylab.models model (e.g. 'lorentzian', initial_guess is
+            then optional) or a model string such as
+            "lambda x, a, b: a * np.exp(-b * x)" which is compiled with an
+            analytic Jacobian
         initial_guess (list, optional): Initial guess for curve_fit
         style (str): Plot style
         label (str, optional): Label for the legend
+        x_errors (np.ndarray, optional): X-axis errors; if any are non-zero the
+            fit accounts for them with the effective variance method
+        error_method (str): 'covariance' for the errors of the fit covariance,
+            'bootstrap' or 'jackknife' to estimate them by refitting resampled
+            data (see fitting.resample_fit), for small or non-Gaussian datasets
+        bounds (list or str, optional): (low, high) per parameter of a custom fit;
+            the start value is then found by a multi-start search over this box
+            (see fitting.multi_start_fit), including initial_guess if given.
+            'auto' uses the search box of a pylab.models model
+        seed (int, optional): Random seed of the multi-start search and of
+            bootstrap errors, for reproducible results
+        cache (bool or str): Reuse the result of an earlier fit of the same
+            data, range, model and options from the fit cache, also from
+            earlier runs once a cache directory is set (see
+            fitting.set_fit_cache); 'refresh' to refit and replace the stored result
         
     Returns:
         tuple: fit coefficients, coefficient errors, R²
     """
+    # Split uncertain arrays into values and errors
+    if isinstance(x_data, UArray):
+        if x_errors is None:
+            x_errors = x_data.sigma
+        x_data = x_data.value
+    if isinstance(y_data, UArray):
+        if y_errors is None:
+            y_errors = y_data.sigma
+        y_data = y_data.value
+    
     # Extract data range for fitting
     if start_idx is not None and end_idx is not None:
         fit_x = x_data[start_idx:end_idx]
@@ -53,33 +100,100 @@ def generate_fit_data(x_data, y_data, fit_type='linear', degree=1,
             fit_y_errors = y_errors[start_idx:end_idx]
         else:
             fit_y_errors = None
+        if x_errors is not None:
+            fit_x_errors = np.broadcast_to(x_errors, np.shape(x_data))[start_idx:end_idx]
+        else:
+            fit_x_errors = None
     else:
         fit_x = x_data
         fit_y = y_data
         fit_y_errors = y_errors
+        fit_x_errors = x_errors
+    
+    custom = fit_type == 'custom' and custom_fit_func is not None
+    if custom:
+        custom_fit_func = compile_model(custom_fit_func)
+        if isinstance(bounds, str) and bounds == 'auto':
+            bounds = custom_fit_func.search_bounds(fit_x, fit_y)
     
-    # Perform fit based on type
-    if fit_type == 'custom' and custom_fit_func is not None:
-        if initial_guess is not None:
-            coefficients, cov_matrix = curve_fit(
-                custom_fit_func, fit_x, fit_y, p0=initial_guess, sigma=fit_y_errors
+    def fit():
+        guess = initial_guess
+        if custom and bounds is not None:
+            guess = multi_start_fit(
+                fit_x, fit_y, custom_fit_func, bounds, fit_y_errors, guess, seed=seed
+            )['coefficients']
+        
+        # Errors in both variables: effective variance fit, otherwise the usual fits
+        if fit_x_errors is not None and np.any(np.asarray(fit_x_errors) > 0):
+            result = fit_with_x_errors(
+                fit_x, fit_y, fit_x_errors, fit_y_errors, fit_type=fit_type, degree=degree,
+                custom_fit_func=custom_fit_func, initial_guess=guess, absolute_sigma=False
             )
-        else:
-            coefficients, cov_matrix = curve_fit(
-                custom_fit_func, fit_x, fit_y, sigma=fit_y_errors
+            coefficients, cov_matrix = result['coefficients'], result['cov_matrix']
+        elif custom:
+            coefficients, cov_matrix = _curve_fit(
+                custom_fit_func, fit_x, fit_y, p0=guess, sigma=fit_y_errors
             )
+        elif degree == 1:  # straight line in closed form, same result as np.polyfit
+            line = linear_regression(fit_x, fit_y)
+            coefficients = np.array([line['slope'], line['intercept']])
+            cov_matrix = line['cov_matrix']
+        else:  # polynomial fit
+            coefficients, cov_matrix = np.polyfit(fit_x, fit_y, degree, cov=True)
+        
+        # Calculate R²
+        if custom:
+            residuals = fit_y - custom_fit_func(fit_x, *coefficients)
+        else:
+            residuals = fit_y - np.polyval(coefficients, fit_x)
+        ss_res = np.sum(residuals**2)
+        ss_tot = np.sum((fit_y - np.mean(fit_y))**2)
+        r_squared = 1 - (ss_res / ss_tot)
+        
+        # Coefficient errors
+        if error_method == 'covariance':
+            coeff_errors = np.sqrt(np.diag(cov_matrix))
+        else:
+            coeff_errors = resample_fit(
+                fit_x, fit_y, fit_y_errors if custom else None, fit_type=fit_type, degree=degree,
+                custom_fit_func=custom_fit_func, initial_guess=coefficients, method=error_method,
+                seed=seed
+            )['errors']
+        return {
+            'coefficients': coefficients,
+            'cov_matrix': cov_matrix,
+            'coeff_errors': coeff_errors,
+            'r_squared': r_squared,
+        }
+    
+    # Reuse the result of an identical earlier fit, e.g. when only the plot changed
+    key = None
+    if cache:
+        key = fit_cache_key(
+            [fit_x, fit_y, fit_y_errors, fit_x_errors], custom_fit_func if custom else None,
+            fit_type=fit_type, degree=degree, start_idx=start_idx, end_idx=end_idx,
+            initial_guess=None if initial_guess is None else np.asarray(initial_guess, dtype=float),
+            bounds=None if bounds is None else np.asarray(bounds, dtype=float),
+            error_method=error_method, seed=seed,
+        )
+        if key is not None and cache == 'refresh':
+            invalidate_fit_cache(key)
+    result = cached_fit(key, fit)
+    coefficients = result['coefficients']
+    coeff_errors = result['coeff_errors']
+    r_squared = result['r_squared']
+    
+    if custom:
         x_fit = np.linspace(min(fit_x), max(fit_x), 1000)
         y_fit = custom_fit_func(x_fit, *coefficients)
-        residuals = fit_y - custom_fit_func(fit_x, *coefficients)
         
         if label is None:
             label = 'Custom Fit'
         
-    else:  # polynomial fit (including linear)
-        coefficients, cov_matrix = np.polyfit(fit_x, fit_y, degree, cov=True)
-        x_fit = np.linspace(min(fit_x), max(fit_x), 1000)
+    else:
+        # A straight line only needs its end points
+        x_fit = np.linspace(min(fit_x), max(fit_x), 2 if degree == 1 else 1000)
         y_fit = np.polyval(coefficients, x_fit)
-        residuals = fit_y - np.polyval(coefficients, fit_x)
         
         if label is None:
             if degree == 1:
@@ -87,14 +201,6 @@ def generate_fit_data(x_data, y_data, fit_type='linear', degree=1,
             else:
                 label = f'Polynomial Fit (degree {degree})'
     
-    # Calculate R²
-    ss_res = np.sum(residuals**2)
-    ss_tot = np.sum((fit_y - np.mean(fit_y))**2)
-    r_squared = 1 - (ss_res / ss_tot)
-    
-    # Coefficient errors
-    coeff_errors = np.sqrt(np.diag(cov_matrix))
-    
     # Plot the fit curve
     plt.plot(x_fit, y_fit, style, label=label)
     
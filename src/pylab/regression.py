@@ -0,0 +1,538 @@
+from math import comb
+
+import numpy as np
+
+from .fitting import _unstandardise
+
+
+def _line_from_moments(count, sum_of_weights, mean_x, mean_y, sxx, sxy, syy, absolute_sigma=False):
+    """
+    Straight line fit from weighted, centred moments.
+
+    Works element-wise, so the moments of many segments can be passed as arrays.
+
+    Args:
+        count: Number of points
+        sum_of_weights: Σw
+        mean_x, mean_y: Weighted means of x and y
+        sxx, sxy, syy: Σw (x - mean_x)², Σw (x - mean_x)(y - mean_y), Σw (y - mean_y)²
+        absolute_sigma (bool): Use the errors as absolute uncertainties; otherwise
+            the covariance is scaled with the reduced χ² like np.polyfit
+
+    Returns:
+        dict: Fit results, see linear_regression
+    """
+    with np.errstate(invalid='ignore', divide='ignore'):
+        slope = sxy / sxx
+        intercept = mean_y - slope * mean_x
+        chi_squared = np.maximum(syy - slope * sxy, 0.0)
+        dof = np.maximum(np.asarray(count) - 2, 1)
+        scale = 1.0 if absolute_sigma else chi_squared / dof
+
+        slope_variance = scale / sxx
+        intercept_variance = scale * (1 / sum_of_weights + mean_x**2 / sxx)
+        covariance = -scale * mean_x / sxx
+        r_squared = 1 - chi_squared / syy
+
+    # Same parameter order as np.polyfit: slope, intercept
+    cov_matrix = np.stack([
+        np.stack([slope_variance, covariance], axis=-1),
+        np.stack([covariance, intercept_variance], axis=-1),
+    ], axis=-2)
+    return {
+        'slope': slope,
+        'intercept': intercept,
+        'slope_error': np.sqrt(slope_variance),
+        'intercept_error': np.sqrt(intercept_variance),
+        'cov_matrix': cov_matrix,
+        'r_squared': r_squared,
+        'chi_squared': chi_squared,
+        'reduced_chi_squared': chi_squared / dof,
+        'count': count,
+    }
+
+def _chunk_moments(x_data, y_data, y_errors):
+    """Weighted, centred moments of one chunk of points."""
+    x_data = np.ravel(np.asarray(x_data, dtype=float))
+    y_data = np.ravel(np.asarray(y_data, dtype=float))
+    if y_errors is None:
+        weights = np.ones_like(x_data)
+    else:
+        weights = 1 / np.broadcast_to(np.asarray(y_errors, dtype=float), x_data.shape)**2
+
+    sum_of_weights = np.sum(weights)
+    mean_x = np.dot(weights, x_data) / sum_of_weights
+    mean_y = np.dot(weights, y_data) / sum_of_weights
+    dx = x_data - mean_x
+    dy = y_data - mean_y
+    weighted_dx = weights * dx
+    return (x_data.size, sum_of_weights, mean_x, mean_y,
+            np.dot(weighted_dx, dx), np.dot(weighted_dx, dy), np.dot(weights * dy, dy))
+
+
+class LinearRegressionAccumulator:
+    """
+    Streaming weighted straight line fit y = slope * x + intercept.
+
+    Points are added in chunks with update and partial fits of several
+    workers or files are combined with merge, without keeping the inputs.
+    Only the weighted means and centred second moments are stored; they are
+    combined with the pairwise update of Chan et al., which stays accurate
+    for large offsets such as timestamps.
+
+    Attributes:
+        count (int): Number of points
+        sum_of_weights (float): Σw with w = 1/σ² (1 without errors)
+        mean_x (float): Weighted mean of x
+        mean_y (float): Weighted mean of y
+        sxx (float): Σw (x - mean_x)²
+        sxy (float): Σw (x - mean_x)(y - mean_y)
+        syy (float): Σw (y - mean_y)²
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.sum_of_weights = 0.0
+        self.mean_x = np.nan
+        self.mean_y = np.nan
+        self.sxx = 0.0
+        self.sxy = 0.0
+        self.syy = 0.0
+
+    def _combine(self, count, sum_of_weights, mean_x, mean_y, sxx, sxy, syy):
+        """Combine the moments of another sample into this accumulator."""
+        if count == 0:
+            return
+        if self.count == 0:
+            (self.count, self.sum_of_weights, self.mean_x, self.mean_y,
+             self.sxx, self.sxy, self.syy) = count, sum_of_weights, mean_x, mean_y, sxx, sxy, syy
+            return
+        total = self.sum_of_weights + sum_of_weights
+        factor = self.sum_of_weights * sum_of_weights / total
+        delta_x = mean_x - self.mean_x
+        delta_y = mean_y - self.mean_y
+        self.sxx += sxx + delta_x**2 * factor
+        self.sxy += sxy + delta_x * delta_y * factor
+        self.syy += syy + delta_y**2 * factor
+        self.mean_x += delta_x * sum_of_weights / total
+        self.mean_y += delta_y * sum_of_weights / total
+        self.sum_of_weights = total
+        self.count += count
+
+    def update(self, x_data, y_data, y_errors=None):
+        """
+        Add a chunk of points.
+
+        Args:
+            x_data (array-like): X values
+            y_data (array-like): Y values
+            y_errors (array-like, optional): Y errors, unweighted fit if None
+
+        Returns:
+            LinearRegressionAccumulator: self, to allow chaining
+        """
+        if np.size(x_data) > 0:
+            self._combine(*_chunk_moments(x_data, y_data, y_errors))
+        return self
+
+    def merge(self, other):
+        """
+        Merge the state of another accumulator, e.g. from another worker.
+
+        Args:
+            other (LinearRegressionAccumulator): Accumulator to merge
+
+        Returns:
+            LinearRegressionAccumulator: self, to allow chaining
+        """
+        self._combine(other.count, other.sum_of_weights, other.mean_x, other.mean_y,
+                      other.sxx, other.sxy, other.syy)
+        return self
+
+    def result(self, absolute_sigma=False):
+        """
+        Fit the accumulated points.
+
+        Args:
+            absolute_sigma (bool): Use the errors as absolute uncertainties; otherwise
+                the covariance is scaled with the reduced χ² like np.polyfit
+
+        Returns:
+            dict: Fit results, see linear_regression
+        """
+        return _line_from_moments(self.count, self.sum_of_weights, self.mean_x, self.mean_y,
+                                  self.sxx, self.sxy, self.syy, absolute_sigma)
+
+
+def linear_regression(x_data, y_data, y_errors=None, groups=None, absolute_sigma=False):
+    """
+    Weighted straight line fit in closed form.
+
+    The fit only needs the weighted sums of the points, so it avoids the
+    Vandermonde matrix and SVD of np.polyfit. With groups, every segment is
+    fitted at once with np.bincount, without a Python loop over the segments.
+
+    Args:
+        x_data (array-like): X values
+        y_data (array-like): Y values
+        y_errors (array-like, optional): Y errors, unweighted fit if None
+        groups (array-like, optional): Segment label of every point, e.g. from
+            statistics.segment_labels
+        absolute_sigma (bool): Use the errors as absolute uncertainties; otherwise
+            the covariance is scaled with the reduced χ² like np.polyfit
+
+    Returns:
+        dict: 'slope', 'intercept', 'slope_error', 'intercept_error',
+            'cov_matrix' (slope, intercept order), 'r_squared', 'chi_squared',
+            'reduced_chi_squared' and 'count'; with groups arrays with one
+            entry per group and the sorted labels as 'groups'
+    """
+    if groups is None:
+        return _line_from_moments(*_chunk_moments(x_data, y_data, y_errors), absolute_sigma)
+
+    x_data = np.asarray(x_data, dtype=float)
+    y_data = np.asarray(y_data, dtype=float)
+    weights = np.ones_like(x_data) if y_errors is None else \
+        1 / np.broadcast_to(np.asarray(y_errors, dtype=float), x_data.shape)**2
+    labels, index = np.unique(np.asarray(groups), return_inverse=True)
+    num_groups = len(labels)
+
+    count = np.bincount(index, minlength=num_groups)
+    sum_of_weights = np.bincount(index, weights, minlength=num_groups)
+    mean_x = np.bincount(index, weights * x_data, minlength=num_groups) / sum_of_weights
+    mean_y = np.bincount(index, weights * y_data, minlength=num_groups) / sum_of_weights
+    dx = x_data - mean_x[index]
+    dy = y_data - mean_y[index]
+    sxx = np.bincount(index, weights * dx * dx, minlength=num_groups)
+    sxy = np.bincount(index, weights * dx * dy, minlength=num_groups)
+    syy = np.bincount(index, weights * dy * dy, minlength=num_groups)
+
+    result = _line_from_moments(count, sum_of_weights, mean_x, mean_y, sxx, sxy, syy, absolute_sigma)
+    result['groups'] = labels
+    return result
+
+
+def _power_terms(u, y, weights, degree):
+    """Rows w u^k (k <= 2 degree), w y u^k (k <= degree) and w y², summed for window fits."""
+    weighted_y = weights * y
+    rows = [weights]
+    y_rows = [weighted_y]
+    for k in range(1, 2 * degree + 1):
+        rows.append(rows[-1] * u)
+        if k <= degree:
+            y_rows.append(y_rows[-1] * u)
+    return np.stack(rows + y_rows + [weighted_y * y])
+
+def _shift_moments(sums, dx, dy, degree):
+    """
+    Express the sums of _power_terms relative to a shifted origin.
+
+    The sums (one row per column of _power_terms) were taken over u and y;
+    the result holds the sums over u + dx and y + dy, using the binomial
+    expansion of (u + dx)^k.
+    """
+    num_powers = 2 * degree + 1
+    moments = sums[:num_powers]
+    rhs = sums[num_powers:num_powers + degree + 1]
+    dx_powers = [np.ones_like(dx)]
+    for _ in range(1, num_powers):
+        dx_powers.append(dx_powers[-1] * dx)
+
+    shifted = np.zeros_like(sums)
+    for k in range(num_powers):
+        for j in range(k + 1):
+            factor = comb(k, j) * dx_powers[k - j]
+            shifted[k] += factor * moments[j]
+            if k <= degree:
+                shifted[num_powers + k] += factor * (rhs[j] + dy * moments[j])
+    shifted[-1] = sums[-1] + 2 * dy * rhs[0] + dy**2 * moments[0]
+    return shifted
+
+def _window_fits(x_data, y_data, y_errors, starts, ends, degree, absolute_sigma, block):
+    """
+    Polynomial fits of the windows x[start:end] from block-wise prefix sums.
+
+    The series is cut into blocks of `block` points (at least the longest
+    window), and the power sums are accumulated relative to the first point of
+    every block. A window then covers at most two blocks; its sums are shifted
+    to its own weighted mean and standardised before the normal equations are
+    solved, so there is no cancellation from large offsets in x or y. Every
+    window costs O(degree³), independent of its length.
+    """
+    x_data = np.asarray(x_data, dtype=float)
+    y_data = np.asarray(y_data, dtype=float)
+    weights = np.ones_like(x_data) if y_errors is None else \
+        1 / np.broadcast_to(np.asarray(y_errors, dtype=float), x_data.shape)**2
+    num_values = len(x_data)
+    num_params = degree + 1
+    num_powers = 2 * degree + 1
+
+    num_blocks = -(-num_values // block)
+    block_of = np.arange(num_values) // block
+    ref_x = x_data[::block]
+    ref_y = y_data[::block]
+    terms = _power_terms(x_data - ref_x[block_of], y_data - ref_y[block_of], weights, degree)
+    padded = np.zeros((len(terms), num_blocks * block))
+    padded[:, :num_values] = terms
+    prefix = np.zeros((len(terms), num_blocks, block + 1))
+    np.cumsum(padded.reshape(len(terms), num_blocks, block), axis=2, out=prefix[:, :, 1:])
+
+    first = starts // block
+    sums = prefix[:, first, np.minimum(ends - first * block, block)] - prefix[:, first, starts - first * block]
+    spill = ends - (first + 1) * block
+    if np.any(spill > 0):
+        # Part of the window lies in the next block, which has its own origin
+        part = spill > 0
+        second = first[part] + 1
+        sums[:, part] += _shift_moments(prefix[:, second, spill[part]], ref_x[second] - ref_x[first[part]],
+                                        ref_y[second] - ref_y[first[part]], degree)
+
+    # Centre every window on its weighted means
+    sum_of_weights = sums[0]
+    mean_u = sums[1] / sum_of_weights
+    mean_y = sums[num_powers] / sum_of_weights
+    sums = _shift_moments(sums, -mean_u, -mean_y, degree)
+    center = ref_x[first] + mean_u
+    y_center = ref_y[first] + mean_y
+    count = ends - starts
+
+    if degree == 1:
+        line = _line_from_moments(count, sum_of_weights, center, y_center,
+                                  sums[2], sums[num_powers + 1], sums[-1], absolute_sigma)
+        coefficients = np.stack([line['slope'], line['intercept']], axis=1)
+        cov_matrix = line['cov_matrix']
+        chi_squared, r_squared = line['chi_squared'], line['r_squared']
+        dof = np.maximum(count - num_params, 1)
+    else:
+        # Standardise x, then solve the normal equations of all windows
+        scale = np.sqrt(sums[2] / sum_of_weights)
+        scale = np.where(scale > 0, scale, 1.0)
+        moments = sums[:num_powers] / scale**np.arange(num_powers)[:, None]
+        rhs = (sums[num_powers:num_powers + num_params] / scale**np.arange(num_params)[:, None]).T
+        syy = sums[-1]
+
+        normal = moments.T[:, np.add.outer(np.arange(num_params), np.arange(num_params))]
+        try:
+            cov_t = np.linalg.inv(normal)
+        except np.linalg.LinAlgError:
+            # Windows with fewer distinct x values than parameters
+            cov_t = np.linalg.pinv(normal)
+        coefficients_t = np.einsum('wij,wj->wi', cov_t, rhs)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            chi_squared = np.maximum(syy - np.sum(coefficients_t * rhs, axis=1), 0.0)
+            dof = np.maximum(count - num_params, 1)
+            if not absolute_sigma:
+                cov_t = cov_t * (chi_squared / dof)[:, None, None]
+            r_squared = 1 - chi_squared / syy
+
+        coefficients_t[:, 0] += y_center
+        coefficients, cov_matrix = _unstandardise(coefficients_t, cov_t, center, scale)
+
+    result = {
+        'start': starts,
+        'end': ends,
+        'coefficients': coefficients,
+        'coeff_errors': np.sqrt(np.diagonal(cov_matrix, axis1=1, axis2=2)),
+        'cov_matrix': cov_matrix,
+        'r_squared': r_squared,
+        'chi_squared': chi_squared,
+        'reduced_chi_squared': chi_squared / dof,
+        'count': count,
+    }
+    if degree == 1:
+        result['slope'], result['intercept'] = coefficients.T
+        result['slope_error'], result['intercept_error'] = result['coeff_errors'].T
+    return result
+
+def rolling_fit(x_data, y_data, window, y_errors=None, degree=1, step=1, absolute_sigma=False):
+    """
+    Fit a line or low-order polynomial in a sliding window over a series.
+
+    All windows are evaluated from prefix sums in O(n) total, so traces of
+    slope, intercept and R² over 10^5-10^6 samples take milliseconds. Flat
+    slope traces show steady-state segments, large ones drift regions.
+
+    Args:
+        x_data (array-like): X values, e.g. time
+        y_data (array-like): Y values
+        window (int): Number of points per window
+        y_errors (array-like, optional): Y errors, unweighted fits if None
+        degree (int): Polynomial degree
+        step (int): Distance between the starts of consecutive windows
+        absolute_sigma (bool): Use the errors as absolute uncertainties; otherwise
+            the covariance is scaled with the reduced χ² like np.polyfit
+
+    Returns:
+        dict: Arrays with one entry per window: 'start' and 'end' indices
+            (x[start:end]), 'coefficients' (np.polyfit order), 'coeff_errors',
+            'cov_matrix', 'r_squared', 'chi_squared', 'reduced_chi_squared',
+            'count'; for degree 1 also 'slope', 'intercept', 'slope_error'
+            and 'intercept_error'
+    """
+    num_values = len(x_data)
+    if not degree + 1 <= window <= num_values:
+        raise ValueError(f"Window must have between {degree + 1} and {num_values} points, got {window}")
+    starts = np.arange(0, num_values - window + 1, step)
+    return _window_fits(x_data, y_data, y_errors, starts, starts + window, degree, absolute_sigma, window)
+
+def expanding_fit(x_data, y_data, y_errors=None, degree=1, min_points=None, start_idx=0,
+                  absolute_sigma=False):
+    """
+    Fit a line or low-order polynomial to x[start_idx:end] for every end.
+
+    Like rolling_fit, all fits come from prefix sums in O(n) total. The
+    reduced χ² trace shows where the data stops following the model, which is
+    a natural end for a fit range.
+
+    Args:
+        x_data (array-like): X values, e.g. time
+        y_data (array-like): Y values
+        y_errors (array-like, optional): Y errors, unweighted fits if None
+        degree (int): Polynomial degree
+        min_points (int, optional): Size of the first window, default degree + 2
+        start_idx (int): Fixed start of all windows
+        absolute_sigma (bool): Use the errors as absolute uncertainties
+
+    Returns:
+        dict: Arrays with one entry per end index, see rolling_fit
+    """
+    num_values = len(x_data)
+    if min_points is None:
+        min_points = degree + 2
+    if y_errors is not None:
+        y_errors = np.broadcast_to(np.asarray(y_errors, dtype=float), np.shape(y_data))[start_idx:]
+    # One block starting at start_idx holds all windows
+    ends = np.arange(min_points, num_values - start_idx + 1)
+    result = _window_fits(np.asarray(x_data)[start_idx:], np.asarray(y_data)[start_idx:], y_errors,
+                          np.zeros(len(ends), dtype=int), ends, degree, absolute_sigma, num_values - start_idx)
+    result['start'] = result['start'] + start_idx
+    result['end'] = result['end'] + start_idx
+    return result
+
+def piecewise_linear_segments(x_data, y_data, y_errors=None, penalty=None, min_size=5, resolution=None):
+    """
+    Split a series into straight segments with automatically placed breakpoints.
+
+    The number and positions of the breakpoints minimise the total χ² of
+    independent line fits plus a penalty per segment. The optimum is found by
+    dynamic programming with pruning of candidate starts that can no longer
+    be optimal (PELT, Killick et al. 2012); segment costs come from prefix
+    sums in O(1). PELT cannot prune starts within a segment, so the exact
+    search takes time quadratic in the segment length. Long series are
+    therefore first segmented on a grid of every `resolution`-th point, and
+    the search is repeated on finer grids around the breakpoints found so far
+    down to single points. This keeps the run time close to linear and
+    matches the exact optimum unless a breakpoint is invisible on the coarse
+    grid (segments shorter than a few grid steps).
+
+    Args:
+        x_data (array-like): X values
+        y_data (array-like): Y values
+        y_errors (array-like, optional): Y errors; if None the noise is
+            estimated from the median absolute deviation of successive differences
+        penalty (float, optional): Cost of an additional segment in units of χ²,
+            default 3 ln(n) (BIC for two line parameters and one breakpoint)
+        min_size (int): Minimum number of points per segment
+        resolution (int, optional): Grid spacing of the first pass, by default
+            chosen so that the grid has at most 1000 points; 1 for the exact
+            search (the default below 1000 points)
+
+    Returns:
+        dict: 'breakpoints' (start indices of the second, third, ... segment,
+            usable with statistics.segment_labels), 'segments' as
+            (start_idx, end_idx) tuples for generate_fit_data, the line fit of
+            every segment in 'fits' (see linear_regression with groups),
+            'sigma' (noise used for unweighted data) and 'penalty'
+    """
+    x_data = np.asarray(x_data, dtype=float)
+    y_data = np.asarray(y_data, dtype=float)
+    num_values = len(x_data)
+    min_size = max(min_size, 3)
+    if num_values < min_size:
+        raise ValueError(f"Need at least {min_size} points, got {num_values}")
+
+    if y_errors is None:
+        # Successive differences of a line are constant, so their spread is noise
+        differences = np.diff(y_data)
+        sigma = 1.4826 * np.median(np.abs(differences - np.median(differences))) / np.sqrt(2)
+        if not sigma > 0:
+            sigma = np.std(differences) / np.sqrt(2) or 1.0
+        weights = np.full(num_values, 1 / sigma**2)
+    else:
+        sigma = None
+        weights = 1 / np.broadcast_to(np.asarray(y_errors, dtype=float), y_data.shape)**2
+    if penalty is None:
+        penalty = 3 * np.log(num_values)
+    if resolution is None:
+        resolution = max(1, -(-num_values // 1000))
+
+    # Prefix sums of centred and scaled data keep the differences accurate
+    u = (x_data - np.mean(x_data)) / (np.std(x_data) or 1.0)
+    v = y_data - np.mean(y_data)
+    # One row per point, so the sums of a set of starts are gathered row by row
+    prefix = np.zeros((num_values + 1, 6))
+    np.cumsum(np.stack([weights, weights * u, weights * v, weights * u * u, weights * u * v, weights * v * v],
+                       axis=1), axis=0, out=prefix[1:])
+
+    def segment_cost(starts, end):
+        """χ² of the line fits of x[start:end] for every start."""
+        w, wu, wv, wuu, wuv, wvv = (prefix[end] - prefix[starts]).T
+        sxx = wuu - wu**2 / w
+        sxy = wuv - wu * wv / w
+        cost = wvv - wv**2 / w - np.where(sxx > 0, sxy**2 / sxx, 0.0)
+        return np.maximum(cost, 0.0)
+
+    def optimal_partition(grid):
+        """Breakpoints minimising the penalised cost with all boundaries on the grid."""
+        best = np.full(len(grid), np.inf)
+        best[0] = -penalty
+        previous = np.zeros(len(grid), dtype=int)
+        candidates = np.array([], dtype=int)
+        newest = -1
+        for end in range(1, len(grid)):
+            # Admit starts that leave at least min_size points
+            while newest + 1 < end and grid[end] - grid[newest + 1] >= min_size:
+                newest += 1
+                if np.isfinite(best[newest]):
+                    candidates = np.append(candidates, newest)
+            if len(candidates) == 0:
+                continue
+            totals = best[candidates] + segment_cost(grid[candidates], grid[end])
+            index = np.argmin(totals)
+            best[end] = totals[index] + penalty
+            previous[end] = candidates[index]
+            # Starts that are already worse than the optimum can never win later
+            candidates = candidates[totals <= best[end]]
+
+        breakpoints = []
+        end = len(grid) - 1
+        while end > 0:
+            end = previous[end]
+            if end > 0:
+                breakpoints.append(int(grid[end]))
+        return breakpoints[::-1]
+
+    # Dynamic programming over every resolution-th point (all points if resolution is 1),
+    # then again on finer grids around the breakpoints found so far. Every pass can
+    # still move, drop or merge breakpoints, so grid artefacts do not survive.
+    step = resolution
+    with np.errstate(invalid='ignore', divide='ignore'):
+        breakpoints = optimal_partition(np.unique(np.append(np.arange(0, num_values, step), num_values)))
+        while step > 1:
+            finer = max(1, step // 8)
+            windows = [np.arange(max(b - 2 * step, 0), min(b + 2 * step, num_values) + 1, finer)
+                       for b in breakpoints]
+            breakpoints = optimal_partition(np.unique(np.concatenate([[0, num_values]] + windows)))
+            step = finer
+    bounds = [0] + breakpoints + [num_values]
+
+    breakpoints = bounds[1:-1]
+    labels = np.repeat(np.arange(len(bounds) - 1), np.diff(bounds))
+    return {
+        'breakpoints': breakpoints,
+        'segments': list(zip(bounds[:-1], bounds[1:])),
+        'fits': linear_regression(x_data, y_data, y_errors, groups=labels),
+        'sigma': sigma,
+        'penalty': penalty,
+    }
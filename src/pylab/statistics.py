@@ -0,0 +1,425 @@
+import numpy as np
+
+
+class WeightedMeanAccumulator:
+    """
+    Streaming inverse-variance weighted mean.
+
+    Values are added in chunks with update and partial results of several
+    workers or runs are combined with merge, without keeping the inputs.
+    Moments are combined with the pairwise update of Chan et al., which stays
+    accurate for large offsets.
+
+    By default outliers are counted per chunk against the running mean
+    including that chunk, so memory stays constant but the count is
+    approximate and depends on the chunking. With exact_outliers=True they are
+    counted against the final mean instead, which keeps the interval
+    x ± outlier_threshold·σ of every value (two floats per value).
+
+    Attributes:
+        count (int): Number of values
+        sum_of_weights (float): Sum of the weights 1/σ²
+        mean (float): Weighted mean
+        chi_squared (float): Σ (x - mean)² / σ²
+    """
+
+    def __init__(self, outlier_threshold=3.0, exact_outliers=False):
+        self.outlier_threshold = outlier_threshold
+        self.exact_outliers = exact_outliers
+        self.count = 0
+        self.sum_of_weights = 0.0
+        self.mean = np.nan
+        self.chi_squared = 0.0
+        self._outliers = 0
+        self._lower_limits = []
+        self._upper_limits = []
+
+    def _combine(self, count, sum_of_weights, mean, chi_squared):
+        """Combine the moments of another sample into this accumulator."""
+        if count == 0:
+            return
+        if self.count == 0:
+            self.count, self.sum_of_weights, self.mean, self.chi_squared = count, sum_of_weights, mean, chi_squared
+            return
+        total = self.sum_of_weights + sum_of_weights
+        delta = mean - self.mean
+        self.chi_squared += chi_squared + delta**2 * self.sum_of_weights * sum_of_weights / total
+        self.mean += delta * sum_of_weights / total
+        self.sum_of_weights = total
+        self.count += count
+
+    def update(self, values, errors):
+        """
+        Add a chunk of values.
+
+        Args:
+            values (array-like): Values
+            errors (array-like): Errors of the values
+
+        Returns:
+            WeightedMeanAccumulator: self, to allow chaining
+        """
+        values, errors = np.broadcast_arrays(np.asarray(values, dtype=float), np.asarray(errors, dtype=float))
+        values, errors = np.ravel(values), np.ravel(errors)
+        if values.size == 0:
+            return self
+
+        weights = 1 / errors**2
+        sum_of_weights = np.sum(weights)
+        mean = np.sum(weights * values) / sum_of_weights
+        chi_squared = np.sum(weights * (values - mean)**2)
+        self._combine(values.size, sum_of_weights, mean, chi_squared)
+
+        if self.outlier_threshold is None:
+            return self
+        if self.exact_outliers:
+            self._lower_limits.append(values - self.outlier_threshold * errors)
+            self._upper_limits.append(values + self.outlier_threshold * errors)
+        else:
+            self._outliers += int(np.count_nonzero(np.abs(values - self.mean) > self.outlier_threshold * errors))
+        return self
+
+    def merge(self, other):
+        """
+        Merge the state of another accumulator, e.g. from another worker.
+
+        Args:
+            other (WeightedMeanAccumulator): Accumulator to merge
+
+        Returns:
+            WeightedMeanAccumulator: self, to allow chaining
+
+        Raises:
+            ValueError: If this accumulator counts outliers exactly and the
+                other does not
+        """
+        if self.exact_outliers and self.outlier_threshold is not None and not other.exact_outliers:
+            raise ValueError("Exact outlier counts need accumulators created with exact_outliers=True")
+        self._combine(other.count, other.sum_of_weights, other.mean, other.chi_squared)
+        self._outliers += other._outliers
+        self._lower_limits.extend(other._lower_limits)
+        self._upper_limits.extend(other._upper_limits)
+        return self
+
+    @property
+    def outliers(self):
+        """
+        Number of values more than outlier_threshold σ from the weighted mean,
+        None if outliers are not tracked.
+
+        Approximate (counted per chunk against the running mean) unless
+        exact_outliers is set. A gross outlier among few values shifts the mean
+        so much that all of them can count; statistics.sigma_clipped_mean
+        rejects outliers robustly.
+        """
+        if self.outlier_threshold is None:
+            return None
+        if not self.exact_outliers:
+            return self._outliers
+        if not self._lower_limits:
+            return 0
+        # Keep the limits of all chunks in one array for repeated queries
+        self._lower_limits = [np.concatenate(self._lower_limits)]
+        self._upper_limits = [np.concatenate(self._upper_limits)]
+        return int(np.count_nonzero(self._lower_limits[0] > self.mean)
+                   + np.count_nonzero(self._upper_limits[0] < self.mean))
+
+    @property
+    def error(self):
+        """Error of the weighted mean, 1 / sqrt(Σ 1/σ²)."""
+        return 1 / np.sqrt(self.sum_of_weights) if self.sum_of_weights > 0 else np.nan
+
+    @property
+    def reduced_chi_squared(self):
+        return self.chi_squared / (self.count - 1) if self.count > 1 else np.nan
+
+    @property
+    def birge_ratio(self):
+        """Square root of the reduced χ², about 1 if the errors describe the scatter."""
+        return np.sqrt(self.reduced_chi_squared)
+
+    def result(self):
+        """
+        Summarize the accumulated data.
+
+        Returns:
+            dict: count, mean, error, chi_squared, reduced_chi_squared,
+                birge_ratio and outliers
+        """
+        return {
+            'count': self.count,
+            'mean': self.mean,
+            'error': self.error,
+            'chi_squared': self.chi_squared,
+            'reduced_chi_squared': self.reduced_chi_squared,
+            'birge_ratio': self.birge_ratio,
+            'outliers': self.outliers,
+        }
+
+
+def segment_labels(num_values, boundaries):
+    """
+    Create group labels for consecutive segments of an array.
+
+    Example: segment_labels(18, [9]) labels x[:9] as 0 and x[9:] as 1.
+
+    Args:
+        num_values (int): Length of the array
+        boundaries (list): Start indices of the second, third, ... segment
+
+    Returns:
+        np.ndarray: Segment number of every value
+    """
+    return np.searchsorted(np.sort(np.asarray(boundaries)), np.arange(num_values), side='right')
+
+def grouped_weighted_statistics(values, errors, groups):
+    """
+    Calculate weighted and unweighted statistics for every group in one pass.
+
+    The labels are sorted once (np.unique) and all sums are reduced per group
+    with np.bincount, so there is no Python loop over the groups.
+
+    Args:
+        values (array-like): Values
+        errors (array-like): Errors of the values
+        groups (array-like): Group label of every value (numbers or strings)
+
+    Returns:
+        dict: Arrays with one entry per group: 'groups' (sorted labels),
+            'count', 'weighted_mean', 'weighted_error', 'chi_squared',
+            'birge_ratio', 'mean', 'std' (ddof=1) and 'standard_error'
+    """
+    values = np.asarray(values, dtype=float)
+    errors = np.broadcast_to(np.asarray(errors, dtype=float), values.shape)
+    labels, index = np.unique(np.asarray(groups), return_inverse=True)
+    num_groups = len(labels)
+
+    weights = 1 / errors**2
+    count = np.bincount(index, minlength=num_groups)
+    sum_of_weights = np.bincount(index, weights, minlength=num_groups)
+    weighted_mean = np.bincount(index, weights * values, minlength=num_groups) / sum_of_weights
+    chi_squared = np.bincount(index, weights * (values - weighted_mean[index])**2, minlength=num_groups)
+
+    mean = np.bincount(index, values, minlength=num_groups) / count
+    squared_deviations = np.bincount(index, (values - mean[index])**2, minlength=num_groups)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        std = np.sqrt(squared_deviations / (count - 1))
+        birge_ratio = np.sqrt(chi_squared / (count - 1))
+
+    return {
+        'groups': labels,
+        'count': count,
+        'weighted_mean': weighted_mean,
+        'weighted_error': 1 / np.sqrt(sum_of_weights),
+        'chi_squared': chi_squared,
+        'birge_ratio': birge_ratio,
+        'mean': mean,
+        'std': std,
+        'standard_error': std / np.sqrt(count),
+    }
+
+def _group_index(groups, num_values):
+    """Sorted labels and group index of every value; one group if groups is None."""
+    if groups is None:
+        return np.array([0]), np.zeros(num_values, dtype=int)
+    return np.unique(np.asarray(groups), return_inverse=True)
+
+def _per_group(result, groups):
+    """Return scalars instead of one-element arrays when no groups were given."""
+    if groups is not None:
+        return result
+    return {key: (value[0] if key not in ('rejected', 'weights') else value) for key, value in result.items()}
+
+def _group_medians(values, index, num_groups, excluded=None):
+    """
+    Median of every group via one sort by (group, value).
+
+    Args:
+        values (np.ndarray): Values
+        index (np.ndarray): Group index of every value
+        num_groups (int): Number of groups
+        excluded (np.ndarray, optional): Mask of values to ignore
+
+    Returns:
+        np.ndarray: Median per group (NaN for groups without values)
+    """
+    if excluded is not None:
+        values = np.where(excluded, np.nan, values)
+        counts = np.bincount(index[~excluded], minlength=num_groups)
+    else:
+        counts = np.bincount(index, minlength=num_groups)
+    # NaN sorts last within each group, so the kept values come first
+    ordered = values[np.lexsort((values, index))]
+    starts = np.concatenate(([0], np.cumsum(np.bincount(index, minlength=num_groups))[:-1]))
+    # Empty groups get a valid dummy position and are masked afterwards
+    last = max(values.size - 1, 0)
+    lower = np.minimum(starts + np.maximum(counts - 1, 0) // 2, last)
+    upper = np.minimum(starts + counts // 2, last)
+    return np.where(counts > 0, 0.5 * (ordered[lower] + ordered[upper]), np.nan)
+
+def sigma_clipped_mean(values, errors, threshold=3.0, max_iterations=10, scale='errors', groups=None):
+    """
+    Weighted mean with iterative sigma clipping.
+
+    The first iteration is centred on the group medians, later ones on the
+    weighted mean of the remaining points. In every iteration all groups are
+    processed at once and points further than threshold standard deviations
+    from the centre are rejected, until no point changes its state.
+
+    Args:
+        values (array-like): Values
+        errors (array-like): Errors of the values
+        threshold (float): Rejection threshold in standard deviations
+        max_iterations (int): Maximum number of iterations, at least 1
+        scale (str): 'errors' compares each residual with its own error,
+            'scatter' with the robust spread (1.4826 · MAD) of the group
+        groups (array-like, optional): Group label of every value
+
+    Returns:
+        dict: 'mean', 'error', 'count' (kept points), 'iterations' and
+            'rejected', a boolean mask of the rejected points; per-group
+            arrays plus 'groups' if groups is given
+    """
+    if scale not in ('errors', 'scatter'):
+        raise ValueError(f"Unknown scale: {scale}")
+    if max_iterations < 1:
+        raise ValueError(f"max_iterations must be at least 1, got {max_iterations}")
+    values = np.asarray(values, dtype=float)
+    errors = np.broadcast_to(np.asarray(errors, dtype=float), values.shape)
+    labels, index = _group_index(groups, values.size)
+    num_groups = len(labels)
+    weights = 1 / errors**2
+
+    rejected = np.zeros(values.shape, dtype=bool)
+    center = _group_medians(values, index, num_groups)
+    for iteration in range(1, max_iterations + 1):
+        residuals = np.abs(values - center[index])
+        if scale == 'scatter':
+            spread = 1.4826 * _group_medians(residuals, index, num_groups, rejected)
+            limit = threshold * spread[index]
+        else:
+            limit = threshold * errors
+
+        new_rejected = residuals > limit
+        # Never reject every point of a group
+        emptied = np.bincount(index[~new_rejected], minlength=num_groups) == 0
+        new_rejected &= ~emptied[index]
+        if np.array_equal(new_rejected, rejected) and iteration > 1:
+            break
+        rejected = new_rejected
+
+        kept_weights = np.where(rejected, 0.0, weights)
+        center = np.bincount(index, kept_weights * values, minlength=num_groups) / \
+            np.bincount(index, kept_weights, minlength=num_groups)
+
+    kept_weights = np.where(rejected, 0.0, weights)
+    sum_of_weights = np.bincount(index, kept_weights, minlength=num_groups)
+    result = {
+        'mean': np.bincount(index, kept_weights * values, minlength=num_groups) / sum_of_weights,
+        'error': 1 / np.sqrt(sum_of_weights),
+        'count': np.bincount(index[~rejected], minlength=num_groups),
+        'iterations': np.full(num_groups, iteration),
+        'rejected': rejected,
+    }
+    if groups is not None:
+        result['groups'] = labels
+    return _per_group(result, groups)
+
+def huber_mean(values, errors, k=1.345, max_iterations=50, tolerance=1e-10, groups=None):
+    """
+    Huber M-estimator of the weighted mean (iteratively reweighted).
+
+    Points with normalized residual |x - mean| / σ above k get their weight
+    reduced by k / |r|, which limits the pull of single bad points.
+
+    Args:
+        values (array-like): Values
+        errors (array-like): Errors of the values
+        k (float): Huber tuning constant in standard deviations
+        max_iterations (int): Maximum number of iterations
+        tolerance (float): Convergence tolerance relative to the error
+        groups (array-like, optional): Group label of every value
+
+    Returns:
+        dict: 'mean', 'error' (from the final weights), 'iterations',
+            'weights' (Huber factor per point, 1 = full weight) and 'rejected',
+            a boolean mask of the down-weighted points; per-group arrays plus
+            'groups' if groups is given
+    """
+    values = np.asarray(values, dtype=float)
+    errors = np.broadcast_to(np.asarray(errors, dtype=float), values.shape)
+    labels, index = _group_index(groups, values.size)
+    num_groups = len(labels)
+    weights = 1 / errors**2
+
+    # Start from the group medians, which are not pulled by outliers
+    mean = _group_medians(values, index, num_groups)
+
+    factors = np.ones(values.shape)
+    for iteration in range(1, max_iterations + 1):
+        normalized = np.abs(values - mean[index]) / errors
+        factors = np.minimum(1.0, k / np.maximum(normalized, 1e-300))
+        sum_of_weights = np.bincount(index, weights * factors, minlength=num_groups)
+        new_mean = np.bincount(index, weights * factors * values, minlength=num_groups) / sum_of_weights
+        converged = np.all(np.abs(new_mean - mean) <= tolerance / np.sqrt(sum_of_weights))
+        mean = new_mean
+        if converged:
+            break
+
+    result = {
+        'mean': mean,
+        'error': 1 / np.sqrt(np.bincount(index, weights * factors, minlength=num_groups)),
+        'iterations': np.full(num_groups, iteration),
+        'weights': factors,
+        'rejected': factors < 1.0,
+    }
+    if groups is not None:
+        result['groups'] = labels
+    return _per_group(result, groups)
+
+def median_bootstrap(values, num_resamples=2000, percentiles=(15.865, 84.135), seed=None,
+                     groups=None, max_chunk_size=2**22):
+    """
+    Median with a bootstrap estimate of its uncertainty.
+
+    All resamples of a group are drawn as one index array (in chunks of at
+    most max_chunk_size elements) and their medians are computed at once.
+
+    Args:
+        values (array-like): Values
+        num_resamples (int): Number of bootstrap resamples
+        percentiles (tuple): Percentiles of the bootstrap distribution to report
+        seed (int, optional): Seed for the random number generator
+        groups (array-like, optional): Group label of every value
+        max_chunk_size (int): Maximum number of resampled values per chunk
+
+    Returns:
+        dict: 'median', 'error' (standard deviation of the bootstrap medians)
+            and 'interval' (the requested percentiles); per-group arrays plus
+            'groups' if groups is given
+    """
+    values = np.asarray(values, dtype=float)
+    labels, index = _group_index(groups, values.size)
+    rng = np.random.default_rng(seed)
+
+    median = np.empty(len(labels))
+    error = np.empty(len(labels))
+    interval = np.empty((len(labels), len(percentiles)))
+    for group in range(len(labels)):
+        group_values = values[index == group]
+        resamples_per_chunk = max(1, max_chunk_size // group_values.size)
+        medians = []
+        for start in range(0, num_resamples, resamples_per_chunk):
+            size = min(resamples_per_chunk, num_resamples - start)
+            draws = rng.integers(0, group_values.size, size=(size, group_values.size))
+            medians.append(np.median(group_values[draws], axis=1))
+        medians = np.concatenate(medians)
+
+        median[group] = np.median(group_values)
+        error[group] = np.std(medians, ddof=1)
+        interval[group] = np.percentile(medians, percentiles)
+
+    result = {'median': median, 'error': error, 'interval': interval}
+    if groups is not None:
+        result['groups'] = labels
+    return _per_group(result, groups)
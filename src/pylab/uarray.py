@@ -0,0 +1,412 @@
+import itertools
+
+import numpy as np
+from scipy.sparse import csr_matrix, identity, vstack
+
+from .formula import compile_formula
+
+_source_ids = itertools.count()
+
+# Partial derivatives of supported ufuncs with respect to each argument,
+# as functions of the argument values and the result
+_UNARY_DERIVATIVES = {
+    'negative': lambda a, out: -1.0,
+    'positive': lambda a, out: 1.0,
+    'absolute': lambda a, out: np.sign(a),
+    'square': lambda a, out: 2 * a,
+    'sqrt': lambda a, out: 0.5 / out,
+    'cbrt': lambda a, out: out / (3 * a),
+    'reciprocal': lambda a, out: -out**2,
+    'exp': lambda a, out: out,
+    'expm1': lambda a, out: out + 1,
+    'exp2': lambda a, out: out * np.log(2),
+    'log': lambda a, out: 1 / a,
+    'log2': lambda a, out: 1 / (a * np.log(2)),
+    'log10': lambda a, out: 1 / (a * np.log(10)),
+    'log1p': lambda a, out: 1 / (1 + a),
+    'sin': lambda a, out: np.cos(a),
+    'cos': lambda a, out: -np.sin(a),
+    'tan': lambda a, out: 1 + out**2,
+    'arcsin': lambda a, out: 1 / np.sqrt(1 - a**2),
+    'arccos': lambda a, out: -1 / np.sqrt(1 - a**2),
+    'arctan': lambda a, out: 1 / (1 + a**2),
+    'sinh': lambda a, out: np.cosh(a),
+    'cosh': lambda a, out: np.sinh(a),
+    'tanh': lambda a, out: 1 - out**2,
+    'deg2rad': lambda a, out: np.pi / 180,
+    'radians': lambda a, out: np.pi / 180,
+    'rad2deg': lambda a, out: 180 / np.pi,
+    'degrees': lambda a, out: 180 / np.pi,
+}
+
+_BINARY_DERIVATIVES = {
+    'add': (lambda a, b, out: 1.0, lambda a, b, out: 1.0),
+    'subtract': (lambda a, b, out: 1.0, lambda a, b, out: -1.0),
+    'multiply': (lambda a, b, out: b, lambda a, b, out: a),
+    'divide': (lambda a, b, out: 1 / b, lambda a, b, out: -out / b),
+    'true_divide': (lambda a, b, out: 1 / b, lambda a, b, out: -out / b),
+    'power': (lambda a, b, out: b * a**(b - 1), lambda a, b, out: out * np.log(a)),
+    'arctan2': (lambda a, b, out: b / (a**2 + b**2), lambda a, b, out: -a / (a**2 + b**2)),
+    'hypot': (lambda a, b, out: a / out, lambda a, b, out: b / out),
+}
+
+
+def _broadcast_rows(jacobian, shape, target_shape):
+    """Rows of a Jacobian for an operand of the given shape broadcast to target_shape."""
+    if tuple(shape) == tuple(target_shape):
+        return jacobian
+    rows = np.broadcast_to(np.arange(int(np.prod(shape))).reshape(shape), target_shape)
+    return jacobian[rows.ravel()]
+
+def _scale_rows(jacobian, factors):
+    """Multiply every row of a CSR Jacobian by its factor."""
+    jacobian = jacobian.copy()
+    jacobian.data *= np.repeat(factors, np.diff(jacobian.indptr))
+    return jacobian
+
+def _summation_matrix(shape, axis):
+    """Sparse matrix summing the flattened elements of an array over the given axes."""
+    num_values = int(np.prod(shape))
+    if axis is None:
+        axes = set(range(len(shape)))
+    else:
+        axes = {a % len(shape) for a in np.atleast_1d(axis)}
+    kept = tuple(1 if i in axes else n for i, n in enumerate(shape))
+    labels = np.broadcast_to(np.arange(int(np.prod(kept))).reshape(kept), shape).ravel()
+    return csr_matrix((np.ones(num_values), (labels, np.arange(num_values))),
+                      shape=(int(np.prod(kept)), num_values))
+
+
+class UArray:
+    """
+    NumPy-backed array of values with standard uncertainties.
+
+    Arithmetic operators and the common NumPy ufuncs propagate uncertainties
+    for all elements at once using first-order (Gaussian) propagation.
+
+    By default every operand is treated as independent, which is fast and
+    correct as long as a quantity is not used twice in one expression. With
+    track=True the elements of the array become independent error sources and
+    every derived array keeps its linear dependence on them as a sparse
+    Jacobian, through arithmetic, indexing and sums. Correlations (e.g.
+    x - x, overlapping selections such as x[:2] and x[[0, 1]], or a shared
+    scalar used in all rows) are thus propagated exactly.
+
+    np.concatenate, np.stack, np.hstack, np.vstack, np.sum and np.mean accept
+    UArrays; other NumPy functions and conversion with np.asarray raise
+    TypeError instead of silently mixing values and errors.
+
+    Attributes:
+        value (np.ndarray): Nominal values
+        sigma (np.ndarray): Standard uncertainties
+    """
+
+    def __init__(self, value, sigma=0.0, track=False):
+        self.value = np.asarray(value, dtype=float)
+        self.sigma = np.array(np.broadcast_to(np.abs(np.asarray(sigma, dtype=float)), self.value.shape))
+        self._source_id = None
+        # Maps source id -> (Jacobian of the flattened values with respect to
+        # the source elements, flattened source sigma); None for untracked arrays
+        self._derivatives = None
+        if track:
+            self._derivatives = self._sources()
+
+    @classmethod
+    def _from_derivatives(cls, value, derivatives):
+        """Create a tracked array from its dependence on the sources."""
+        result = cls.__new__(cls)
+        result.value = np.asarray(value, dtype=float)
+        variance = np.zeros(result.value.size)
+        for jacobian, source_sigma in derivatives.values():
+            squared = jacobian.copy()
+            squared.data **= 2
+            variance = variance + squared @ source_sigma**2
+        result.sigma = np.sqrt(variance).reshape(result.value.shape)
+        result._source_id = None
+        result._derivatives = derivatives
+        return result
+
+    def _get_source_id(self):
+        if self._source_id is None:
+            self._source_id = next(_source_ids)
+        return self._source_id
+
+    def _sources(self):
+        """Dependence on independent error sources (untracked arrays are one source)."""
+        if self._derivatives is not None:
+            return self._derivatives
+        return {self._get_source_id(): (identity(self.value.size, format='csr'), self.sigma.ravel())}
+
+    @property
+    def tracked(self):
+        return self._derivatives is not None
+
+    @property
+    def shape(self):
+        return self.value.shape
+
+    @property
+    def ndim(self):
+        return self.value.ndim
+
+    @property
+    def relative_sigma(self):
+        return self.sigma / np.abs(self.value)
+
+    def __len__(self):
+        return len(self.value)
+
+    def __repr__(self):
+        return f"UArray(value={self.value!r}, sigma={self.sigma!r})"
+
+    def __getitem__(self, index):
+        if self._derivatives is None:
+            return UArray(self.value[index], self.sigma[index])
+        # The selected elements keep their dependence on the same source elements
+        rows = np.arange(self.value.size).reshape(self.value.shape)[index]
+        derivatives = {
+            source_id: (jacobian[np.ravel(rows)], source_sigma)
+            for source_id, (jacobian, source_sigma) in self._derivatives.items()
+        }
+        return UArray._from_derivatives(self.value[index], derivatives)
+
+    def __array__(self, dtype=None, copy=None):
+        raise TypeError("UArray cannot be converted to a plain array, use .value and .sigma")
+
+    def __array_function__(self, func, types, args, kwargs):
+        if func in _JOIN_FUNCTIONS:
+            return _join(func, *args, **kwargs)
+        if func is np.sum:
+            return args[0].sum(*args[1:], **kwargs)
+        if func is np.mean:
+            return args[0].mean(*args[1:], **kwargs)
+        if func in (np.shape, np.ndim, np.size):
+            return func(args[0].value, *args[1:], **kwargs)
+        return NotImplemented
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        if method != '__call__' or kwargs.get('out') is not None:
+            return NotImplemented
+        values = [x.value if isinstance(x, UArray) else np.asarray(x, dtype=float) for x in inputs]
+
+        if len(inputs) == 1 and ufunc.__name__ in _UNARY_DERIVATIVES:
+            derivative = _UNARY_DERIVATIVES[ufunc.__name__]
+            out = ufunc(values[0], **kwargs)
+            partials = [lambda: derivative(values[0], out)]
+        elif len(inputs) == 2 and ufunc.__name__ in _BINARY_DERIVATIVES:
+            derivatives = _BINARY_DERIVATIVES[ufunc.__name__]
+            out = ufunc(values[0], values[1], **kwargs)
+            partials = [lambda d=d: d(values[0], values[1], out) for d in derivatives]
+        else:
+            return NotImplemented
+        return _propagate(out, inputs, partials)
+
+    def __add__(self, other):
+        return np.add(self, other)
+
+    def __radd__(self, other):
+        return np.add(other, self)
+
+    def __sub__(self, other):
+        return np.subtract(self, other)
+
+    def __rsub__(self, other):
+        return np.subtract(other, self)
+
+    def __mul__(self, other):
+        return np.multiply(self, other)
+
+    def __rmul__(self, other):
+        return np.multiply(other, self)
+
+    def __truediv__(self, other):
+        return np.true_divide(self, other)
+
+    def __rtruediv__(self, other):
+        return np.true_divide(other, self)
+
+    def __pow__(self, other):
+        return np.power(self, other)
+
+    def __rpow__(self, other):
+        return np.power(other, self)
+
+    def __neg__(self):
+        return np.negative(self)
+
+    def __pos__(self):
+        return self
+
+    def __abs__(self):
+        return np.absolute(self)
+
+    def sum(self, axis=None, dtype=None, out=None, keepdims=False):
+        """
+        Sum of the elements, also called by np.sum.
+
+        Args:
+            axis (int or tuple, optional): Axes to sum over, all by default
+            dtype: Ignored, the sum is always a float
+            out: Not supported
+            keepdims (bool): Keep the summed axes with length one
+
+        Returns:
+            UArray: Sum, with correlations taken into account if tracked
+        """
+        if out is not None:
+            raise TypeError("UArray.sum does not support out")
+        value = np.sum(self.value, axis=axis, keepdims=keepdims)
+        if self._derivatives is None:
+            return UArray(value, np.sqrt(np.sum(self.sigma**2, axis=axis, keepdims=keepdims)))
+        summation = _summation_matrix(self.value.shape, axis)
+        derivatives = {
+            source_id: (summation @ jacobian, source_sigma)
+            for source_id, (jacobian, source_sigma) in self._derivatives.items()
+        }
+        return UArray._from_derivatives(value, derivatives)
+
+    def mean(self, axis=None, dtype=None, out=None, keepdims=False):
+        """
+        Arithmetic mean of the elements, also called by np.mean.
+
+        Args:
+            axis (int or tuple, optional): Axes to average over, all by default
+            dtype: Ignored, the mean is always a float
+            out: Not supported
+            keepdims (bool): Keep the averaged axes with length one
+
+        Returns:
+            UArray: Mean with propagated uncertainty
+        """
+        total = self.sum(axis=axis, out=out, keepdims=keepdims)
+        return total / (self.value.size // max(total.value.size, 1))
+
+    def covariance(self, other):
+        """
+        Element-wise covariance with another array derived from the same sources.
+
+        Args:
+            other (UArray): Other array
+
+        Returns:
+            np.ndarray: Covariance of corresponding elements
+        """
+        if not (self.tracked or other.tracked):
+            return self.sigma**2 if other is self else np.zeros(np.broadcast_shapes(self.shape, other.shape))
+        shape = np.broadcast_shapes(self.shape, other.shape)
+        own = self._sources()
+        covariance = np.zeros(int(np.prod(shape)))
+        for source_id, (jacobian, source_sigma) in other._sources().items():
+            if source_id in own:
+                own_jacobian = _broadcast_rows(own[source_id][0], self.shape, shape)
+                jacobian = _broadcast_rows(jacobian, other.shape, shape)
+                covariance = covariance + own_jacobian.multiply(jacobian) @ source_sigma**2
+        return covariance.reshape(shape)
+
+    def correlation(self, other):
+        """
+        Element-wise correlation coefficient with another array.
+
+        Args:
+            other (UArray): Other array
+
+        Returns:
+            np.ndarray: Correlation of corresponding elements
+        """
+        return self.covariance(other) / (self.sigma * other.sigma)
+
+
+def _propagate(value, inputs, partials):
+    """
+    Combine the uncertainties of the inputs given the partial derivatives.
+
+    Args:
+        value (np.ndarray): Result values
+        inputs (list): Operands, UArray or exact values
+        partials (list): Functions returning the partial derivative per operand
+
+    Returns:
+        UArray: Result with propagated uncertainty
+    """
+    uncertain = [(x, d) for x, d in zip(inputs, partials) if isinstance(x, UArray)]
+    if not any(x.tracked for x, _ in uncertain):
+        variance = np.zeros(np.shape(value))
+        for x, d in uncertain:
+            variance = variance + (d() * x.sigma)**2
+        return UArray(value, np.sqrt(variance))
+
+    shape = np.shape(value)
+    derivatives = {}
+    for x, d in uncertain:
+        partial = np.broadcast_to(d(), shape).ravel()
+        for source_id, (jacobian, source_sigma) in x._sources().items():
+            # Chain rule: scale the rows of the operand's Jacobian by the partial derivative
+            jacobian = _scale_rows(_broadcast_rows(jacobian, x.shape, shape), partial)
+            if source_id in derivatives:
+                jacobian = derivatives[source_id][0] + jacobian
+            derivatives[source_id] = (jacobian, source_sigma)
+    return UArray._from_derivatives(value, derivatives)
+
+_JOIN_FUNCTIONS = (np.concatenate, np.stack, np.hstack, np.vstack)
+
+def _join(func, arrays, *args, **kwargs):
+    """
+    Join uncertain and exact arrays with np.concatenate, np.stack, ...
+
+    Args:
+        func (function): NumPy function joining a sequence of arrays
+        arrays (list): Operands, UArray or exact values
+
+    Returns:
+        UArray: Joined array; tracked if any operand is tracked
+    """
+    if kwargs.get('out') is not None:
+        raise TypeError(f"UArray does not support out in {func.__name__}")
+    arrays = list(arrays)
+    values = [x.value if isinstance(x, UArray) else np.asarray(x, dtype=float) for x in arrays]
+    value = func(values, *args, **kwargs)
+    if not any(isinstance(x, UArray) and x.tracked for x in arrays):
+        sigmas = [x.sigma if isinstance(x, UArray) else np.zeros_like(v) for x, v in zip(arrays, values)]
+        return UArray(value, func(sigmas, *args, **kwargs))
+
+    # Joining moves elements, so each result row is a row of one operand's Jacobian
+    offsets = np.cumsum([0] + [v.size for v in values])
+    labels = [np.arange(start, start + v.size).reshape(v.shape) for start, v in zip(offsets, values)]
+    rows = np.ravel(func(labels, *args, **kwargs))
+    source_sigmas = {}
+    for x in arrays:
+        if isinstance(x, UArray):
+            source_sigmas.update((source_id, sigma) for source_id, (_, sigma) in x._sources().items())
+    derivatives = {}
+    for source_id, source_sigma in source_sigmas.items():
+        blocks = []
+        for x, v in zip(arrays, values):
+            sources = x._sources() if isinstance(x, UArray) else {}
+            if source_id in sources:
+                blocks.append(sources[source_id][0])
+            else:
+                blocks.append(csr_matrix((v.size, source_sigma.size)))
+        derivatives[source_id] = (vstack(blocks, format='csr')[rows], source_sigma)
+    return UArray._from_derivatives(value, derivatives)
+
+def apply_formula(formula_str, variables_str, *arguments):
+    """
+    Evaluate a formula on uncertain arrays using the compiled gradient.
+
+    Args:
+        formula_str (str): Mathematical formula as string
+        variables_str (str): Variables in the formula as space-separated string
+        *arguments: One UArray, array or scalar per variable, broadcast together
+
+    Returns:
+        UArray: Result with propagated uncertainty
+    """
+    compiled = compile_formula(formula_str, variables_str)
+    values = [x.value if isinstance(x, UArray) else np.asarray(x, dtype=float) for x in arguments]
+    shape = np.broadcast_shapes(*(np.shape(v) for v in values))
+
+    rows = np.stack([np.broadcast_to(v, shape).ravel() for v in values], axis=1)
+    result, gradient = compiled.value_and_gradient(rows)
+    partials = [lambda i=i: gradient[:, i].reshape(shape) for i in range(len(values))]
+
+    return _propagate(result.reshape(shape), list(arguments), partials)
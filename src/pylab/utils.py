@@ -78,16 +78,16 @@ def calculate_multimeter_uncertainty(value, uncertainty_percent, resolution, plu
     Calculate the uncertainty of a measurement made with a multimeter.
     
     Args:
-        value (float): Measured value
+        value (float or array-like): Measured value or array of values
         uncertainty_percent (float): Uncertainty in percentage (e.g., 0.01 for 1%)
         resolution (float): Resolution of the multimeter
         plus_term (int): Plus term integer (e.g., 1 for 0.1)
         
     Returns:
-        float: Calculated uncertainty
+        float or np.ndarray: Calculated uncertainty
     """
     # Fix for negative values: use absolute value for percentage calculation
-    uncertainty = abs(value) * uncertainty_percent
+    uncertainty = np.abs(np.asarray(value, dtype=float)) * uncertainty_percent
     additional = resolution * plus_term
     return uncertainty + additional
 
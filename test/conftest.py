@@ -0,0 +1,19 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+from pylab.fitting import clear_fit_cache, fit_cache_info, set_fit_cache
+
+
+@pytest.fixture(autouse=True)
+def isolated_fit_cache(tmp_path):
+    """Keep fit results of one test from leaking into others or into the user's cache directory."""
+    settings = fit_cache_info()
+    set_fit_cache(directory=str(tmp_path / "fits"))
+    clear_fit_cache()
+    yield
+    clear_fit_cache()
+    set_fit_cache(maxsize=settings["maxsize"], directory=settings["directory"] or "",
+                  max_files=settings["max_files"])
@@ -0,0 +1,228 @@
+import json
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+from pylab.calculation import (
+    calculate_results_with_errors,
+    covariance_from_errors,
+    error_budget,
+    error_propagation,
+    monte_carlo_propagation,
+    propagate_covariance,
+    propagate_errors,
+    propagate_formulas,
+    second_order_propagation,
+)
+from pylab.formula import (
+    clear_formula_cache,
+    compile_formula,
+    formula_cache_info,
+    set_formula_cache,
+)
+
+
+def test_error_propagation() -> None:
+    value, error = error_propagation("x * y", "x y", [5, 2], [0.5, 0.1])
+    assert value == 10
+    assert error == pytest.approx(np.sqrt(1.0**2 + 0.5**2))
+
+
+def test_propagate_errors_matches_row_by_row() -> None:
+    formula = "sin(x) * exp(y)"
+    measurements = np.array([[5.0, 2.0], [1.0, 0.5], [0.3, -1.0]])
+    errors = np.array([0.5, 0.1])
+    values, total_errors = propagate_errors(formula, "x y", measurements, errors)
+    for row, value, error in zip(measurements, values, total_errors):
+        expected = error_propagation(formula, "x y", row, errors)
+        assert value == pytest.approx(expected[0])
+        assert error == pytest.approx(expected[1])
+
+
+def test_constant_derivative_is_broadcast() -> None:
+    values, total_errors = propagate_errors("2*a + b", "a b", [[1, 1], [2, 3]], [[0.1, 0], [0.2, 0]])
+    assert np.allclose(values, [3, 7])
+    assert np.allclose(total_errors, [0.2, 0.4])
+
+
+def test_undeclared_symbols_are_rejected() -> None:
+    with pytest.raises(ValueError, match="undeclared symbols: g"):
+        propagate_errors("a*g", "a", [[1.0]], [0.1])
+
+
+def test_calculate_results_with_errors_scales() -> None:
+    results, calc_errors = calculate_results_with_errors(
+        2, 1000, "U / I", "U I", [[1.0, 2.0], [3.0, 4.0], [5.0, 6.0]], [[0.1, 0.0]] * 3
+    )
+    assert len(results) == 2
+    assert np.allclose(results, [500, 750])
+    assert np.allclose(calc_errors, [50, 25])
+
+
+def test_formula_cache_reuses_compiled_formula(tmp_path) -> None:
+    set_formula_cache(directory=str(tmp_path))
+    try:
+        clear_formula_cache()
+        first = compile_formula("U_C / U_0", "R omega U_C U_0")
+        assert compile_formula("U_C / U_0", "R omega U_C U_0") is first
+        assert compile_formula("U_C / U_0", "R U_C U_0") is not first
+
+        # A fresh process only finds the kernel on disk
+        clear_formula_cache()
+        restored = compile_formula("U_C / U_0", "R omega U_C U_0")
+        assert formula_cache_info()["disk_hits"] == 1
+        assert restored.source == first.source
+        assert restored.gradient == first.gradient
+        values, gradient = restored.value_and_gradient([[25.6, 3142, 1.132, 0.975]])
+        assert values[0] == pytest.approx(1.132 / 0.975)
+
+        # Floats and constants survive the JSON trees exactly
+        decay = compile_formula("A * exp(-t / tau) + pi * 0.1", "A t tau")
+        clear_formula_cache()
+        assert compile_formula("A * exp(-t / tau) + pi * 0.1", "A t tau").gradient == decay.gradient
+
+        # A tampered entry is rebuilt instead of being compiled into the kernel
+        (path,) = [p for p in tmp_path.glob("formula_*.json") if "tau" in p.read_text()]
+        entry = json.loads(path.read_text())
+        entry["expressions"][0] = ["Add", ["Symbol", "__import__('os').getpid()"], ["Symbol", "A"]]
+        path.write_text(json.dumps(entry))
+        clear_formula_cache()
+        rebuilt = compile_formula("A * exp(-t / tau) + pi * 0.1", "A t tau")
+        assert formula_cache_info()["disk_hits"] == 0
+        assert "getpid" not in rebuilt.source
+        assert rebuilt.evaluate([[2.0, 0.0, 1.0]])[0] == pytest.approx(2 + np.pi * 0.1)
+    finally:
+        set_formula_cache(directory="")
+        clear_formula_cache()
+
+
+def test_propagate_covariance_reduces_to_independent_errors() -> None:
+    measurements = np.array([[1.132, 0.975], [1.403, 0.688]])
+    errors = np.array([[0.014, 0.013], [0.017, 0.010]])
+    values, covariance = propagate_covariance(
+        ["U_C / U_0", "U_C * U_0"], "U_C U_0", measurements, covariance_from_errors(errors)
+    )
+    expected_values, expected_errors = propagate_errors("U_C / U_0", "U_C U_0", measurements, errors)
+    assert covariance.shape == (2, 2, 2)
+    assert np.allclose(values[:, 0], expected_values)
+    assert np.allclose(np.sqrt(covariance[:, 0, 0]), expected_errors)
+
+
+def test_fully_correlated_ratio_has_no_error() -> None:
+    # A ratio of two readings with identical relative, fully correlated errors
+    sigma = np.array([0.2, 0.1])
+    covariance = covariance_from_errors(sigma, [[1, 1], [1, 1]])
+    values, output_covariance = propagate_covariance("a / b", "a b", [[2.0, 1.0]], covariance)
+    assert values[0, 0] == pytest.approx(2.0)
+    assert output_covariance[0, 0, 0] == pytest.approx(0.0, abs=1e-15)
+
+
+def test_monte_carlo_agrees_with_linear_propagation() -> None:
+    measurements = [[2.0, 3.0], [4.0, 1.0]]
+    errors = [0.01, 0.02]
+    summary = monte_carlo_propagation("x * y", "x y", measurements, errors, num_samples=20000, seed=1)
+    values, total_errors = propagate_errors("x * y", "x y", measurements, errors)
+    assert np.allclose(summary["mean"], values, rtol=1e-3)
+    assert np.allclose(summary["std"], total_errors, rtol=0.05)
+    assert summary["percentiles"].shape == (2, 3)
+
+
+def test_monte_carlo_chunking_is_consistent() -> None:
+    measurements = np.column_stack([np.linspace(1, 2, 7), np.full(7, 10.0)])
+    kwargs = dict(num_samples=4000, seed=3)
+    whole = monte_carlo_propagation("atan(d / (2 * L))", "d L", measurements, [0.1, 0.5], **kwargs)
+    chunked = monte_carlo_propagation(
+        "atan(d / (2 * L))", "d L", measurements, [0.1, 0.5], max_chunk_size=1000, **kwargs
+    )
+    assert np.allclose(whole["mean"], chunked["mean"], rtol=1e-2)
+    assert np.allclose(whole["std"], chunked["std"], rtol=0.1)
+    assert np.allclose(whole["percentiles"], chunked["percentiles"], rtol=2e-2)
+
+
+def test_second_order_is_exact_for_products() -> None:
+    # For f = x*y with independent inputs: no bias, extra variance sx²·sy²
+    summary = second_order_propagation("x * y", "x y", [[2.0, 3.0]], [0.5, 0.4])
+    assert summary["bias"][0] == pytest.approx(0.0)
+    assert summary["second_order_variance"][0] == pytest.approx(0.5**2 * 0.4**2)
+    assert summary["first_order_error"][0] == pytest.approx(np.hypot(3 * 0.5, 2 * 0.4))
+
+
+def test_second_order_bias_of_square() -> None:
+    summary = second_order_propagation("x**2", "x", [[1.0], [2.0]], [[0.1], [0.3]])
+    assert np.allclose(summary["bias"], [0.01, 0.09])
+    assert np.allclose(summary["mean"], [1.01, 4.09])
+    assert np.allclose(summary["second_order_variance"], [2 * 0.1**4, 2 * 0.3**4])
+
+
+def test_cse_kernel_matches_plain_kernel() -> None:
+    formula = "(omega_0**2)/sqrt((omega_0**2-omega**2)**2+4*delta**2*omega**2)"
+    fused = compile_formula(formula, "omega omega_0 delta")
+    plain = compile_formula(formula, "omega omega_0 delta", cse=False)
+    assert "_c0 = " in fused.source
+    assert "_c0 = " not in plain.source
+    measurements = np.random.default_rng(0).uniform(1, 2, size=(50, 3))
+    for fused_out, plain_out in zip(fused.value_and_gradient(measurements), plain.value_and_gradient(measurements)):
+        assert np.allclose(fused_out, plain_out)
+
+
+def test_error_budget_shares() -> None:
+    measurements = [[2.0, 1.0], [1.0, 4.0]]
+    errors = [[0.1, 0.1], [0.1, 0.0]]
+    budget = error_budget("x * y", "x y", measurements, errors)
+    values, total_errors = propagate_errors("x * y", "x y", measurements, errors)
+    assert np.allclose(budget["error"], total_errors)
+    assert np.allclose(budget["shares"].sum(axis=1), 1.0)
+    assert np.allclose(budget["shares"][0], [0.2, 0.8])
+    assert budget["summary"]["x"]["dominant_rows"] == 1
+    assert budget["summary"]["y"]["dominant_rows"] == 1
+    assert budget["summary"]["x"]["variance_share"] == pytest.approx(0.17 / 0.21)
+
+
+def test_propagate_formulas_with_references() -> None:
+    formulas = {
+        "P_max": "U_mp * I_mp",
+        "FF": "P_max / (U_oc * I_sc)",
+    }
+    measurements = [[0.45, 0.030, 0.55, 0.034], [0.46, 0.031, 0.56, 0.035]]
+    errors = [0.005, 0.0005, 0.005, 0.0005]
+    result = propagate_formulas(formulas, "U_mp I_mp U_oc I_sc", measurements, errors)
+    assert result["names"] == ("P_max", "FF")
+
+    direct_values, direct_errors = propagate_errors(
+        "U_mp * I_mp / (U_oc * I_sc)", "U_mp I_mp U_oc I_sc", measurements, errors
+    )
+    ff_values, ff_errors = result["results"]["FF"]
+    assert np.allclose(ff_values, direct_values)
+    assert np.allclose(ff_errors, direct_errors)
+    # P_max and FF share U_mp and I_mp, so they are positively correlated
+    assert np.all(result["covariance"][:, 0, 1] > 0)
+
+
+def test_propagate_formulas_rejects_cycles() -> None:
+    with pytest.raises(ValueError):
+        propagate_formulas({"a": "b + x", "b": "a * x"}, "x", [[1.0]], [0.1])
+
+
+def test_autodiff_backend_matches_sympy() -> None:
+    formula = "(omega_0**2)/sqrt((omega_0**2-omega**2)**2+4*delta**2*omega**2)"
+    measurements = np.random.default_rng(2).uniform(1, 2, size=(20, 3))
+    errors = [0.01, 0.02, 0.03]
+    expected = propagate_errors(formula, "omega omega_0 delta", measurements, errors)
+    from_string = propagate_errors(formula, "omega omega_0 delta", measurements, errors, backend="autodiff")
+
+    def resonance(omega, omega_0, delta):
+        return omega_0**2 / np.sqrt((omega_0**2 - omega**2)**2 + 4 * delta**2 * omega**2)
+
+    from_function = propagate_errors(resonance, "omega omega_0 delta", measurements, errors)
+    for result in (from_string, from_function):
+        assert np.allclose(result[0], expected[0])
+        assert np.allclose(result[1], expected[1])
+
+
+def test_autodiff_constant_function() -> None:
+    values, total_errors = propagate_errors(lambda x, y: 3.0, None, [[1.0, 2.0]], [0.1, 0.1])
+    assert values[0] == 3.0
+    assert total_errors[0] == 0.0
@@ -0,0 +1,315 @@
+import os
+import sys
+
+import matplotlib
+matplotlib.use("Agg")
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+from pylab.fitting import (
+    FitModel,
+    clear_fit_cache,
+    compile_model,
+    default_fit_cache_directory,
+    estimate_peak,
+    fit_batch,
+    fit_cache_info,
+    fit_global,
+    fit_with_x_errors,
+    heuristic_start,
+    multi_start_fit,
+    resample_fit,
+    set_fit_cache,
+)
+from pylab.plotting import generate_fit_data
+from pylab.uarray import UArray
+
+
+def test_x_errors_fit_covariance_matches_scatter() -> None:
+    rng = np.random.default_rng(1)
+    x_true = np.linspace(0, 10, 50)
+    x_errors = np.full(50, 0.2)
+    y_errors = np.full(50, 0.3)
+
+    slopes, slope_errors = [], []
+    for _ in range(300):
+        x = x_true + rng.normal(0, x_errors)
+        y = 2 * x_true + 1 + rng.normal(0, y_errors)
+        result = fit_with_x_errors(x, y, x_errors, y_errors)
+        slopes.append(result["coefficients"][0])
+        slope_errors.append(result["coeff_errors"][0])
+
+    assert np.mean(slopes) == pytest.approx(2, abs=0.01)
+    # Ignoring the x errors would underestimate the slope error by a factor ~1.5
+    assert np.std(slopes) == pytest.approx(np.mean(slope_errors), rel=0.15)
+    assert result["reduced_chi_squared"] == pytest.approx(1, abs=0.5)
+    assert np.allclose(result["effective_errors"], np.hypot(0.3, 2 * 0.2), rtol=1e-2)
+
+
+def test_x_errors_fit_custom_model() -> None:
+    rng = np.random.default_rng(2)
+    x_true = np.linspace(0, 3, 1000)
+    x = x_true + rng.normal(0, 0.01, 1000)
+    y = 5 * np.exp(-1.5 * x_true) + rng.normal(0, 0.02, 1000)
+
+    result = fit_with_x_errors(
+        x, y, 0.01, 0.02, fit_type="custom",
+        custom_fit_func=lambda x, a, b: a * np.exp(-b * x), initial_guess=[1, 1]
+    )
+    assert result["coefficients"] == pytest.approx([5, 1.5], rel=0.02)
+    assert result["reduced_chi_squared"] == pytest.approx(1, abs=0.15)
+    assert result["r_squared"] > 0.99
+
+
+def test_generate_fit_data_uses_x_errors() -> None:
+    rng = np.random.default_rng(3)
+    x_true = np.linspace(1, 5, 40)
+    x = UArray(x_true + rng.normal(0, 0.1, 40), 0.1)
+    y = UArray(3 * x_true + rng.normal(0, 0.05, 40), 0.05)
+
+    coefficients, errors, r_squared = generate_fit_data(x, y, start_idx=5, end_idx=35)
+    expected = fit_with_x_errors(
+        x.value[5:35], y.value[5:35], 0.1, 0.05, absolute_sigma=False
+    )
+
+    assert coefficients == pytest.approx(expected["coefficients"])
+    assert errors == pytest.approx(expected["coeff_errors"])
+    assert r_squared == pytest.approx(expected["r_squared"])
+    with pytest.raises(ValueError):
+        fit_with_x_errors([1, 2, 3], [1, 2, 3], 0.0)
+
+
+def test_fit_model_analytic_jacobian() -> None:
+    model = FitModel("lambda f, A, f0, g: A / np.sqrt((f0**2 - f**2)**2 + (g * f)**2)")
+    assert model.variable == "f" and model.parameters == ("A", "f0", "g")
+
+    f = np.linspace(1, 20, 50)
+    params = np.array([100.0, 10.0, 1.5])
+    jacobian = model.jacobian(f, *params)
+    step = 1e-6 * params
+    numeric = np.stack([
+        (model(f, *(params + dp)) - model(f, *(params - dp))) / (2 * dp.sum())
+        for dp in np.diag(step)
+    ], axis=1)
+    assert jacobian.shape == (50, 3)
+    assert np.allclose(jacobian, numeric, rtol=1e-5)
+
+    same = compile_model("A / sqrt((f0**2 - f**2)**2 + (g * f)**2)", "f A f0 g")
+    assert np.allclose(same(f, *params), model(f, *params))
+    with pytest.raises(ValueError, match="undeclared symbols: A"):
+        FitModel("lambda x, a: A/x")
+
+
+def test_fit_model_translates_numpy_names() -> None:
+    x = np.linspace(0.5, 3, 20)
+    model = FitModel("lambda x, a, b: a * np.arctan(b * x) + np.log10(x)")
+    assert np.allclose(model(x, 2, 3), 2 * np.arctan(3 * x) + np.log10(x))
+    assert np.allclose(model.jacobian(x, 2, 3)[:, 1], 2 * x / (1 + 9 * x**2))
+    model = FitModel("lambda x, a: np.abs(a * x)")
+    assert np.allclose(model.jacobian(x, -2)[:, 0], -x)
+    with pytest.raises(ValueError, match="unknown functions: foo"):
+        FitModel("lambda x, a: a * np.foo(x)")
+
+
+def test_generate_fit_data_with_model_string() -> None:
+    rng = np.random.default_rng(4)
+    x = np.linspace(0.5, 5, 200)
+    y = 3 / x + 0.5 + rng.normal(0, 0.01, 200)
+
+    coefficients, errors, r_squared = generate_fit_data(
+        x, y, fit_type="custom", custom_fit_func="lambda x, a, b: a / x + b"
+    )
+    assert coefficients == pytest.approx([3, 0.5], abs=0.01)
+    assert np.all(errors < 0.01) and r_squared > 0.999
+
+
+def test_fit_batch_polynomial_matches_polyfit() -> None:
+    rng = np.random.default_rng(5)
+    x = np.linspace(100, 200, 600)
+    y = 0.01 * x**2 - 3 * x + rng.normal(0, 1, 600)
+    errors = rng.uniform(0.5, 2, 600)
+    ranges = [(0, 200), (150, 600), (400, 450)]
+
+    result = fit_batch(x, y, errors, ranges=ranges, fit_type="polynomial", degree=2)
+    assert result["coefficients"].shape == (3, 3)
+    for i, (start, end) in enumerate(ranges):
+        coefficients, cov_matrix = np.polyfit(x[start:end], y[start:end], 2, w=1 / errors[start:end], cov=True)
+        assert result["coefficients"][i] == pytest.approx(coefficients, rel=1e-6)
+        assert result["cov_matrix"][i] == pytest.approx(cov_matrix, rel=1e-5)
+        assert result["count"][i] == end - start
+
+    unweighted = fit_batch([x[:100], x[100:]], [y[:100], y[100:]])
+    assert unweighted["coefficients"][1] == pytest.approx(np.polyfit(x[100:], y[100:], 1), rel=1e-8)
+
+
+def test_fit_batch_custom_models() -> None:
+    rng = np.random.default_rng(6)
+    x = np.linspace(0, 5, 300)
+    datasets = [a * np.exp(-x / b) + rng.normal(0, 0.01, 300) for a, b in [(1, 2), (2, 1), (3, 0.5)]]
+
+    pooled = fit_batch([x] * 3, datasets, fit_type="custom", processes=2,
+                       custom_fit_func="lambda x, a, b: a * exp(-x / b)", initial_guess=[1, 1])
+    serial = fit_batch([x] * 3, datasets, fit_type="custom", processes=1,
+                       custom_fit_func=lambda x, a, b: a * np.exp(-x / b), initial_guess=[1, 1])
+    assert pooled["success"].all()
+    assert np.allclose(pooled["coefficients"], [[1, 2], [2, 1], [3, 0.5]], rtol=0.02)
+    assert np.allclose(pooled["coefficients"], serial["coefficients"], rtol=1e-5)
+    assert np.all(pooled["r_squared"] > 0.99)
+
+
+def test_fit_global_shared_parameters() -> None:
+    rng = np.random.default_rng(7)
+    f = np.linspace(5, 15, 200)
+    damping = np.array([0.8, 1.5, 2.5, 3.0])
+
+    def resonance(f, A, f0, g):
+        return A / np.sqrt((f0**2 - f**2)**2 + (g * f)**2)
+
+    y = [resonance(f, 100, 10, g) + rng.normal(0, 0.01, 200) for g in damping]
+    result = fit_global([f] * 4, y, "lambda f, A, f0, g: A / sqrt((f0**2 - f**2)**2 + (g * f)**2)",
+                        y_errors=[0.01] * 4, shared=["A", "f0"], initial_guess=[90, 9.8, 1.0],
+                        absolute_sigma=True)
+
+    assert result["success"]
+    assert result["names"][:3] == ["A", "f0", "g[0]"] and len(result["parameters"]) == 6
+    assert result["shared"]["f0"][0] == pytest.approx(10, abs=5 * result["shared"]["f0"][1])
+    assert result["local"]["g"][0] == pytest.approx(damping, rel=0.01)
+    assert result["reduced_chi_squared"] == pytest.approx(1, abs=0.2)
+
+    # The finite-difference Jacobian of a plain callable gives the same fit
+    numeric = fit_global([f] * 4, y, resonance, y_errors=[0.01] * 4, shared=["A", "f0"],
+                         initial_guess=[90, 9.8, 1.0], absolute_sigma=True)
+    assert numeric["parameters"] == pytest.approx(result["parameters"], rel=1e-5)
+    assert numeric["errors"] == pytest.approx(result["errors"], rel=1e-3)
+    with pytest.raises(ValueError):
+        fit_global([f], y[:1], resonance, shared=["omega"])
+
+
+def test_resample_fit_linear_and_custom() -> None:
+    rng = np.random.default_rng(8)
+    x = np.linspace(0, 10, 12)
+    y = 2 * x + 1 + rng.normal(0, 0.5, 12)
+
+    jackknife = resample_fit(x, y, method="jackknife")
+    assert jackknife["coefficients"] == pytest.approx(np.polyfit(x, y, 1))
+    assert jackknife["samples"].shape == (12, 2)
+    # Leave-one-out refits by hand
+    loo = np.array([np.polyfit(np.delete(x, i), np.delete(y, i), 1) for i in range(12)])
+    assert jackknife["samples"] == pytest.approx(loo)
+    expected = np.sqrt(11 / 12 * np.sum((loo - loo.mean(axis=0))**2, axis=0))
+    assert jackknife["errors"] == pytest.approx(expected)
+
+    bootstrap = resample_fit(x, y, num_resamples=4000, seed=1)
+    plain_errors = np.sqrt(np.diag(np.polyfit(x, y, 1, cov=True)[1]))
+    assert bootstrap["errors"] == pytest.approx(plain_errors, rel=0.3)
+    assert bootstrap["correlation"][0, 1] < -0.5
+    assert np.all(bootstrap["intervals"][:, 0] < bootstrap["coefficients"])
+    assert np.all(bootstrap["intervals"][:, 1] > bootstrap["coefficients"])
+
+    coefficients, errors, _ = generate_fit_data(x, y, error_method="jackknife")
+    assert errors == pytest.approx(expected)
+
+    z = 5 * np.exp(-x / 3) + rng.normal(0, 0.05, 12)
+    custom = resample_fit(x, z, fit_type="custom", custom_fit_func="lambda x, a, b: a * exp(-x / b)",
+                          initial_guess=[1, 1], num_resamples=200, seed=2, processes=1)
+    assert custom["num_failed"] == 0
+    assert custom["coefficients"] == pytest.approx([5, 3], rel=0.05)
+    assert np.all(custom["errors"] < 0.3)
+
+
+def test_estimate_peak_and_multi_start_fit() -> None:
+    rng = np.random.default_rng(9)
+    w = np.linspace(2.5e4, 3.7e4, 120)
+
+    def lorentzian(w, A, w0, g, c):
+        return A / ((w**2 - w0**2)**2 + (g * w)**2) + c
+
+    y = lorentzian(w, 9e14, 3.1e4, 1.5e3, 0.1) + rng.normal(0, 0.005, 120)
+    peak = estimate_peak(w, y)
+    assert peak["position"] == pytest.approx(3.1e4, rel=0.005)
+    assert peak["baseline"] == pytest.approx(0.1, abs=0.02)
+    # Half width of the amplitude resonance is about g
+    assert peak["fwhm"] == pytest.approx(1.5e3, rel=0.15)
+    dip = estimate_peak(w, -y)
+    assert dip["amplitude"] == pytest.approx(-peak["amplitude"])
+
+    bounds = [(1e12, 1e17), (2.5e4, 3.7e4), (1e2, 1e4), (-1, 1)]
+    result = multi_start_fit(w, y, "lambda w, A, w0, g, c: A / ((w**2 - w0**2)**2 + (g * w)**2) + c",
+                             bounds, num_starts=16, seed=0, processes=1)
+    assert result["coefficients"] == pytest.approx([9e14, 3.1e4, 1.5e3, 0.1], rel=0.05)
+    assert result["chi_squared"] == pytest.approx(np.nanmin(result["start_chi_squared"]))
+    # The first start comes from the peak heuristics, matched by parameter name
+    assert result["starts"].shape == (17, 4)
+    assert np.array_equal(result["starts"][0], heuristic_start(w, y, lorentzian, bounds))
+    assert result["starts"][0, 1:] == pytest.approx([peak["position"], peak["fwhm"], peak["baseline"]])
+    assert np.all((result["starts"][:, 0] >= 1e12) & (result["starts"][:, 0] <= 1e17))
+
+    # A poor hand-tuned guess fails on its own but works as part of the search
+    coefficients, _, r_squared = generate_fit_data(w, y, fit_type="custom", custom_fit_func=lorentzian,
+                                                   initial_guess=[1, 1, 1, 0], bounds=bounds, seed=1,
+                                                   cache=False)
+    assert coefficients[1] == pytest.approx(3.1e4, rel=1e-3)
+    assert r_squared > 0.99
+    again = generate_fit_data(w, y, fit_type="custom", custom_fit_func=lorentzian,
+                              initial_guess=[1, 1, 1, 0], bounds=bounds, seed=1, cache=False)[0]
+    assert np.array_equal(again, coefficients)
+
+
+def test_fit_cache_reuses_results(tmp_path) -> None:
+    rng = np.random.default_rng(10)
+    x = np.linspace(0, 4, 50)
+    y = 3.0 * np.exp(-0.7 * x) + rng.normal(0, 0.02, 50)
+    settings = fit_cache_info()
+    assert default_fit_cache_directory().endswith(os.path.join("pylab", "fits"))
+    set_fit_cache(maxsize=2, directory=str(tmp_path), max_files=2)
+    try:
+        clear_fit_cache(disk=True)
+        first = generate_fit_data(x, y, fit_type="custom", custom_fit_func="exponential_decay")
+        again = generate_fit_data(x, y, fit_type="custom", custom_fit_func="exponential_decay",
+                                  style="g--", label="other label")
+        assert fit_cache_info()["hits"] == 1
+        assert np.array_equal(again[0], first[0]) and again[2] == first[2]
+
+        # Changed data, range or closure values are new fits
+        scale = 2.0
+        generate_fit_data(x, y, degree=2)
+        generate_fit_data(x, y, degree=2, end_idx=40)
+        generate_fit_data(x, y, fit_type="custom", custom_fit_func=lambda x, a: a * x**scale)
+        scale = 3.0
+        generate_fit_data(x, y, fit_type="custom", custom_fit_func=lambda x, a: a * x**scale)
+        generate_fit_data(x, y, degree=2, cache="refresh")
+        info = fit_cache_info()
+        assert (info["hits"], info["misses"], info["size"]) == (1, 6, 2)
+        assert len(list(tmp_path.glob("fit_*.json"))) == 2
+
+        # A fresh process finds the most recent results on disk
+        clear_fit_cache()
+        generate_fit_data(x, y, degree=2)
+        assert fit_cache_info()["disk_hits"] == 1
+        generate_fit_data(x, y, degree=2, cache=False)
+        assert fit_cache_info()["hits"] == 0
+
+        # Closures over large arrays are told apart by content, not by their shortened repr
+        offset = np.zeros(5000)
+        shifted = offset.copy()
+        shifted[0] = 5
+        model = lambda offset: lambda x, a: a * x + offset[0]
+        line = 2 * x
+        plain = generate_fit_data(x, line, fit_type="custom", custom_fit_func=model(offset),
+                                  initial_guess=[1])[0]
+        moved = generate_fit_data(x, line, fit_type="custom", custom_fit_func=model(shifted),
+                                  initial_guess=[1])[0]
+        assert plain[0] == pytest.approx(2)
+        assert moved[0] != pytest.approx(2)
+
+        # Models that cannot be hashed by content are never cached
+        class Settings:
+            scale = 2.0
+        options = Settings()
+        generate_fit_data(x, y, fit_type="custom", custom_fit_func=lambda x, a: a * x**options.scale)
+        assert fit_cache_info()["misses"] == 2
+    finally:
+        clear_fit_cache(disk=True)
+        set_fit_cache(maxsize=settings["maxsize"], directory=settings["directory"] or "",
+                      max_files=settings["max_files"])
@@ -0,0 +1,27 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+from pylab.instruments import Multimeter, Stopwatch, instrument_uncertainty
+from pylab.utils import calculate_multimeter_uncertainty
+
+
+def test_multimeter_selects_range_per_value() -> None:
+    meter = Multimeter([(4.0, 0.01, 0.001, 3), (0.4, 0.01, 0.0001, 3)])
+    values = np.array([0.3, -1.132, 4.0, 12.0])
+    assert meter.select_range(values).tolist() == [0, 1, 1, 2]
+    errors = meter.uncertainty(values)
+    assert errors[0] == pytest.approx(0.003 + 0.0003)
+    assert errors[1] == pytest.approx(0.01132 + 0.003)
+    assert np.isnan(errors[3])
+    assert meter.uncertainty([0.3], full_scale=4.0)[0] == pytest.approx(0.003 + 0.003)
+
+
+def test_registry_matches_script_formula() -> None:
+    T = np.array([71.0, 20.5, -3.0])
+    expected = calculate_multimeter_uncertainty(T, 0.012, 0.1, 3)
+    assert np.allclose(instrument_uncertainty("logger_thermometer", T), expected)
+    assert Stopwatch(0.01, 0.2).uncertainty([1.0, 100.0]) == pytest.approx([0.21, 0.21])
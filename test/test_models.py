@@ -0,0 +1,76 @@
+import os
+import pickle
+import sys
+
+import matplotlib
+matplotlib.use("Agg")
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+from pylab.fitting import fit_batch
+from pylab.models import MODELS, get_model
+from pylab.plotting import generate_fit_data
+
+# Data range and true parameters for every built-in model
+CASES = {
+    "linear": (np.linspace(0, 10, 50), [2.0, -1.0]),
+    "proportional": (np.linspace(0, 10, 50), [0.5]),
+    "inverse": (np.linspace(1, 5, 50), [3.0]),
+    "exponential": (np.linspace(0, 2, 50), [2.0, 1.2]),
+    "exponential_decay": (np.linspace(0, 10, 80), [5.0, 2.0, 0.5]),
+    "power_law": (np.linspace(0.5, 4, 50), [1.5, 2.5]),
+    "gaussian": (np.linspace(-5, 5, 100), [3.0, 0.5, 1.2, 0.2]),
+    "lorentzian": (np.linspace(2.5e4, 3.7e4, 100), [900.0, 3.1e4, 1.5e3, 0.5]),
+    "driven_oscillator": (np.linspace(1000, 20000, 100), [10000.0, 500.0]),
+}
+
+
+def test_model_jacobians_match_finite_differences() -> None:
+    assert set(CASES) <= set(MODELS)
+    for name, (x, params) in CASES.items():
+        model = get_model(name)
+        params = np.array(params)
+        jacobian = model.jacobian(x, *params)
+        assert jacobian.shape == (len(x), len(model.parameters))
+        assert len(model.units) == len(model.bounds) == len(model.parameters)
+        for i in range(len(params)):
+            step = np.zeros_like(params)
+            step[i] = 1e-6 * max(abs(params[i]), 1.0)
+            numeric = (model(x, *(params + step)) - model(x, *(params - step))) / (2 * step[i])
+            assert np.allclose(jacobian[:, i], numeric, rtol=1e-5, atol=1e-9), (name, i)
+
+
+def test_models_fit_from_automatic_guesses() -> None:
+    rng = np.random.default_rng(0)
+    for name, (x, params) in CASES.items():
+        model = get_model(name)
+        clean = model(x, *params)
+        y = clean + rng.normal(0, 1e-3 * np.ptp(clean), len(x))
+        coefficients, errors, r_squared = generate_fit_data(x, y, fit_type="custom", custom_fit_func=name)
+        assert np.all(np.abs(coefficients - params) < 5 * errors + 1e-9), name
+        assert r_squared > 0.999, name
+
+
+def test_models_by_name_in_pools_and_search() -> None:
+    model = get_model("driven_oscillator")
+    assert pickle.loads(pickle.dumps(model)) is model
+    with pytest.raises(KeyError, match="available"):
+        get_model("resonance")
+
+    omega = np.linspace(1000, 20000, 100)
+    datasets = [model(omega, 10000, delta) for delta in (300, 500, 900)]
+    result = fit_batch([omega] * 3, datasets, fit_type="custom", custom_fit_func="driven_oscillator", processes=2)
+    assert np.allclose(result["coefficients"][:, 1], [300, 500, 900], rtol=1e-4)
+
+    # Hand-tuned initial guesses are no longer needed, also with a multi-start search
+    box = model.search_bounds(omega, datasets[1])
+    assert box[0] == (omega.min(), omega.max())
+    coefficients, _, _ = generate_fit_data(omega, datasets[1], fit_type="custom",
+                                           custom_fit_func="driven_oscillator", bounds="auto", seed=0)
+    assert coefficients == pytest.approx([10000, 500], rel=1e-4)
+
+    # The damping only enters squared; the bounds keep it positive
+    coefficients, _, _ = generate_fit_data(omega, datasets[1], fit_type="custom", custom_fit_func="driven_oscillator",
+                                           initial_guess=[9000, -400], cache=False)
+    assert coefficients == pytest.approx([10000, 500], rel=1e-4)
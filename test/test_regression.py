@@ -0,0 +1,154 @@
+import os
+import sys
+
+import matplotlib
+matplotlib.use("Agg")
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+from pylab.plotting import generate_fit_data
+from pylab.regression import (
+    LinearRegressionAccumulator,
+    expanding_fit,
+    linear_regression,
+    piecewise_linear_segments,
+    rolling_fit,
+)
+from pylab.statistics import segment_labels
+
+
+def test_linear_regression_matches_polyfit() -> None:
+    rng = np.random.default_rng(0)
+    x = np.linspace(0, 10, 200)
+    errors = rng.uniform(0.1, 0.5, 200)
+    y = 2.5 * x - 1 + rng.normal(0, errors)
+
+    result = linear_regression(x, y, errors)
+    coefficients, cov_matrix = np.polyfit(x, y, 1, w=1 / errors, cov=True)
+    assert [result["slope"], result["intercept"]] == pytest.approx(coefficients, rel=1e-10)
+    assert result["cov_matrix"] == pytest.approx(cov_matrix, rel=1e-8)
+    assert result["chi_squared"] == pytest.approx(np.sum(((y - np.polyval(coefficients, x)) / errors)**2))
+
+    absolute = linear_regression(x, y, errors, absolute_sigma=True)
+    assert absolute["cov_matrix"] == pytest.approx(cov_matrix / result["reduced_chi_squared"], rel=1e-8)
+
+    fit, fit_errors, r_squared = generate_fit_data(x, y)
+    coefficients, cov_matrix = np.polyfit(x, y, 1, cov=True)
+    assert fit == pytest.approx(coefficients, rel=1e-10)
+    assert fit_errors == pytest.approx(np.sqrt(np.diag(cov_matrix)), rel=1e-8)
+    assert r_squared == pytest.approx(linear_regression(x, y)["r_squared"])
+
+
+def test_streaming_and_segmented_regression() -> None:
+    rng = np.random.default_rng(1)
+    # Timestamps with a large offset
+    x = 1.7e9 + np.arange(10000.0)
+    y = 1e-3 * (x - 1.7e9) + 20 + rng.normal(0, 0.1, 10000)
+    expected = linear_regression(x - 1.7e9, y)
+
+    first = LinearRegressionAccumulator()
+    for start in range(0, 6000, 1024):
+        first.update(x[start:min(start + 1024, 6000)], y[start:min(start + 1024, 6000)])
+    second = LinearRegressionAccumulator().update(x[6000:], y[6000:])
+    result = first.merge(second).result()
+    assert result["count"] == 10000
+    assert result["slope"] == pytest.approx(expected["slope"], rel=1e-9)
+    assert result["slope_error"] == pytest.approx(expected["slope_error"], rel=1e-6)
+    assert result["r_squared"] == pytest.approx(expected["r_squared"], rel=1e-9)
+
+    labels = segment_labels(10000, [3000, 7500])
+    segments = linear_regression(x - 1.7e9, y, 0.1, groups=labels)
+    assert segments["slope"].shape == (3,)
+    for label, (start, end) in enumerate([(0, 3000), (3000, 7500), (7500, 10000)]):
+        single = linear_regression(x[start:end] - 1.7e9, y[start:end], 0.1)
+        assert segments["slope"][label] == pytest.approx(single["slope"], rel=1e-10)
+        assert segments["cov_matrix"][label] == pytest.approx(single["cov_matrix"], rel=1e-8)
+
+
+def test_rolling_fit_matches_single_fits() -> None:
+    rng = np.random.default_rng(2)
+    x = 1.7e9 + np.cumsum(rng.uniform(0.5, 1.5, 3000))
+    y = 20 + np.where(x < x[1500], 1e-3 * (x - x[0]), 0) + rng.normal(0, 0.1, 3000)
+    errors = rng.uniform(0.05, 0.2, 3000)
+
+    result = rolling_fit(x, y, 200, errors, step=7)
+    assert len(result["slope"]) == len(range(0, 2801, 7))
+    for i in [0, 3, 150, 214, len(result["start"]) - 1]:
+        start, end = result["start"][i], result["end"][i]
+        single = linear_regression(x[start:end] - x[start], y[start:end], errors[start:end])
+        assert result["slope"][i] == pytest.approx(single["slope"], rel=1e-9, abs=1e-12)
+        assert result["slope_error"][i] == pytest.approx(single["slope_error"], rel=1e-9)
+        assert result["r_squared"][i] == pytest.approx(single["r_squared"], abs=1e-9)
+
+    quadratic = rolling_fit(x - x[0], y, 200, degree=2)
+    for i in [0, 1000, 2800]:
+        coefficients, cov_matrix = np.polyfit(x[i:i + 200] - x[0], y[i:i + 200], 2, cov=True)
+        assert quadratic["coefficients"][i] == pytest.approx(coefficients, rel=1e-6)
+        assert quadratic["coeff_errors"][i] == pytest.approx(np.sqrt(np.diag(cov_matrix)), rel=1e-6)
+    with pytest.raises(ValueError):
+        rolling_fit(x, y, 2, degree=2)
+
+
+def test_expanding_fit_finds_end_of_linear_range() -> None:
+    rng = np.random.default_rng(3)
+    x = np.arange(1000.0)
+    y = np.where(x < 600, 0.5 * x, 300) + rng.normal(0, 0.5, 1000)
+
+    result = expanding_fit(x, y, 0.5, start_idx=100, absolute_sigma=True)
+    assert result["start"][0] == 100 and result["end"][-1] == 1000
+    single = linear_regression(x[100:400], y[100:400], 0.5, absolute_sigma=True)
+    index = np.flatnonzero(result["end"] == 400)[0]
+    assert result["slope"][index] == pytest.approx(single["slope"], rel=1e-10)
+    assert result["chi_squared"][index] == pytest.approx(single["chi_squared"], rel=1e-8)
+    # The reduced chi-squared stays near 1 until the kink at x = 600
+    end = result["end"][np.argmax(result["reduced_chi_squared"] > 2)]
+    assert 600 < end < 620
+
+
+def test_piecewise_linear_segments() -> None:
+    rng = np.random.default_rng(4)
+    # Heating curve: drift, fast rise, drift again (like the calorimetry runs)
+    x = np.arange(1500.0)
+    y = np.piecewise(x, [x < 300, (x >= 300) & (x < 420), x >= 420],
+                     [lambda t: 20 + 0.002 * t, lambda t: 20.6 + 0.1 * (t - 300), lambda t: 32.6 - 0.003 * (t - 420)])
+    y += rng.normal(0, 0.05, 1500)
+
+    for resolution in (1, None, 10):
+        result = piecewise_linear_segments(x, y, resolution=resolution)
+        assert len(result["breakpoints"]) == 2
+        assert np.allclose(result["breakpoints"], [300, 420], atol=3)
+    assert result["fits"]["slope"] == pytest.approx([0.002, 0.1, -0.003], abs=5e-4)
+    assert result["sigma"] == pytest.approx(0.05, rel=0.1)
+
+    start, end = result["segments"][1]
+    coefficients, _, r_squared = generate_fit_data(x, y, start_idx=start, end_idx=end)
+    assert coefficients[0] == pytest.approx(result["fits"]["slope"][1])
+    assert r_squared > 0.99
+
+    straight = piecewise_linear_segments(x[:300], y[:300], 0.05)
+    assert straight["segments"] == [(0, 300)]
+
+
+def test_piecewise_linear_segments_matches_exact_search() -> None:
+    rng = np.random.default_rng(5)
+    x = np.arange(6000.0)
+    breaks = [1821, 1933, 2894, 4103]
+    slopes = [0.01, -0.05, 0.002, 0.03, -0.01]
+    y = np.zeros(6000)
+    for start, end, slope in zip([0] + breaks, breaks + [6000], slopes):
+        level = y[start - 1] + 2 if start else 0
+        y[start:end] = level + slope * (x[start:end] - start)
+    errors = np.full(6000, 0.3)
+    y += rng.normal(0, 0.3, 6000)
+
+    def penalised_cost(result):
+        return np.sum(result["fits"]["chi_squared"]) + result["penalty"] * len(result["segments"])
+
+    exact = piecewise_linear_segments(x, y, errors, resolution=1)
+    assert np.allclose(exact["breakpoints"], breaks, atol=3)
+    # The coarse grid search may not leave extra breakpoints next to the real ones
+    for resolution in (None, 25):
+        result = piecewise_linear_segments(x, y, errors, resolution=resolution)
+        assert result["breakpoints"] == exact["breakpoints"]
+        assert penalised_cost(result) == pytest.approx(penalised_cost(exact))
@@ -0,0 +1,119 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+from pylab.calculation import calculate_weighted_mean
+from pylab.statistics import (
+    WeightedMeanAccumulator,
+    grouped_weighted_statistics,
+    huber_mean,
+    median_bootstrap,
+    segment_labels,
+    sigma_clipped_mean,
+)
+
+
+def test_accumulator_matches_weighted_mean() -> None:
+    rng = np.random.default_rng(0)
+    values = 1e6 + rng.normal(0, 1, 1000)
+    errors = rng.uniform(0.5, 2, 1000)
+    expected_mean, expected_error = calculate_weighted_mean(values, errors)
+
+    # Two workers with several chunks each
+    first = WeightedMeanAccumulator()
+    for chunk in range(0, 500, 128):
+        first.update(values[chunk:min(chunk + 128, 500)], errors[chunk:min(chunk + 128, 500)])
+    second = WeightedMeanAccumulator().update(values[500:], errors[500:])
+    result = first.merge(second).result()
+
+    assert result["count"] == 1000
+    assert result["mean"] == pytest.approx(expected_mean, rel=1e-12)
+    assert result["error"] == pytest.approx(expected_error)
+    expected_chi_squared = np.sum((values - expected_mean)**2 / errors**2)
+    assert result["chi_squared"] == pytest.approx(expected_chi_squared, rel=1e-6)
+    assert result["birge_ratio"] == pytest.approx(np.sqrt(expected_chi_squared / 999), rel=1e-6)
+
+
+def test_accumulator_counts_outliers() -> None:
+    accumulator = WeightedMeanAccumulator(outlier_threshold=3)
+    accumulator.update(np.tile([10.0, 10.1, 9.9, 10.0], (5, 1)), np.full((5, 4), 0.1))
+    accumulator.update([14.0], 0.1)
+    assert accumulator.count == 21
+    assert accumulator.outliers == 1
+    assert WeightedMeanAccumulator(outlier_threshold=None).update([1.0, 9.0], 0.1).outliers is None
+
+    # The exact count does not depend on how the data is split into chunks or workers
+    values = np.array([10, 10.1, 9.9, 10.05, 30])
+    counts = set()
+    for size in (1, 2, 5):
+        accumulator = WeightedMeanAccumulator(exact_outliers=True)
+        for start in range(0, 5, size):
+            accumulator.update(values[start:start + size], 0.1)
+        counts.add(accumulator.outliers)
+    counts.add(WeightedMeanAccumulator(exact_outliers=True).update(values[:3], 0.1)
+               .merge(WeightedMeanAccumulator(exact_outliers=True).update(values[3:], 0.1)).outliers)
+    assert counts == {np.sum(np.abs(values - np.mean(values)) > 0.3)}
+    with pytest.raises(ValueError, match="exact_outliers"):
+        WeightedMeanAccumulator(exact_outliers=True).merge(WeightedMeanAccumulator())
+
+    # By default nothing per value is kept
+    accumulator = WeightedMeanAccumulator()
+    for start in range(0, 5, 2):
+        accumulator.update(values[start:start + 2], 0.1)
+    assert accumulator.outliers == 1 and accumulator._lower_limits == []
+
+
+def test_grouped_statistics_match_per_group_calls() -> None:
+    rng = np.random.default_rng(1)
+    values = rng.normal(5, 1, 18)
+    errors = rng.uniform(0.5, 1.5, 18)
+    labels = segment_labels(18, [9])
+    assert labels.tolist() == [0] * 9 + [1] * 9
+
+    result = grouped_weighted_statistics(values, errors, labels)
+    for group, part in enumerate((slice(None, 9), slice(9, None))):
+        mean, error = calculate_weighted_mean(values[part], errors[part])
+        assert result["weighted_mean"][group] == pytest.approx(mean)
+        assert result["weighted_error"][group] == pytest.approx(error)
+        assert result["std"][group] == pytest.approx(np.std(values[part], ddof=1))
+        assert result["standard_error"][group] == pytest.approx(np.std(values[part], ddof=1) / 3)
+
+
+def test_grouped_statistics_with_string_labels() -> None:
+    result = grouped_weighted_statistics([1.0, 2.0, 3.0], [1.0, 1.0, 1.0], ["Nr3", "Nr2", "Nr3"])
+    assert result["groups"].tolist() == ["Nr2", "Nr3"]
+    assert result["count"].tolist() == [1, 2]
+    assert result["weighted_mean"].tolist() == [2.0, 2.0]
+
+
+def test_robust_estimators_reject_bad_point() -> None:
+    values = np.array([10.0, 10.1, 9.9, 10.05, 9.95, 14.0])
+    errors = np.full(6, 0.1)
+
+    clipped = sigma_clipped_mean(values, errors)
+    assert clipped["rejected"].tolist() == [False] * 5 + [True]
+    assert clipped["mean"] == pytest.approx(10.0)
+    assert clipped["count"] == 5
+    assert sigma_clipped_mean(values, errors, max_iterations=1)["iterations"] == 1
+    with pytest.raises(ValueError, match="max_iterations"):
+        sigma_clipped_mean(values, errors, max_iterations=0)
+
+    huber = huber_mean(values, errors)
+    assert huber["rejected"][-1]
+    assert abs(huber["mean"] - 10.0) < 0.05
+
+    bootstrap = median_bootstrap(values, seed=0)
+    assert bootstrap["median"] == pytest.approx(10.025)
+    assert bootstrap["interval"][0] <= bootstrap["median"] <= bootstrap["interval"][1]
+
+
+def test_sigma_clipping_grouped_mode() -> None:
+    values = np.array([10.0, 10.1, 9.9, 14.0, 20.0, 20.1, 19.9, 20.0])
+    groups = ["a"] * 4 + ["b"] * 4
+    result = sigma_clipped_mean(values, 0.1, groups=groups, scale="scatter")
+    assert result["groups"].tolist() == ["a", "b"]
+    assert result["mean"] == pytest.approx([10.0, 20.0])
+    assert result["rejected"].tolist() == [False, False, False, True] + [False] * 4
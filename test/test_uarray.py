@@ -0,0 +1,89 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+from pylab.calculation import calculate_weighted_mean, propagate_errors
+from pylab.uarray import UArray, apply_formula
+
+
+def test_arithmetic_matches_formula_propagation() -> None:
+    U_C = UArray([1.132, 1.194, 1.265], [0.014, 0.015, 0.016])
+    U_0 = UArray([0.975, 0.948, 0.906], [0.013, 0.012, 0.012])
+    ratio = U_C / U_0
+    values, errors = propagate_errors(
+        "U_C / U_0", "U_C U_0", np.column_stack([U_C.value, U_0.value]),
+        np.column_stack([U_C.sigma, U_0.sigma]),
+    )
+    assert np.allclose(ratio.value, values)
+    assert np.allclose(ratio.sigma, errors)
+
+
+def test_ufuncs_and_exact_operands() -> None:
+    x = UArray([1.0, 4.0], [0.1, 0.2])
+    root = np.sqrt(x)
+    assert np.allclose(root.sigma, [0.05, 0.05])
+    scaled = 2 * x + np.array([1.0, 1.0])
+    assert np.allclose(scaled.value, [3.0, 9.0])
+    assert np.allclose(scaled.sigma, [0.2, 0.4])
+
+
+def test_tracking_handles_correlations() -> None:
+    x = UArray([1.0, 2.0], [0.1, 0.2], track=True)
+    assert np.allclose((x - x).sigma, 0.0)
+    assert np.allclose((x * x).sigma, [0.2, 0.8])
+
+    # A shared scalar makes all elements of the result fully correlated
+    omega = UArray(10.0, 0.5, track=True)
+    y = omega * UArray([1.0, 1.0], [0.0, 0.0])
+    assert y.sum().sigma == pytest.approx(1.0)
+    assert np.allclose(y.correlation(y), 1.0)
+
+    # Different elements of one source are independent
+    z = UArray([1.0, 2.0, 3.0], 0.1, track=True)
+    assert np.allclose((z[1:] - z[:-1]).sigma, np.sqrt(2) * 0.1)
+
+    # Selections keep their dependence on the same elements, however they are written
+    assert (z[:2].sum() - z[0] - z[1]).sigma == pytest.approx(0.0)
+    assert np.allclose(z[0:2].correlation(z[[0, 1]]), 1.0)
+    assert np.allclose(z[z.value > 1.5].covariance(z[1:]), 0.01)
+
+
+def test_sums_follow_numpy_reductions() -> None:
+    m = UArray(np.ones((3, 4)), 0.1, track=True)
+    assert np.sum(m).sigma == pytest.approx(0.1 * np.sqrt(12))
+    assert np.allclose(np.sum(m, axis=0).sigma, 0.1 * np.sqrt(3))
+    assert m.sum(axis=1, keepdims=True).shape == (3, 1)
+    assert np.mean(m, axis=(0, 1)).sigma == pytest.approx(0.1 / np.sqrt(12))
+    assert (m.sum(axis=0).sum() - m.sum()).sigma == pytest.approx(0.0)
+
+    untracked = UArray([[1.0, 2.0], [3.0, 4.0]], 0.1)
+    assert np.allclose(np.sum(untracked, axis=1).value, [3.0, 7.0])
+    assert np.allclose(np.sum(untracked, axis=1).sigma, 0.1 * np.sqrt(2))
+
+
+def test_numpy_joins_keep_errors_apart() -> None:
+    u = UArray([1.0, 2.0], [0.1, 0.2])
+    joined = np.concatenate([u, [3.0]])
+    assert np.allclose(joined.value, [1, 2, 3]) and np.allclose(joined.sigma, [0.1, 0.2, 0])
+    assert np.stack([u, u]).shape == (2, 2)
+    with pytest.raises(TypeError, match=".value and .sigma"):
+        np.asarray(u)
+
+    x = UArray([1.0, 2.0], [0.1, 0.2], track=True)
+    both = np.concatenate([x, x[::-1]])
+    assert (both[0] - both[3]).sigma == pytest.approx(0.0)
+    assert np.vstack([x, 2 * x]).sum(axis=0).sigma == pytest.approx(3 * x.sigma)
+
+
+def test_apply_formula_and_weighted_mean() -> None:
+    x = UArray([2.0, 3.0], [0.1, 0.1], track=True)
+    result = apply_formula("x * y", "x y", x, 2.0)
+    assert np.allclose(result.value, [4.0, 6.0])
+    assert np.allclose((result - 2 * x).sigma, 0.0)
+
+    mean, error = calculate_weighted_mean(UArray([1.0, 3.0], [1.0, 1.0]))
+    assert mean == pytest.approx(2.0)
+    assert error == pytest.approx(1 / np.sqrt(2))